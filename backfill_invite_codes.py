@@ -0,0 +1,33 @@
+import os
+import firebase_admin
+from firebase_admin import credentials
+
+SERVICE_ACCOUNT_KEY_FILE = "serviceAccountKey.json"
+
+def backfill():
+    # 1. Firestore 연결 (main.py는 이미 초기화된 앱이 있으면 그대로 사용함)
+    try:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(SERVICE_ACCOUNT_KEY_FILE)
+            firebase_admin.initialize_app(cred)
+        os.environ.setdefault('WARMUP_ON_START', '0') # 일회성 스크립트이므로 채점 워커/시나리오 워밍업은 하지 않음
+        import main
+        print("✅ Firestore 데이터베이스에 성공적으로 연결되었습니다.")
+    except Exception as e:
+        print(f"❌ Firestore 연결 실패: {e}")
+        return
+
+    # 2. 색인이 없는 기존 수업의 초대 코드를 invite_codes에 채움
+    print("\n수업 초대 코드 색인을 보충합니다...")
+    try:
+        result = main.backfill_invite_codes()
+    except Exception as e:
+        print(f"❌ 색인 보충 실패: {e}")
+        return
+    print(f"  -> 수업 {result['classes']}개 확인, 색인 {result['created']}개 생성")
+    for conflict in result['conflicts']:
+        print(f"  ⚠️ 초대 코드 '{conflict['inviteCode']}'가 겹칩니다: '{conflict['classId']}' (색인된 수업: '{conflict['indexedClassId']}')")
+    print("\n🎉 완료되었습니다. 이제 수업 참여는 색인 문서 하나만 읽습니다.")
+
+if __name__ == "__main__":
+    backfill()
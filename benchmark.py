@@ -0,0 +1,367 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from urllib import request as urlrequest, error as urlerror
+
+SCENARIO_JSON_FILE = "scenario.json"
+RESULTS_DIR = "bench_results" # 결과 JSON 저장 위치 (버전 간 비교용)
+PASSWORD = "bench-password"
+
+# --- 요청 클라이언트 ---
+class InProcessClient:
+    """Flask 앱을 같은 프로세스에서 직접 호출 (로컬 저장소 사용, 네트워크 없음)"""
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self._client.open(path, method=method, json=body)
+        try:
+            data = response.get_json(silent=True)
+        finally:
+            response.close()
+        return response.status_code, data
+
+class HttpClient:
+    """이미 실행 중인 서버(--url)를 HTTP로 호출"""
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None):
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urlrequest.Request(self.base_url + path, data=payload, method=method,
+                                 headers={'Content-Type': 'application/json'} if payload else {})
+        try:
+            with urlrequest.urlopen(req, timeout=60) as response:
+                status, raw = response.status, response.read()
+        except urlerror.HTTPError as e:
+            status, raw = e.code, e.read()
+        try:
+            return status, json.loads(raw.decode('utf-8')) if raw else None
+        except ValueError:
+            return status, None
+
+# --- 측정 ---
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+class Recorder:
+    def __init__(self):
+        self._samples = {} # 엔드포인트 -> [ms, ...]
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, elapsed_ms, ok):
+        with self._lock:
+            self._samples.setdefault(name, []).append(elapsed_ms)
+            if not ok:
+                self._errors[name] = self._errors.get(name, 0) + 1
+
+    def summary(self, wall_sec):
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            errors = dict(self._errors)
+        endpoints = {}
+        for name, values in sorted(samples.items()):
+            endpoints[name] = {
+                'count': len(values), 'errors': errors.get(name, 0),
+                'rps': round(len(values) / wall_sec, 2) if wall_sec else 0,
+                'mean': round(sum(values) / len(values), 2), 'p50': round(percentile(values, 50), 2),
+                'p95': round(percentile(values, 95), 2), 'p99': round(percentile(values, 99), 2),
+                'max': round(values[-1], 2)
+            }
+        total = sum(endpoint['count'] for endpoint in endpoints.values())
+        return {
+            'wallSec': round(wall_sec, 2), 'totalRequests': total,
+            'totalErrors': sum(endpoint['errors'] for endpoint in endpoints.values()),
+            'throughputRps': round(total / wall_sec, 2) if wall_sec else 0, 'endpoints': endpoints
+        }
+
+def timed(ctx, client, name, method, path, body=None, ok_statuses=()):
+    started = time.perf_counter()
+    try:
+        status, data = client.request(method, path, body)
+    except Exception as e:
+        print(f"  ⚠️ {name} 요청 실패: {e}")
+        status, data = 599, None
+    ctx['recorder'].record(name, (time.perf_counter() - started) * 1000, status < 400 or status in ok_statuses)
+    return status, data
+
+# --- 세션 흉내 ---
+def student_session(ctx, email, stop_at, rng):
+    args = ctx['args']
+    client = ctx['make_client']()
+    timed(ctx, client, 'POST /api/login', 'POST', '/api/login', {'email': email, 'password': PASSWORD})
+
+    live = {'version': None, 'code': ''}
+    def send_live_code(code):
+        # 브라우저의 sendLiveCode와 같이 기준 버전이 있으면 패치, 없거나 충돌이면 전체 코드
+        if live['version'] is not None and code.startswith(live['code']):
+            status, data = timed(ctx, client, 'POST /api/livecode/update', 'POST', '/api/livecode/update', {
+                'email': email, 'baseVersion': live['version'],
+                'patch': {'from': len(live['code']), 'to': len(live['code']), 'text': code[len(live['code']):]}
+            }, ok_statuses=(409,))
+        else:
+            status = 409
+        if status == 409:
+            status, data = timed(ctx, client, 'POST /api/livecode/update', 'POST', '/api/livecode/update',
+                                 {'email': email, 'liveCode': code})
+        if status < 400 and data:
+            live.update({'version': data.get('version'), 'code': code})
+
+    while time.time() < stop_at:
+        week = rng.choice(ctx['weeks'])
+        timed(ctx, client, 'GET /api/scenario/week/<n>', 'GET', f'/api/scenario/week/{week}?userEmail={email}')
+        for cycle_index, cycle in enumerate(ctx['scenarios'][week].get('cycles', [])):
+            if time.time() >= stop_at:
+                return
+            code = cycle.get('starterCode', '') or ''
+            for tick in range(args.edits_per_cycle):
+                code += rng.choice(['x', ' ', '1', '\n', '(', ')'])
+                send_live_code(code)
+                if tick % 5 == 0:
+                    timed(ctx, client, 'POST /api/presence/heartbeat', 'POST', '/api/presence/heartbeat',
+                          {'email': email, 'classId': ctx['class_id']})
+                time.sleep(args.tick)
+                if time.time() >= stop_at:
+                    return
+
+            # 시나리오의 실제 starterCode로 제출 (정답 여부와 무관하게 채점 경로 전체를 거침)
+            submit_body = {'email': email, 'week': week, 'cycleIndex': cycle_index, 'studentCode': cycle.get('starterCode', '')}
+            if args.submit_mode == 'async':
+                submit_body['mode'] = 'async'
+            status, data = timed(ctx, client, 'POST /api/code/submit', 'POST', '/api/code/submit', submit_body)
+            is_success = bool(data and data.get('result', {}).get('success'))
+            job_id = data.get('jobId') if data else None
+            while job_id:
+                status, job = timed(ctx, client, 'GET /api/code/job/<id>', 'GET', f'/api/code/job/{job_id}?wait=5')
+                if status >= 400 or not job or job.get('jobStatus') in ('done', 'error'):
+                    is_success = bool(job and job.get('result', {}).get('success'))
+                    break
+            timed(ctx, client, 'POST /api/log/submission', 'POST', '/api/log/submission', {
+                'email': email, 'classId': ctx['class_id'], 'week': week, 'cycle': cycle_index,
+                'isSuccess': is_success, 'error': '' if is_success else 'benchmark'
+            })
+            timed(ctx, client, 'POST /api/progress/update', 'POST', '/api/progress/update',
+                  {'email': email, 'progress': {'week': week, 'cycle': cycle_index}})
+            if rng.random() < args.question_rate:
+                timed(ctx, client, 'POST /api/question/ask', 'POST', '/api/question/ask', {
+                    'email': email, 'classId': ctx['class_id'], 'question': f'{week}주차 {cycle_index + 1}사이클 질문입니다.',
+                    'progress': {'week': week, 'cycle': cycle_index}, 'characterContext': 'benchmark'
+                })
+
+def instructor_session(ctx, stop_at):
+    args = ctx['args']
+    client = ctx['make_client']()
+    class_id = ctx['class_id']
+    since = None
+    while time.time() < stop_at:
+        # monitor 화면 (롱폴링 피드), 수업 상세, report 화면 (분석), 접속 상태
+        path = f'/api/monitor/class/{class_id}/events?wait=2' + (f'&since={since}' if since is not None else '')
+        status, data = timed(ctx, client, 'GET /api/monitor/class/<id>/events', 'GET', path)
+        if status < 400 and data:
+            since = data['snapshot']['seq'] if 'snapshot' in data else data.get('seq', since)
+        timed(ctx, client, 'GET /api/class/<id>', 'GET', f'/api/class/{class_id}')
+        timed(ctx, client, 'GET /api/analytics/class/<id>', 'GET', f'/api/analytics/class/{class_id}')
+        timed(ctx, client, 'GET /api/presence/class/<id>', 'GET', f'/api/presence/class/{class_id}')
+        time.sleep(args.instructor_interval)
+
+# --- 준비 / 결과 ---
+def setup_class(ctx, student_count):
+    client = ctx['make_client']()
+    instructor = 'instructor@bench.local'
+    client.request('POST', '/api/signup', {'email': instructor, 'password': PASSWORD, 'name': '교수자', 'role': 'instructor'})
+    status, data = client.request('POST', '/api/classes/create', {
+        'classDetails': {'subject': '벤치마크', 'year': '2025', 'semester': '1', 'department': 'BENCH', 'section': '01'},
+        'instructorEmail': instructor
+    })
+    if status >= 400:
+        raise RuntimeError(f"수업 생성 실패: {data}")
+    class_info = data['class']
+    emails = []
+    for i in range(student_count):
+        email = f'student{i:03d}@bench.local'
+        client.request('POST', '/api/signup', {'email': email, 'password': PASSWORD, 'name': f'학생{i:03d}', 'role': 'student'})
+        client.request('POST', '/api/classes/join', {'inviteCode': class_info['inviteCode'], 'studentEmail': email})
+        emails.append(email)
+    return class_info['classId'], emails
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def print_summary(result):
+    print(f"\n📊 총 {result['totalRequests']}건, 오류 {result['totalErrors']}건, {result['wallSec']}초, 처리량 {result['throughputRps']} req/s")
+    print(f"{'엔드포인트':<42}{'건수':>7}{'오류':>6}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for name, stats in result['endpoints'].items():
+        print(f"{name:<42}{stats['count']:>7}{stats['errors']:>6}{stats['rps']:>8}{stats['p50']:>9}{stats['p95']:>9}{stats['p99']:>9}{stats['max']:>9}")
+
+def compare_results(result, baseline_path, threshold_pct):
+    """이전 결과와 p95를 비교한다. Returns: 회귀로 판단된 엔드포인트 목록"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\n🔍 기준 결과와 비교: {baseline_path} ({baseline.get('label')}, {baseline.get('revision')})")
+    regressions = []
+    for name, stats in result['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before or not before.get('p95'):
+            print(f"  + {name}: 기준 없음")
+            continue
+        change = (stats['p95'] - before['p95']) / before['p95'] * 100
+        marker = '❌' if change > threshold_pct else '✅'
+        print(f"  {marker} {name}: p95 {before['p95']}ms -> {stats['p95']}ms ({change:+.1f}%)")
+        if change > threshold_pct:
+            regressions.append(name)
+    return regressions
+
+def run_benchmark(args):
+    if args.cold_start:
+        return run_cold_start(args)
+
+    # 1. 대상 준비 (기본: 같은 프로세스의 앱 + 메모리 저장소 + scenario.json)
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+        print(f"✅ 실행 중인 서버를 대상으로 합니다: {args.url}")
+    else:
+        os.environ.setdefault('STORAGE_BACKEND', 'memory')
+        os.environ.setdefault('SCENARIO_SOURCE', 'file')
+        import main
+        make_client = lambda: InProcessClient(main.app)
+        print(f"✅ 앱을 같은 프로세스에서 실행합니다 (저장소: {main.STORAGE_BACKEND}, 시나리오: {main.SCENARIO_SOURCE})")
+
+    try:
+        with open(SCENARIO_JSON_FILE, 'r', encoding='utf-8') as f:
+            scenarios = {int(week['week']): week for week in json.load(f) if isinstance(week, dict) and 'week' in week}
+    except Exception as e:
+        print(f"❌ '{SCENARIO_JSON_FILE}' 파일 읽기 실패: {e}")
+        return 1
+    weeks = sorted(scenarios)[:args.weeks]
+
+    ctx = {'args': args, 'make_client': make_client, 'recorder': Recorder(), 'scenarios': scenarios, 'weeks': weeks}
+    ctx['class_id'], emails = setup_class(ctx, args.students)
+    print(f"✅ 학생 {len(emails)}명, 교수자 {args.instructors}명으로 {args.duration}초 동안 수업을 흉내 냅니다 (주차: {weeks})")
+
+    # 2. 세션 실행 (학생마다 시작 시점을 조금씩 흩뜨림)
+    started = time.time()
+    stop_at = started + args.duration
+    threads = []
+    for i, email in enumerate(emails):
+        rng = random.Random(args.seed + i)
+        threads.append(threading.Thread(target=lambda e=email, r=rng: (time.sleep(r.uniform(0, args.ramp_up)), student_session(ctx, e, stop_at, r)),
+                                        name=f'student-{i}', daemon=True))
+    for i in range(args.instructors):
+        threads.append(threading.Thread(target=instructor_session, args=(ctx, stop_at), name=f'instructor-{i}', daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_sec = time.time() - started
+
+    # 3. 결과 출력 및 저장
+    result = ctx['recorder'].summary(wall_sec)
+    return finish_run(result, args, args.url or 'in-process')
+
+def finish_run(result, args, target):
+    result.update({
+        'label': args.label, 'revision': git_revision(), 'startedAt': datetime.datetime.now().isoformat(timespec='seconds'),
+        'target': target,
+        'config': {key: value for key, value in vars(args).items() if key not in ('compare', 'output')}
+    })
+    print_summary(result)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{args.label}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 결과 저장: {output}")
+
+    status = 0
+    if args.compare:
+        regressions = compare_results(result, args.compare, args.regression_threshold)
+        if regressions and args.fail_on_regression:
+            print(f"❌ p95가 {args.regression_threshold}% 넘게 느려진 엔드포인트: {', '.join(regressions)}")
+            status = 1
+    budget = args.import_budget_ms
+    import_stats = result['endpoints'].get('cold-start: import main')
+    if budget and import_stats and import_stats['p50'] > budget:
+        print(f"❌ main 모듈 로드 시간(p50 {import_stats['p50']}ms)이 예산 {budget}ms를 넘었습니다.")
+        status = 1
+    return status
+
+# --- 콜드 스타트 측정 ---
+# 새 인터프리터에서 main을 import하고 워밍업 후 첫 요청까지의 시간을 잰다 (스케일 아웃 직후 인스턴스와 같은 상황).
+COLD_START_SNIPPET = r"""
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+client = main.app.test_client()
+warmup_status = client.get('/api/warmup').status_code
+warmed = time.perf_counter()
+first_status = client.get('/api/scenario/week/%d/manifest').status_code
+first = time.perf_counter()
+print(json.dumps({'import': (imported - started) * 1000, 'warmup': (warmed - imported) * 1000, 'first': (first - warmed) * 1000,
+                  'ok': warmup_status == 200 and first_status == 200, 'startup': main.startup_report()}))
+"""
+
+def run_cold_start(args):
+    if args.url:
+        print("❌ --cold-start는 같은 프로세스 실행에서만 측정할 수 있습니다 (--url과 함께 쓸 수 없음).")
+        return 1
+    env = dict(os.environ)
+    env.setdefault('STORAGE_BACKEND', 'memory')
+    env.setdefault('SCENARIO_SOURCE', 'file')
+    env['WARMUP_ON_START'] = '0' # 워밍업을 /api/warmup 호출 안에서 실행해 단계별로 잰다
+    recorder = Recorder()
+    print(f"✅ 새 프로세스에서 main을 {args.cold_start}회 불러와 콜드 스타트를 측정합니다 (저장소: {env['STORAGE_BACKEND']})")
+    started = time.time()
+    for i in range(args.cold_start):
+        completed = subprocess.run([sys.executable, '-c', COLD_START_SNIPPET % 1], env=env, capture_output=True, text=True, timeout=120)
+        try:
+            run = json.loads(completed.stdout.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            print(f"  ❌ {i + 1}회차 실패: {completed.stderr.strip()[-500:]}")
+            recorder.record('cold-start: import main', 0, False)
+            continue
+        recorder.record('cold-start: import main', run['import'], True)
+        recorder.record('cold-start: /api/warmup', run['warmup'], run['ok'])
+        recorder.record('cold-start: first request', run['first'], run['ok'])
+        for phase, ms in run['startup']['phases'].items():
+            recorder.record(f'cold-start phase: {phase}', ms, True)
+        for step, ms in run['startup']['warmup']['steps'].items():
+            recorder.record(f'cold-start warmup: {step}', ms, True)
+        print(f"  -> {i + 1}회차: import {run['import']:.0f}ms, 워밍업 {run['warmup']:.0f}ms, 첫 요청 {run['first']:.1f}ms")
+    return finish_run(recorder.summary(time.time() - started), args, 'cold-start')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="학생/교수자 세션을 흉내 내어 엔드포인트별 처리량과 p50/p95/p99 응답 시간을 측정합니다.")
+    parser.add_argument('--students', type=int, default=30, help="동시 학생 수")
+    parser.add_argument('--instructors', type=int, default=1, help="모니터/리포트를 보는 교수자 수")
+    parser.add_argument('--duration', type=float, default=60, help="측정 시간 (초)")
+    parser.add_argument('--ramp-up', type=float, default=5, help="학생 세션 시작을 흩뜨리는 구간 (초)")
+    parser.add_argument('--tick', type=float, default=1.0, help="실시간 코드 전송 간격 (초, 브라우저는 1초)")
+    parser.add_argument('--edits-per-cycle', type=int, default=10, help="사이클마다 제출 전까지의 코드 편집 횟수")
+    parser.add_argument('--weeks', type=int, default=3, help="scenario.json 앞에서부터 사용할 주차 수")
+    parser.add_argument('--question-rate', type=float, default=0.1, help="사이클마다 질문을 남길 확률")
+    parser.add_argument('--submit-mode', choices=['sync', 'async'], default='async', help="코드 제출 방식")
+    parser.add_argument('--instructor-interval', type=float, default=2.0, help="교수자 화면 갱신 간격 (초)")
+    parser.add_argument('--url', help="실행 중인 서버 주소 (생략하면 같은 프로세스에서 메모리 저장소로 실행)")
+    parser.add_argument('--seed', type=int, default=42, help="무작위 동작 시드")
+    parser.add_argument('--label', default='local', help="결과 파일 이름과 비교 출력에 쓸 이름")
+    parser.add_argument('--output', help="결과 JSON 경로 (기본: bench_results/<시각>-<label>.json)")
+    parser.add_argument('--compare', help="비교할 이전 결과 JSON")
+    parser.add_argument('--regression-threshold', type=float, default=20.0, help="회귀로 볼 p95 증가율 (%%)")
+    parser.add_argument('--fail-on-regression', action='store_true', help="회귀가 있으면 종료 코드 1")
+    parser.add_argument('--cold-start', type=int, default=0, help="부하 대신 새 프로세스 기동을 N회 반복해 import/워밍업/첫 요청 시간을 측정")
+    parser.add_argument('--import-budget-ms', type=float, help="main 모듈 로드 시간(p50) 예산. 넘으면 종료 코드 1")
+    sys.exit(run_benchmark(parser.parse_args()))
@@ -0,0 +1,555 @@
+"""
+Firestore 대신 쓸 수 있는 로컬 저장소 (SQLite 파일 또는 메모리).
+
+main.py가 사용하는 Firestore 클라이언트 기능만 같은 모양으로 구현한다.
+  - collection / document / 하위 컬렉션, 자동 문서 ID
+  - get(field_paths), set(merge=True | [필드]), update(점 경로), create, delete
+  - where / order_by / limit / start_after / select / stream / get, get_all, batch
+  - Increment, ArrayUnion, DELETE_FIELD, SERVER_TIMESTAMP
+  - 쿼리 on_snapshot (같은 프로세스 안의 쓰기를 감지)
+문서는 JSON으로 저장하고, 스칼라 필드 값은 (상위 경로, 필드, 값) 색인 테이블에 함께 기록해 '==' 조건은 색인으로 찾는다.
+
+사용 예: STORAGE_BACKEND=sqlite STORAGE_PATH=eduverse.db python main.py
+"""
+import copy
+import datetime
+import json
+import queue
+import random
+import sqlite3
+import string
+import threading
+from types import SimpleNamespace
+
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1 import transforms
+
+DESCENDING = 'DESCENDING'
+_AUTO_ID_CHARS = string.ascii_letters + string.digits
+_MISSING = object()
+
+# --- 값 인코딩 ---
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {'__datetime__'}:
+            return datetime.datetime.fromisoformat(value['__datetime__'])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+def _index_key(value):
+    """색인 테이블에 넣을 값 표현. 1과 1.0은 같은 값으로 본다."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return json.dumps(_encode(value), sort_keys=True, ensure_ascii=False)
+
+def _flatten_scalars(data, prefix=''):
+    for key, value in data.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            yield from _flatten_scalars(value, path + '.')
+        elif not isinstance(value, list):
+            yield path, value
+
+# --- 필드 경로 ---
+def _get_path(data, path):
+    current = data
+    for part in path.split('.'):
+        if not isinstance(current, dict) or part not in current:
+            return _MISSING
+        current = current[part]
+    return current
+
+def _set_path(data, path, value):
+    parts = path.split('.')
+    current = data
+    for part in parts[:-1]:
+        if not isinstance(current.get(part), dict):
+            current[part] = {}
+        current = current[part]
+    _apply_value(current, parts[-1], value)
+
+def _apply_value(container, key, value):
+    """필드 하나에 값이나 변환(Increment 등)을 적용한다."""
+    if value is transforms.DELETE_FIELD:
+        container.pop(key, None)
+    elif value is transforms.SERVER_TIMESTAMP:
+        container[key] = datetime.datetime.now(datetime.timezone.utc)
+    elif isinstance(value, transforms.Increment):
+        current = container.get(key)
+        container[key] = (current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0) + value.value
+    elif isinstance(value, transforms.ArrayUnion):
+        current = list(container.get(key)) if isinstance(container.get(key), list) else []
+        container[key] = current + [v for v in value.values if v not in current]
+    elif isinstance(value, transforms.ArrayRemove):
+        current = container.get(key) if isinstance(container.get(key), list) else []
+        container[key] = [v for v in current if v not in value.values]
+    elif isinstance(value, dict):
+        container[key] = {}
+        for sub_key, sub_value in value.items():
+            _apply_value(container[key], sub_key, sub_value)
+    else:
+        container[key] = copy.deepcopy(value)
+
+def _merge_into(target, data):
+    """
+    set(merge=True): Firestore와 같이 data의 말단 필드만 교체한다.
+    비어 있지 않은 맵은 재귀적으로 합치고, 빈 맵을 포함한 나머지 값은 그 자리의 값을 교체한다
+    (빈 맵은 "변경 없음"이 아니라 "빈 맵으로 교체").
+    """
+    for key, value in data.items():
+        if isinstance(value, dict) and value:
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge_into(target[key], value)
+        else:
+            _apply_value(target, key, value)
+
+def _project(data, field_paths):
+    if field_paths is None:
+        return data
+    projected = {}
+    for path in field_paths:
+        if path == '__name__':
+            continue
+        value = _get_path(data, path)
+        if value is not _MISSING:
+            _set_path(projected, path, copy.deepcopy(value))
+    return projected
+
+# --- 정렬/비교 (Firestore의 타입 순서를 단순화) ---
+def _type_rank(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime.datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, list):
+        return 5
+    return 6
+
+def _sort_key(value):
+    rank = _type_rank(value)
+    if rank == 3 and value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    if rank >= 5:
+        value = json.dumps(_encode(value), sort_keys=True)
+    return (rank, value)
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: _type_rank(a) == _type_rank(b) and _sort_key(a) < _sort_key(b),
+    '<=': lambda a, b: _type_rank(a) == _type_rank(b) and _sort_key(a) <= _sort_key(b),
+    '>': lambda a, b: _type_rank(a) == _type_rank(b) and _sort_key(a) > _sort_key(b),
+    '>=': lambda a, b: _type_rank(a) == _type_rank(b) and _sort_key(a) >= _sort_key(b),
+    'in': lambda a, b: a in b,
+    'not-in': lambda a, b: a not in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+    'array-contains': lambda a, b: isinstance(a, list) and b in a,
+    'array_contains_any': lambda a, b: isinstance(a, list) and any(v in a for v in b),
+    'array-contains-any': lambda a, b: isinstance(a, list) and any(v in a for v in b),
+}
+
+# --- 스냅샷 ---
+class LocalDocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        value = _get_path(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+# --- 참조 ---
+class LocalDocumentReference:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return LocalCollectionReference(self._store, self.path.rsplit('/', 1)[0])
+
+    def collection(self, name):
+        return LocalCollectionReference(self._store, f'{self.path}/{name}')
+
+    def get(self, field_paths=None, **kwargs):
+        data = self._store._read(self.path)
+        return LocalDocumentSnapshot(self, _project(data, field_paths) if data is not None else None)
+
+    def set(self, document_data, merge=False):
+        self._store._commit([('set', self, document_data, merge)])
+
+    def update(self, field_updates):
+        self._store._commit([('update', self, field_updates, None)])
+
+    def create(self, document_data):
+        self._store._commit([('create', self, document_data, None)])
+
+    def delete(self):
+        self._store._commit([('delete', self, None, None)])
+
+    def __eq__(self, other):
+        return isinstance(other, LocalDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+class LocalQuery:
+    def __init__(self, store, parent, filters=(), orders=(), limit=None, cursor=None, projection=None):
+        self._store = store
+        self._parent = parent
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._projection = projection
+
+    def _copy(self, **changes):
+        values = {'filters': self._filters, 'orders': self._orders, 'limit': self._limit,
+                  'cursor': self._cursor, 'projection': self._projection}
+        values.update(changes)
+        return LocalQuery(self._store, self._parent, **values)
+
+    def where(self, field_path, op_string, value):
+        if op_string not in _OPERATORS:
+            raise ValueError(f"지원하지 않는 비교 연산자입니다: {op_string}")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def _matches(self, doc_id, data):
+        for field_path, op_string, value in self._filters:
+            actual = doc_id if field_path == '__name__' else _get_path(data, field_path)
+            if actual is _MISSING or not _OPERATORS[op_string](actual, value):
+                return False
+        # order_by 필드가 없는 문서는 Firestore와 같이 결과에서 빠진다
+        return all(field_path == '__name__' or _get_path(data, field_path) is not _MISSING
+                   for field_path, _ in self._orders)
+
+    @staticmethod
+    def _order_values(orders, doc_id, data):
+        return [doc_id if field_path == '__name__' else _get_path(data, field_path) for field_path, _ in orders]
+
+    def _results(self):
+        """조건에 맞는 (doc_id, data) 목록을 정렬/커서/개수 제한을 적용해 반환한다."""
+        equality = [(f, v) for f, op, v in self._filters if op == '==' and f != '__name__' and not isinstance(v, (list, dict))]
+        rows = [(doc_id, data) for doc_id, data in self._store._scan(self._parent, equality) if self._matches(doc_id, data)]
+
+        orders = list(self._orders)
+        if not any(field_path == '__name__' for field_path, _ in orders):
+            orders.append(('__name__', 'ASCENDING'))
+        for field_path, direction in reversed(orders):
+            rows.sort(key=lambda row: _sort_key(row[0] if field_path == '__name__' else _get_path(row[1], field_path)),
+                      reverse=direction == DESCENDING)
+
+        if self._cursor is not None:
+            # 스냅샷 커서는 정렬 기준 전체(마지막의 문서 ID 포함), 필드 dict 커서는 지정한 order_by 필드만 비교
+            if isinstance(self._cursor, LocalDocumentSnapshot):
+                cursor_orders = orders
+                cursor_values = self._order_values(orders, self._cursor.id, self._cursor.to_dict() or {})
+            else:
+                cursor_orders = list(self._orders)
+                cursor_values = [self._cursor.get(field_path) for field_path, _ in cursor_orders]
+            position = None
+            for index, (doc_id, data) in enumerate(rows):
+                if self._order_values(cursor_orders, doc_id, data) == cursor_values:
+                    position = index
+            if position is None: # 커서 문서가 사라졌으면 값 비교로 위치를 찾는다
+                directions = [direction for _, direction in cursor_orders]
+                def after_cursor(row):
+                    for value, cursor_value, direction in zip(self._order_values(cursor_orders, *row), cursor_values, directions):
+                        if _sort_key(value) != _sort_key(cursor_value):
+                            return (_sort_key(value) > _sort_key(cursor_value)) != (direction == DESCENDING)
+                    return False
+                rows = [row for row in rows if after_cursor(row)]
+            else:
+                rows = rows[position + 1:]
+
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return rows
+
+    def stream(self, **kwargs):
+        for doc_id, data in self._results():
+            reference = LocalDocumentReference(self._store, f'{self._parent}/{doc_id}')
+            yield LocalDocumentSnapshot(reference, _project(data, self._projection))
+
+    def get(self, **kwargs):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._store._listen(self, callback)
+
+class LocalCollectionReference(LocalQuery):
+    def __init__(self, store, path):
+        super().__init__(store, path)
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        document_id = document_id or ''.join(random.choices(_AUTO_ID_CHARS, k=20))
+        return LocalDocumentReference(self._store, f'{self.path}/{document_id}')
+
+    def add(self, document_data):
+        reference = self.document()
+        reference.set(document_data)
+        return None, reference
+
+class LocalWriteBatch:
+    def __init__(self, store):
+        self._store = store
+        self._writes = []
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, merge))
+        return self
+
+    def update(self, reference, field_updates):
+        self._writes.append(('update', reference, field_updates, None))
+        return self
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data, None))
+        return self
+
+    def delete(self, reference):
+        self._writes.append(('delete', reference, None, None))
+        return self
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        self._store._commit(writes)
+        return []
+
+# --- 실시간 리스너 ---
+class LocalWatch:
+    def __init__(self, store, query, callback):
+        self._store = store
+        self.query = query
+        self.callback = callback
+        self.documents = {} # doc_id -> data (마지막으로 알린 결과)
+        self.notified = False
+        self.active = True
+
+    def unsubscribe(self):
+        self.active = False
+        self._store._unlisten(self)
+
+def _change(type_name, reference, data):
+    return SimpleNamespace(type=SimpleNamespace(name=type_name), document=LocalDocumentSnapshot(reference, data))
+
+# --- 저장소 ---
+class LocalStore:
+    """
+    Firestore 클라이언트와 같은 방식으로 쓰는 로컬 저장소.
+    path가 ':memory:'이면 메모리에만 두고, 파일 경로면 SQLite 파일에 저장한다.
+    """
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._watches = []
+        self._notifications = queue.Queue()
+        self._dispatcher = None
+        with self._lock:
+            if path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+                self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS documents (
+                    path TEXT PRIMARY KEY, parent TEXT NOT NULL, doc_id TEXT NOT NULL, data TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS documents_parent ON documents (parent, doc_id);
+                CREATE TABLE IF NOT EXISTS field_index (
+                    parent TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, path TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS field_index_lookup ON field_index (parent, field, value);
+                CREATE INDEX IF NOT EXISTS field_index_path ON field_index (path);
+            ''')
+
+    # Firestore 클라이언트와 같은 진입점
+    def collection(self, name):
+        return LocalCollectionReference(self, name)
+
+    def document(self, path):
+        return LocalDocumentReference(self, path)
+
+    def batch(self):
+        return LocalWriteBatch(self)
+
+    def get_all(self, references, field_paths=None, **kwargs):
+        references = list(references)
+        with self._lock:
+            found = {}
+            paths = [reference.path for reference in references]
+            for offset in range(0, len(paths), 500):
+                chunk = paths[offset:offset + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for path, data in self._conn.execute(f'SELECT path, data FROM documents WHERE path IN ({placeholders})', chunk):
+                    found[path] = _decode(json.loads(data))
+        for reference in references:
+            data = found.get(reference.path)
+            yield LocalDocumentSnapshot(reference, _project(data, field_paths) if data is not None else None)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # 내부 읽기
+    def _read(self, path):
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM documents WHERE path = ?', (path,)).fetchone()
+        return _decode(json.loads(row[0])) if row else None
+
+    def _scan(self, parent, equality=()):
+        """parent 컬렉션의 문서를 읽는다. equality 조건이 있으면 색인으로 후보를 좁힌다."""
+        with self._lock:
+            if equality:
+                clauses = ' AND '.join(
+                    'path IN (SELECT path FROM field_index WHERE parent = ? AND field = ? AND value = ?)' for _ in equality)
+                params = [parent]
+                for field_path, value in equality:
+                    params.extend([parent, field_path, _index_key(value)])
+                rows = self._conn.execute(f'SELECT doc_id, data FROM documents WHERE parent = ? AND {clauses}', params).fetchall()
+            else:
+                rows = self._conn.execute('SELECT doc_id, data FROM documents WHERE parent = ?', (parent,)).fetchall()
+        return [(doc_id, _decode(json.loads(data))) for doc_id, data in rows]
+
+    # 내부 쓰기
+    def _commit(self, writes):
+        """쓰기 목록을 하나의 트랜잭션으로 적용한다 (하나라도 실패하면 전체 취소)."""
+        touched = set()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                pending = {} # 같은 배치 안에서 같은 문서를 여러 번 쓰는 경우를 위해
+                for op, reference, data, merge in writes:
+                    path = reference.path
+                    current = pending[path] if path in pending else self._read(path)
+                    if op == 'create':
+                        if current is not None:
+                            raise AlreadyExists(f"Document already exists: {path}")
+                        new_data = {}
+                        _merge_into(new_data, data)
+                    elif op == 'set':
+                        if merge is True:
+                            new_data = copy.deepcopy(current) if current is not None else {}
+                            _merge_into(new_data, data)
+                        elif merge:
+                            new_data = copy.deepcopy(current) if current is not None else {}
+                            for field_path in merge:
+                                value = _get_path(data, field_path)
+                                _set_path(new_data, field_path, transforms.DELETE_FIELD if value is _MISSING else value)
+                        else:
+                            new_data = {}
+                            _merge_into(new_data, data)
+                    elif op == 'update':
+                        if current is None:
+                            raise NotFound(f"No document to update: {path}")
+                        new_data = copy.deepcopy(current)
+                        for field_path, value in data.items():
+                            _set_path(new_data, field_path, value)
+                    else:
+                        new_data = None
+                    pending[path] = new_data
+                for path, new_data in pending.items():
+                    self._write_row(path, new_data)
+                    touched.add(path.rsplit('/', 1)[0])
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            if self._watches and touched:
+                for watch in list(self._watches):
+                    if watch.query._parent in touched:
+                        self._queue_changes(watch)
+
+    def _write_row(self, path, data):
+        self._conn.execute('DELETE FROM field_index WHERE path = ?', (path,))
+        if data is None:
+            self._conn.execute('DELETE FROM documents WHERE path = ?', (path,))
+            return
+        parent, doc_id = path.rsplit('/', 1)
+        self._conn.execute('INSERT OR REPLACE INTO documents (path, parent, doc_id, data) VALUES (?, ?, ?, ?)',
+                           (path, parent, doc_id, json.dumps(_encode(data), ensure_ascii=False)))
+        self._conn.executemany('INSERT INTO field_index (parent, field, value, path) VALUES (?, ?, ?, ?)',
+                               [(parent, field, _index_key(value), path) for field, value in _flatten_scalars(data)])
+
+    # 리스너
+    def _listen(self, query, callback):
+        watch = LocalWatch(self, query, callback)
+        with self._lock:
+            self._watches.append(watch)
+            self._queue_changes(watch)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='local-store-watch', daemon=True)
+                self._dispatcher.start()
+        return watch
+
+    def _unlisten(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _queue_changes(self, watch):
+        # _lock 보유 상태에서 호출: 쿼리 결과를 다시 계산해 이전 결과와의 차이를 알림 큐에 넣는다
+        results = dict(watch.query._results())
+        changes = []
+        for doc_id, data in results.items():
+            previous = watch.documents.get(doc_id)
+            if previous is None or previous != data:
+                reference = LocalDocumentReference(self, f'{watch.query._parent}/{doc_id}')
+                changes.append(_change('ADDED' if previous is None else 'MODIFIED', reference, data))
+        for doc_id, data in watch.documents.items():
+            if doc_id not in results:
+                changes.append(_change('REMOVED', LocalDocumentReference(self, f'{watch.query._parent}/{doc_id}'), data))
+        watch.documents = results
+        if changes or not watch.notified: # 첫 알림은 결과가 비어 있어도 보낸다
+            watch.notified = True
+            docs = [LocalDocumentSnapshot(LocalDocumentReference(self, f'{watch.query._parent}/{doc_id}'), data)
+                    for doc_id, data in results.items()]
+            self._notifications.put((watch, docs, changes))
+
+    def _dispatch(self):
+        # 콜백은 Firestore처럼 별도 스레드에서, 저장소 잠금 없이 호출한다
+        while True:
+            watch, docs, changes = self._notifications.get()
+            if not watch.active:
+                continue
+            try:
+                watch.callback(docs, changes, datetime.datetime.now(datetime.timezone.utc))
+            except Exception as e:
+                print(f"Error in local store listener: {e}")
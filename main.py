@@ -1,25 +1,839 @@
+import time
+_MODULE_LOAD_STARTED = time.perf_counter() # 시작 시간 보고용 (무거운 import보다 먼저 기록)
 import random
 import string
 import json
+import csv
+import io
 from collections import Counter
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, g
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1 import batch as firestore_batch, client as firestore_client, document as firestore_document, query as firestore_query
 from werkzeug.security import generate_password_hash, check_password_hash
 import copy # deepcopy를 위해 import 추가
 import subprocess # ★★★ 코드 실행을 위해 추가 ★★★
 import tempfile # ★★★ 임시 파일 생성을 위해 추가 ★★★
 import os # ★★★ 파일 경로 처리를 위해 추가 ★★★
+import sys
+import queue
+import threading
+import atexit
+import hashlib
+import selectors
+import gzip
+import uuid
+import contextvars
+import functools
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, namedtuple, deque
+
+# 서버 모드: 기본은 gunicorn 스레드 워커(--threads 8, 동시 처리 8건).
+# SERVER_MODE=gevent로 띄우면(Dockerfile 참고) gunicorn gevent 워커가 앱을 불러오기 전에 표준 라이브러리를 협력형으로 바꿔 두므로
+# (monkey patch) Firestore 호출, 채점 프로세스 대기, 롱폴링/SSE가 스레드를 붙잡지 않고 양보한다. 라우트 코드와 응답 형식은 그대로다.
+def _detect_cooperative_mode():
+    # gevent 워커라면 이미 불러와져 있으므로 sys.modules만 본다 (스레드 모드에서 gevent import 비용을 치르지 않도록)
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+COOPERATIVE_MODE = _detect_cooperative_mode()
+if COOPERATIVE_MODE:
+    import gevent
+    from grpc.experimental import gevent as grpc_gevent
+    grpc_gevent.init_gevent() # gRPC 채널을 만들기 전에 호출해야 Firestore 호출이 gevent 루프에서 양보함
+
+def run_blocking(fn, *args, **kwargs):
+    """
+    CPU를 오래 쓰는 호출(비밀번호 해시 등)을 실행한다.
+    gevent 모드에서는 실제 OS 스레드에서 돌려 그동안 다른 요청이 멈추지 않게 한다.
+    """
+    if COOPERATIVE_MODE:
+        return gevent.get_hub().threadpool.apply(fn, args, kwargs)
+    return fn(*args, **kwargs)
 
-# Firebase 초기화 (앱이 없을 경우에만)
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(options={
-        'projectId': 'my-python-65210-65c44',
-    })
+# --- 시작 시간 보고 ---
+# 콜드 스타트에서 시간이 어디에 쓰이는지 단계별로 기록한다 (모듈 로드 단계는 여기서, 워밍업 단계는 Warmup에서).
+# 결과는 기동 로그, /api/warmup, /metrics에서 확인할 수 있다.
+STARTUP_IMPORT_BUDGET_MS = float(os.environ.get('STARTUP_IMPORT_BUDGET_MS', '1500')) # 모듈 로드가 이보다 오래 걸리면 경고 로그
+startup_phases = OrderedDict() # 단계 이름 -> ms
+_startup_last_mark = [_MODULE_LOAD_STARTED]
+
+def mark_startup_phase(name):
+    now = time.perf_counter()
+    startup_phases[name] = round((now - _startup_last_mark[0]) * 1000, 1)
+    _startup_last_mark[0] = now
+
+mark_startup_phase('imports')
 
-db = firestore.client()
+class LazyClient:
+    """
+    저장소 클라이언트를 처음 쓰는 시점(보통은 기동 직후의 백그라운드 워밍업)에 만든다.
+    자격 증명 조회와 클라이언트 생성이 import 시간에 포함되지 않으며, 나머지 속성 접근은 실제 클라이언트로 그대로 넘긴다.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+        self.init_ms = None
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    started = time.perf_counter()
+                    self._client = self._factory()
+                    self.init_ms = round((time.perf_counter() - started) * 1000, 1)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+def _create_firestore_client():
+    # Firebase 초기화 (앱이 없을 경우에만)
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(options={
+            'projectId': 'my-python-65210-65c44',
+        })
+    return firestore.client()
+
+# 저장소 선택: firestore(기본) | sqlite | memory
+# sqlite/memory는 local_store.LocalStore를 사용한다 (Firebase 프로젝트 없이 실행, 부하 테스트, 교내 서버용).
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'firestore')
+STORAGE_PATH = os.environ.get('STORAGE_PATH', 'eduverse.db') # sqlite일 때 데이터 파일 경로
+
+if STORAGE_BACKEND == 'firestore':
+    db = LazyClient(_create_firestore_client)
+elif STORAGE_BACKEND in ('sqlite', 'memory'):
+    import local_store
+    db = local_store.LocalStore(STORAGE_PATH if STORAGE_BACKEND == 'sqlite' else ':memory:')
+else:
+    raise ValueError(f"지원하지 않는 STORAGE_BACKEND입니다: {STORAGE_BACKEND} (firestore, sqlite, memory 중 하나)")
+mark_startup_phase('storage')
+FIRESTORE_BATCH_LIMIT = 500 # Firestore 배치 1회당 최대 쓰기 수
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
+# --- 계측 (metrics) ---
+# 라우트별 응답 시간 히스토그램, 요청마다 Firestore 읽기/쓰기/쿼리 횟수와 소요 시간, 채점 대기/실행 시간을 모아
+# /metrics에서 Prometheus 텍스트 형식으로 내보낸다. SLOW_REQUEST_MS를 주면 그보다 느린 요청의 내역을 로그로 남긴다.
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '0')) # 0이면 느린 요청 로그를 남기지 않음
+FIRESTORE_OP_KINDS = ('read', 'query', 'write')
+
+class Histogram:
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+class MetricsRegistry:
+    """이름과 라벨 조합별 카운터/히스토그램 저장소 (스레드 안전)"""
+    def __init__(self):
+        self._counters = {} # (name, labels) -> float
+        self._histograms = {} # (name, labels) -> Histogram
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels=(), value=1, help_text=''):
+        with self._lock:
+            self._help.setdefault(name, (help_text, 'counter'))
+            key = (name, tuple(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=(), help_text=''):
+        with self._lock:
+            self._help.setdefault(name, (help_text, 'histogram'))
+            key = (name, tuple(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+    def render(self, gauges=()):
+        """Prometheus 텍스트 형식. gauges는 (이름, 설명, [(라벨, 값), ...]) 목록"""
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h.counts), h.count, h.sum, h.buckets) for key, h in self._histograms.items()}
+            help_map = dict(self._help)
+        for name in sorted(help_map):
+            help_text, metric_type = help_map[name]
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            if metric_type == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{self._format_labels(labels)} {value}')
+                continue
+            for (metric, labels), (counts, count, total, buckets) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, bucket_count in zip(buckets, counts):
+                    lines.append(f'{name}_bucket{self._format_labels(labels, [("le", bound)])} {bucket_count}')
+                lines.append(f'{name}_bucket{self._format_labels(labels, [("le", "+Inf")])} {count}')
+                lines.append(f'{name}_sum{self._format_labels(labels)} {total}')
+                lines.append(f'{name}_count{self._format_labels(labels)} {count}')
+        for name, help_text, samples in gauges:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{self._format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+class RequestStats:
+    """요청 하나 동안의 Firestore 호출/채점 시간 집계 (요청이 띄운 스레드에서도 함께 기록됨)"""
+    def __init__(self):
+        self.firestore = {kind: [0, 0.0] for kind in FIRESTORE_OP_KINDS} # kind -> [횟수, 초]
+        self.grader_queue_ms = 0.0
+        self.grader_exec_ms = 0.0
+        self._lock = threading.Lock()
+
+    def add_firestore(self, kind, seconds):
+        with self._lock:
+            self.firestore[kind][0] += 1
+            self.firestore[kind][1] += seconds
+
+    def add_grader(self, queue_ms, exec_ms):
+        with self._lock:
+            self.grader_queue_ms += queue_ms
+            self.grader_exec_ms += exec_ms
+
+_request_stats = contextvars.ContextVar('request_stats', default=None)
+
+def with_request_stats(fn):
+    """다른 스레드(ThreadPoolExecutor 등)에서 실행할 함수가 현재 요청의 집계에 기록되도록 감싼다."""
+    stats = _request_stats.get()
+    def wrapper(*args, **kwargs):
+        token = _request_stats.set(stats)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _request_stats.reset(token)
+    return wrapper
+
+def _record_firestore(kind, seconds):
+    metrics.inc('eduverse_firestore_operations_total', [('kind', kind)], help_text='Firestore RPCs by kind')
+    metrics.inc('eduverse_firestore_seconds_total', [('kind', kind)], seconds, help_text='Time spent in Firestore RPCs by kind')
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.add_firestore(kind, seconds)
+
+def _instrument_call(cls, method_name, kind):
+    original = getattr(cls, method_name)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            _record_firestore(kind, time.perf_counter() - started)
+    setattr(cls, method_name, wrapper)
+
+def _instrument_stream(cls, method_name, kind):
+    # 결과를 순회하는 동안 걸린 시간(실제 RPC 수신 시간)을 합산한다
+    original = getattr(cls, method_name)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        iterator = original(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield item
+        finally:
+            _record_firestore(kind, elapsed)
+    setattr(cls, method_name, wrapper)
+
+if os.environ.get('FIRESTORE_INSTRUMENTATION', '1') == '1':
+    if STORAGE_BACKEND == 'firestore':
+        _instrument_call(firestore_document.DocumentReference, 'get', 'read')
+        _instrument_call(firestore_document.DocumentReference, 'delete', 'write')
+        _instrument_call(firestore_batch.WriteBatch, 'commit', 'write') # set/update/create도 내부적으로 배치 커밋을 사용
+        _instrument_stream(firestore_client.Client, 'get_all', 'read')
+        _instrument_stream(firestore_query.Query, 'stream', 'query') # CollectionReference.stream/get도 이 경로를 사용
+    else:
+        _instrument_call(local_store.LocalDocumentReference, 'get', 'read')
+        _instrument_call(local_store.LocalStore, '_commit', 'write') # 문서 쓰기와 배치 커밋이 모두 이 경로를 사용
+        _instrument_stream(local_store.LocalStore, 'get_all', 'read')
+        _instrument_stream(local_store.LocalQuery, 'stream', 'query')
+
+def record_grader_timing(queue_wait_ms, exec_ms):
+    metrics.observe('eduverse_grader_queue_wait_seconds', queue_wait_ms / 1000, help_text='Time waiting for a grader worker')
+    metrics.observe('eduverse_grader_exec_seconds', exec_ms / 1000, help_text='Grader execution time')
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.add_grader(queue_wait_ms, exec_ms)
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    g.metrics_stats = RequestStats()
+    g.metrics_token = _request_stats.set(g.metrics_stats)
+
+@app.after_request
+def _finish_request_metrics(response):
+    started = g.pop('metrics_started', None)
+    stats = g.pop('metrics_stats', None)
+    token = g.pop('metrics_token', None)
+    if started is None:
+        return response
+    if token is not None:
+        _request_stats.reset(token)
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = [('route', route), ('method', request.method)]
+    metrics.observe('eduverse_http_request_duration_seconds', elapsed, labels, help_text='Request latency by route')
+    metrics.inc('eduverse_http_requests_total', labels + [('status', response.status_code)], help_text='Requests by route and status')
+    for kind, (count, seconds) in stats.firestore.items():
+        if count:
+            metrics.inc('eduverse_request_firestore_operations_total', labels + [('kind', kind)], count, help_text='Firestore RPCs issued while serving each route')
+            metrics.inc('eduverse_request_firestore_seconds_total', labels + [('kind', kind)], seconds, help_text='Time spent in Firestore RPCs while serving each route')
+
+    elapsed_ms = elapsed * 1000
+    if SLOW_REQUEST_MS and elapsed_ms >= SLOW_REQUEST_MS:
+        firestore_ms = sum(seconds for _, seconds in stats.firestore.values()) * 1000
+        breakdown = ', '.join(f"{kind} {count}/{seconds * 1000:.0f}ms" for kind, (count, seconds) in stats.firestore.items())
+        print(f"Slow request: {request.method} {route} {response.status_code} {elapsed_ms:.0f}ms "
+              f"(firestore {breakdown}; grader queue {stats.grader_queue_ms:.0f}ms exec {stats.grader_exec_ms:.0f}ms; "
+              f"other {max(0.0, elapsed_ms - firestore_ms - stats.grader_queue_ms - stats.grader_exec_ms):.0f}ms)")
+    return response
+
+# --- 공용 캐시 ---
+class TTLCache:
+    """
+    크기 제한(LRU 방출)과 선택적 TTL을 가진 스레드 안전 인메모리 캐시.
+    적중/실패/방출 횟수를 함께 집계한다.
+    """
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl # 초 단위, None이면 만료 없음
+        self._data = OrderedDict() # key -> (저장 시각, 값)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0
+            }
+
+# --- 시나리오 캐시 ---
+# 시나리오는 upload_scenarios.py 실행 시에만 바뀌므로, 전체를 한 번 읽어 프로세스 메모리에 두고 모든 라우트가 공유한다.
+# scenario_meta/version 문서의 버전 값이 바뀐 경우에만 다시 읽으며, 버전 확인은 최대 N초에 한 번만 한다.
+SCENARIO_VERSION_CHECK_INTERVAL = int(os.environ.get('SCENARIO_VERSION_CHECK_INTERVAL', '30'))
+
+SCENARIO_LEVELS = ('beginner', 'advanced')
+
+def build_level_cycle(cycle_data, user_level):
+    """사이클 원본에서 학습 레벨에 맞는 콘텐츠를 골라 프론트엔드로 보낼 사이클을 만든다."""
+    processed_cycle = copy.deepcopy(cycle_data) # Use deepcopy to avoid modifying original
+
+    # Select appropriate content based on user level and availability of '_adv' fields
+    selected_starterCode = processed_cycle.get('starterCode', '')
+    if user_level == 'advanced' and 'starterCode_adv' in processed_cycle:
+        selected_starterCode = processed_cycle['starterCode_adv']
+
+    selected_task = processed_cycle.get('task', {})
+    if user_level == 'advanced' and 'task_adv' in processed_cycle:
+        selected_task = processed_cycle['task_adv']
+
+    selected_briefing = processed_cycle.get('briefing', {})
+    if user_level == 'advanced' and 'briefing_adv' in processed_cycle:
+        selected_briefing = processed_cycle['briefing_adv']
+
+    # Overwrite the base keys with selected content
+    processed_cycle['starterCode'] = selected_starterCode
+    processed_cycle['task'] = selected_task
+    processed_cycle['briefing'] = selected_briefing
+
+    # Remove '_adv' keys from the final cycle data sent to frontend
+    processed_cycle.pop('starterCode_adv', None)
+    processed_cycle.pop('task_adv', None)
+    processed_cycle.pop('briefing_adv', None)
+    # ★★★ testCode_adv는 프론트엔드로 보내지 않으므로 여기서 제거 ★★★
+    processed_cycle.pop('testCode_adv', None)
+    return processed_cycle
+
+def build_week_manifest(week_num, week_data):
+    """주차의 가벼운 목차. 본문(lecture/briefing/task/feedback)은 사이클 상세 API로 따로 받는다."""
+    return {
+        'week': week_data.get('week', week_num), 'title': week_data.get('title', ''),
+        'cycles': [
+            {'index': index, 'title': cycle.get('title', ''), 'syntax_key': cycle.get('syntax_key'), 'filename': cycle.get('filename')}
+            for index, cycle in enumerate(week_data.get('cycles', []))
+        ]
+    }
+
+# 바로 전송 가능한 응답 본문 (JSON bytes, gzip 압축본, 강한 ETag)
+ScenarioPayload = namedtuple('ScenarioPayload', ['body', 'gzip_body', 'etag'])
+
+def build_scenario_payload(data):
+    body = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    return ScenarioPayload(body, gzip.compress(body, compresslevel=9, mtime=0), hashlib.sha256(body).hexdigest()[:32])
+
+def send_scenario_payload(payload):
+    """
+    미리 만들어 둔 응답을 그대로 보낸다.
+    If-None-Match가 현재 ETag와 같으면 본문 없이 304를 돌려주고, 클라이언트가 허용하면 gzip 본문을 보낸다.
+    """
+    use_gzip = request.accept_encodings['gzip'] > 0
+    etag = payload.etag + '-gz' if use_gzip else payload.etag
+    if request.if_none_match.contains(payload.etag) or request.if_none_match.contains(payload.etag + '-gz'):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(payload.gzip_body if use_gzip else payload.body, mimetype='application/json')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache' # 매번 재검증 (레벨이 바뀌면 ETag도 바뀜)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+class ScenarioCache:
+    """
+    주차 번호(int) -> 시나리오 문서(dict) 캐시.
+    반환되는 dict는 모든 요청이 공유하므로 읽기 전용으로 다뤄야 한다.
+    """
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._weeks = None
+        self._payloads = {} # (주차, 레벨) -> ScenarioPayload
+        self._cycle_payloads = {} # (주차, 레벨, 사이클 인덱스) -> ScenarioPayload
+        self._manifests = {} # 주차 -> ScenarioPayload (레벨과 무관한 사이클 목록)
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.version_checks = 0
+
+    def _fetch_version(self):
+        marker = db.collection('scenario_meta').document('version').get()
+        return marker.to_dict().get('version') if marker.exists else None
+
+    def _load_weeks(self):
+        weeks = {}
+        for doc in db.collection('scenarios').stream():
+            if doc.id.startswith('week_') and doc.id[5:].isdigit():
+                weeks[int(doc.id[5:])] = doc.to_dict()
+        return weeks
+
+    def _refresh(self, force):
+        version = self._fetch_version()
+        self.version_checks += 1
+        if force or self._weeks is None or version != self._version:
+            weeks = self._load_weeks()
+            payloads, cycle_payloads, manifests = {}, {}, {}
+            for week_num, week_data in weeks.items():
+                cycles = week_data.get('cycles', [])
+                for level in SCENARIO_LEVELS:
+                    level_cycles = [build_level_cycle(cycle, level) for cycle in cycles]
+                    payload = dict(week_data)
+                    payload['cycles'] = level_cycles
+                    payloads[(week_num, level)] = build_scenario_payload(payload)
+                    for index, level_cycle in enumerate(level_cycles):
+                        cycle_payloads[(week_num, level, index)] = build_scenario_payload(
+                            {'week': week_data.get('week', week_num), 'cycleIndex': index, 'cycle': level_cycle})
+                manifests[week_num] = build_scenario_payload(build_week_manifest(week_num, week_data))
+            # 교체는 참조 대입 몇 번으로 끝나므로 갱신 중에도 읽는 쪽은 항상 완성된 데이터를 본다
+            self._weeks, self._payloads, self._cycle_payloads, self._manifests = weeks, payloads, cycle_payloads, manifests
+            self._version = version
+            self.reloads += 1
+            print(f"Scenario cache loaded: {len(self._weeks)} weeks (version {version})")
+        self._checked_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._weeks is None:
+            with self._lock:
+                if self._weeks is None:
+                    self._refresh(force=True)
+            return
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        # 다른 스레드가 이미 확인 중이면 기존 데이터로 응답한다
+        if self._lock.acquire(blocking=False):
+            try:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._refresh(force=False)
+            except Exception as e:
+                print(f"Scenario version check failed, serving cached data: {e}")
+                self._checked_at = time.monotonic()
+            finally:
+                self._lock.release()
+
+    def get_week(self, week_num):
+        """주차 시나리오를 반환한다. 없으면 None."""
+        self._ensure_fresh()
+        return self._weeks.get(week_num)
+
+    def get_payload(self, week_num, user_level):
+        """레벨별로 미리 직렬화해 둔 주차 응답을 반환한다. 없으면 None."""
+        self._ensure_fresh()
+        level = 'advanced' if user_level == 'advanced' else 'beginner'
+        return self._payloads.get((week_num, level))
+
+    def get_cycle_payload(self, week_num, user_level, cycle_index):
+        """레벨별로 미리 직렬화해 둔 사이클 한 개의 응답을 반환한다. 없으면 None."""
+        self._ensure_fresh()
+        level = 'advanced' if user_level == 'advanced' else 'beginner'
+        return self._cycle_payloads.get((week_num, level, cycle_index))
+
+    def get_manifest(self, week_num):
+        """주차의 사이클 목록(제목, syntax_key, filename)만 담은 응답을 반환한다. 없으면 None."""
+        self._ensure_fresh()
+        return self._manifests.get(week_num)
+
+    def all_weeks(self):
+        self._ensure_fresh()
+        return self._weeks
+
+    def reload(self):
+        with self._lock:
+            self._refresh(force=True)
+
+    def snapshot(self):
+        return {
+            'source': SCENARIO_SOURCE, 'version': self._version, 'weeks': sorted(self._weeks) if self._weeks is not None else [],
+            'reloads': self.reloads, 'versionChecks': self.version_checks,
+            'checkInterval': self.check_interval
+        }
+
+class FileScenarioCache(ScenarioCache):
+    """
+    Firestore 대신 로컬 scenario.json에서 시나리오를 읽는 캐시 (로컬 실행/부하 테스트/단일 리전 배포용).
+    파일의 수정 시각과 크기를 버전으로 사용하므로, 파일이 바뀌면 다음 확인 시점에 통째로 다시 읽어 교체한다.
+    """
+    def __init__(self, check_interval, path):
+        super().__init__(check_interval)
+        self.path = path
+
+    def _fetch_version(self):
+        stat = os.stat(self.path)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def _load_weeks(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            scenarios_data_list = json.load(f)
+        if not isinstance(scenarios_data_list, list):
+            raise ValueError(f"'{self.path}' 파일의 최상위 구조가 리스트가 아닙니다.")
+        weeks = {}
+        for week_data in scenarios_data_list:
+            if isinstance(week_data, dict) and str(week_data.get('week', '')).isdigit():
+                weeks[int(week_data['week'])] = week_data
+        return weeks
+
+# SCENARIO_SOURCE=file 이면 Firestore 대신 로컬 파일(SCENARIO_FILE)을 시나리오 원본으로 사용한다
+# (로컬 저장소를 쓰면 기본값이 file)
+SCENARIO_SOURCE = os.environ.get('SCENARIO_SOURCE', 'firestore' if STORAGE_BACKEND == 'firestore' else 'file')
+SCENARIO_FILE = os.environ.get('SCENARIO_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenario.json'))
+SCENARIO_FILE_CHECK_INTERVAL = 2 # 파일 stat 확인 주기 (초)
+
+if SCENARIO_SOURCE == 'file':
+    scenario_cache = FileScenarioCache(SCENARIO_FILE_CHECK_INTERVAL, SCENARIO_FILE)
+else:
+    scenario_cache = ScenarioCache(SCENARIO_VERSION_CHECK_INTERVAL)
+
+# --- 사용자 문서 캐시 ---
+# 한 번의 학습 흐름(주차 열기 -> 제출 -> 재제출)에서 같은 사용자 문서를 여러 번 읽으므로, 짧은 TTL로 프로세스 안에 보관한다.
+# 서버가 직접 쓰는 경우에는 즉시 무효화하고, 클라이언트가 Firestore에 직접 쓰는 변경은 TTL이 지나면 반영된다.
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '4096'))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '5'))
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+def get_user_data(email):
+    """
+    users/<email> 문서를 캐시를 거쳐 읽는다.
+    캐시 적중 시 문서 전체(liveCode, pauseState.code 등 큰 값 포함)를 깊은 복사하지 않도록 얕은 복사본에 쓰기 버퍼를 덧씌운다.
+    Returns:
+        dict | None: 사용자 데이터의 얕은 복사본 (최상위 키는 바꿔도 되지만 중첩된 dict/list는 캐시와 공유하므로 수정하지 않는다).
+                     문서가 없으면 None
+    """
+    user_data = user_cache.get(email)
+    if user_data is None:
+        user_doc = db.collection('users').document(email).get()
+        if not user_doc.exists:
+            return None # 가입 직후 조회가 막히지 않도록 '없음'은 캐시하지 않는다
+        user_data = user_doc.to_dict()
+        user_cache.set(email, user_data)
+    return write_buffer.overlay(f'users/{email}', dict(user_data))
+
+# 여러 학생 문서를 읽을 때: get_all 한 번에 최대 USER_FETCH_CHUNK개씩 묶고, 묶음들은 동시에 요청한다
+USER_FETCH_CHUNK = 100
+USER_FETCH_PARALLELISM = 8
+
+def fetch_users(emails, field_paths=None):
+    """
+    여러 사용자 문서를 배치로 읽는다 (필요한 필드만 가져오도록 field_paths로 제한 가능).
+    Returns:
+        list: 존재하는 문서의 dict 목록 (emails 순서 유지, 각 dict에 'email' 보장)
+    """
+    emails = list(dict.fromkeys(email for email in emails if email))
+    if not emails:
+        return []
+    users_ref = db.collection('users')
+    chunks = [[users_ref.document(email) for email in emails[i:i + USER_FETCH_CHUNK]]
+              for i in range(0, len(emails), USER_FETCH_CHUNK)]
+
+    def fetch_chunk(refs):
+        return [doc for doc in db.get_all(refs, field_paths=field_paths) if doc.exists]
+
+    if len(chunks) == 1:
+        fetched = [fetch_chunk(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(chunks), USER_FETCH_PARALLELISM), thread_name_prefix='user-fetch') as executor:
+            fetched = list(executor.map(with_request_stats(fetch_chunk), chunks))
+
+    by_email = {}
+    for docs in fetched:
+        for doc in docs:
+            user_data = doc.to_dict()
+            user_data.setdefault('email', doc.id)
+            by_email[doc.id] = write_buffer.overlay(f'users/{doc.id}', user_data, field_paths)
+    return [by_email[email] for email in emails if email in by_email]
+
+def invalidate_user(email):
+    """서버가 사용자 문서를 변경한 뒤 호출한다."""
+    user_cache.pop(email)
+
+# --- 쓰기 지연 버퍼 (write-behind) ---
+# 진행 상황, 일시정지, 인트로 확인, 실시간 코드처럼 수업 중 자주 들어오는 쓰기는 요청 스레드에서 바로 커밋하지 않고
+# 문서별로 모아 두었다가 짧은 주기로 배치 커밋한다. 같은 문서의 같은 필드는 마지막 값만 남고, ArrayUnion은 합쳐진다.
+# 아직 커밋되지 않은 값은 get_user_data / fetch_users 결과에 덧씌워서 이 서버에서는 바로 읽히도록 한다.
+WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', '0.5')) # 배치 커밋 주기 (초)
+
+class _ArrayUnion:
+    """버퍼 안에서 합쳐지는 중인 ArrayUnion 값"""
+    def __init__(self, values):
+        self.values = list(values)
+
+def _merge_field(older, newer):
+    if isinstance(newer, _ArrayUnion):
+        if isinstance(older, _ArrayUnion):
+            return _ArrayUnion(older.values + [v for v in newer.values if v not in older.values])
+        if isinstance(older, list):
+            return older + [v for v in newer.values if v not in older]
+    return newer
+
+class WriteBehindBuffer:
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = OrderedDict() # 문서 경로 -> (DocumentReference, {필드: 값}, 문서가 없으면 새로 만들지 여부)
+        self._inflight = {} # 커밋 중인 문서 경로 -> {필드: 값} (커밋과 캐시 무효화가 끝날 때까지 overlay에 보이도록)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self.flushed_writes = 0
+        self.coalesced_writes = 0
+        self.failed_commits = 0
+
+    def _ensure_thread(self):
+        # _lock 보유 상태에서 호출
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def update(self, doc_ref, fields, create=False):
+        """
+        문서의 최상위 필드들을 나중에 기록하도록 예약한다 (각 필드 값은 통째로 교체).
+        값으로 firestore.DELETE_FIELD, firestore.SERVER_TIMESTAMP, firestore.ArrayUnion([...])을 쓸 수 있다.
+        create=False이면 DocumentReference.update()처럼 문서가 있을 때만 기록되고, 없는 문서에 대한 쓰기는 커밋 시 버려진다.
+        """
+        with self._lock:
+            path = doc_ref.path
+            if path in self._pending:
+                _, pending_fields, _ = self._pending[path]
+                self.coalesced_writes += 1
+            else:
+                pending_fields = {}
+                self._pending[path] = (doc_ref, pending_fields, create)
+            for field, value in fields.items():
+                if isinstance(value, firestore.ArrayUnion):
+                    value = _ArrayUnion(value.values)
+                pending_fields[field] = _merge_field(pending_fields.get(field), value)
+            if not self._stopped:
+                self._ensure_thread()
+        if self._stopped: # 종료 중에 들어온 쓰기는 바로 커밋
+            self.flush()
+
+    def overlay(self, path, data, field_paths=None):
+        """아직 커밋되지 않은 필드를 읽은 문서 데이터(dict)에 덧씌운다 (서버 타임스탬프는 제외)."""
+        with self._lock:
+            entry = self._pending.get(path)
+            layers = [self._inflight.get(path), entry[1] if entry is not None else None]
+            for fields in layers:
+                if fields is None:
+                    continue
+                for field, value in fields.items():
+                    if field_paths is not None and not any(fp.split('.')[0] == field for fp in field_paths):
+                        continue
+                    if value is firestore.DELETE_FIELD:
+                        data.pop(field, None)
+                    elif isinstance(value, _ArrayUnion):
+                        current = data.get(field) if isinstance(data.get(field), list) else []
+                        data[field] = current + [v for v in value.values if v not in current]
+                    elif value is not firestore.SERVER_TIMESTAMP:
+                        data[field] = copy.deepcopy(value)
+            return data
+
+    def flush(self):
+        """모아 둔 쓰기를 배치로 커밋한다. 실패한 묶음은 그 사이 들어온 새 값을 덮어쓰지 않도록 다시 합쳐 둔다."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, OrderedDict()
+            for path, (_, fields, _) in pending.items():
+                self._inflight[path] = fields
+
+        entries = list(pending.items())
+        committed = 0
+        for offset in range(0, len(entries), FIRESTORE_BATCH_LIMIT):
+            chunk = entries[offset:offset + FIRESTORE_BATCH_LIMIT]
+            batch = db.batch()
+            for _, (doc_ref, fields, create) in chunk:
+                values = {
+                    field: firestore.ArrayUnion(value.values) if isinstance(value, _ArrayUnion) else value
+                    for field, value in fields.items()
+                }
+                if create:
+                    batch.set(doc_ref, values, merge=list(fields))
+                else:
+                    batch.update(doc_ref, values)
+            try:
+                batch.commit()
+            except Exception as e:
+                print(f"Write-behind commit failed ({len(chunk)} docs), will retry: {e}")
+                self.failed_commits += 1
+                if isinstance(e, NotFound):
+                    chunk = self._drop_missing(chunk)
+                self._requeue(chunk)
+                continue
+            committed += len(chunk)
+            for path, (doc_ref, _, _) in chunk:
+                if path.startswith('users/'):
+                    invalidate_user(doc_ref.id)
+            self._release(chunk)
+        self.flushed_writes += committed
+        return committed
+
+    def _release(self, chunk):
+        """커밋이 끝난 묶음을 in-flight 목록에서 뺀다 (그 사이 다른 flush가 같은 경로를 올렸으면 그대로 둔다)."""
+        with self._lock:
+            for path, (_, fields, _) in chunk:
+                if self._inflight.get(path) is fields:
+                    del self._inflight[path]
+
+    def _drop_missing(self, chunk):
+        """
+        update 대상 문서가 없어 실패한 묶음에서 없는 문서의 쓰기를 버린다 (가입하지 않은 이메일로 들어온 하트비트 등).
+        그대로 다시 넣으면 같은 문서 때문에 매번 배치 전체가 실패한다.
+        Returns:
+            list: 다시 시도할 나머지 항목
+        """
+        refs = [doc_ref for _, (doc_ref, _, create) in chunk if not create]
+        missing = {doc.reference.path for doc in db.get_all(refs, field_paths=[]) if not doc.exists}
+        if missing:
+            print(f"Write-behind: dropped writes to {len(missing)} missing docs: {sorted(missing)[:5]}")
+            self._release([item for item in chunk if item[0] in missing])
+        return [item for item in chunk if item[0] not in missing]
+
+    def _requeue(self, chunk):
+        with self._lock:
+            for path, (doc_ref, fields, create) in chunk:
+                if self._inflight.get(path) is fields:
+                    del self._inflight[path]
+                if path in self._pending:
+                    newer = self._pending[path][1]
+                    for field, value in newer.items():
+                        fields[field] = _merge_field(fields.get(field), value)
+                self._pending[path] = (doc_ref, fields, create)
+
+    def depth(self):
+        with self._lock:
+            return len(self._pending)
+
+    def snapshot(self):
+        return {
+            'pendingDocs': self.depth(), 'intervalSec': self.interval, 'flushedWrites': self.flushed_writes,
+            'coalescedWrites': self.coalesced_writes, 'failedCommits': self.failed_commits
+        }
+
+    def shutdown(self):
+        """프로세스 종료 시 남은 쓰기를 모두 커밋한다."""
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+write_buffer = WriteBehindBuffer(WRITE_BEHIND_INTERVAL)
+atexit.register(write_buffer.shutdown)
+
 # --- HTML 페이지 라우팅 ---
 @app.route('/')
 def home():
@@ -27,7 +841,7 @@ def home():
 
 @app.route('/monitor')
 def monitor():
-    return render_template('monitor.html')
+    return render_template('monitor.html', live_transport=monitor_live_transport())
 
 @app.route('/report')
 def report():
@@ -39,7 +853,7 @@ def growth():
 
 # --- API 엔드포인트 ---
 
-# 시나리오 데이터 가져오기 (수정 없음 - 이미 레벨별 콘텐츠 분기 구현됨)
+# 시나리오 데이터 가져오기 (레벨별 응답은 시나리오 캐시에서 미리 만들어 둔 것을 사용)
 @app.route('/api/scenario/week/<int:week_num>')
 def get_scenario(week_num):
     try:
@@ -47,61 +861,93 @@ def get_scenario(week_num):
         if not user_email:
             return jsonify({"status": "error", "message": "사용자 이메일 정보가 필요합니다."}), 400
 
-        user_doc_ref = db.collection('users').document(user_email)
-        user_doc = user_doc_ref.get()
-        if not user_doc.exists:
+        user_data = get_user_data(user_email)
+        if user_data is None:
             return jsonify({"status": "error", "message": "사용자 정보를 찾을 수 없습니다."}), 404
-        user_data = user_doc.to_dict()
         user_level = user_data.get('user_level', 'beginner')
 
-        doc_id = f'week_{week_num}'
-        scenario_doc = db.collection('scenarios').document(doc_id).get()
-        if not scenario_doc.exists:
+        payload = scenario_cache.get_payload(week_num, user_level)
+        if payload is None:
             if week_num > 1:
                  return jsonify({"status": "error", "message": "해당 주차의 시나리오를 찾을 수 없습니다."}), 404
             else:
                  return jsonify({"status": "error", "message": f"{week_num}주차 시나리오 문서를 찾을 수 없습니다."}), 404
 
-        scenario_data = scenario_doc.to_dict()
-        processed_cycles = []
-        original_cycles = scenario_data.get('cycles', [])
-
-        for cycle_data in original_cycles:
-            processed_cycle = copy.deepcopy(cycle_data) # Use deepcopy to avoid modifying original
+        # 레벨별 응답은 시나리오 버전마다 한 번만 만들어지며, 재검증 요청은 304로 끝난다
+        return send_scenario_payload(payload)
 
-            # Select appropriate content based on user level and availability of '_adv' fields
-            selected_starterCode = processed_cycle.get('starterCode', '')
-            if user_level == 'advanced' and 'starterCode_adv' in processed_cycle:
-                selected_starterCode = processed_cycle['starterCode_adv']
-
-            selected_task = processed_cycle.get('task', {})
-            if user_level == 'advanced' and 'task_adv' in processed_cycle:
-                selected_task = processed_cycle['task_adv']
+    except Exception as e:
+        print(f"Error in get_scenario (week {week_num}, user {user_email}): {e}")
+        return jsonify({"status": "error", "message": f"서버 오류 발생: {e}"}), 500
 
-            selected_briefing = processed_cycle.get('briefing', {})
-            if user_level == 'advanced' and 'briefing_adv' in processed_cycle:
-                selected_briefing = processed_cycle['briefing_adv']
+# 주차 목차 (사이클별 제목/syntax_key/filename만 포함, 레벨과 무관)
+@app.route('/api/scenario/week/<int:week_num>/manifest')
+def get_scenario_manifest(week_num):
+    try:
+        payload = scenario_cache.get_manifest(week_num)
+        if payload is None:
+            return jsonify({"status": "error", "message": "해당 주차의 시나리오를 찾을 수 없습니다."}), 404
+        return send_scenario_payload(payload)
+    except Exception as e:
+        print(f"Error in get_scenario_manifest (week {week_num}): {e}")
+        return jsonify({"status": "error", "message": f"서버 오류 발생: {e}"}), 500
 
-            # Overwrite the base keys with selected content
-            processed_cycle['starterCode'] = selected_starterCode
-            processed_cycle['task'] = selected_task
-            processed_cycle['briefing'] = selected_briefing
+# 사이클 한 개의 상세 정보 (get_scenario와 같은 레벨별 콘텐츠 선택 적용)
+@app.route('/api/scenario/week/<int:week_num>/cycle/<int:cycle_index>')
+def get_scenario_cycle(week_num, cycle_index):
+    user_email = request.args.get('userEmail')
+    try:
+        if not user_email:
+            return jsonify({"status": "error", "message": "사용자 이메일 정보가 필요합니다."}), 400
 
-            # Remove '_adv' keys from the final cycle data sent to frontend
-            processed_cycle.pop('starterCode_adv', None)
-            processed_cycle.pop('task_adv', None)
-            processed_cycle.pop('briefing_adv', None)
-            # ★★★ testCode_adv는 프론트엔드로 보내지 않으므로 여기서 제거 ★★★
-            processed_cycle.pop('testCode_adv', None)
+        user_data = get_user_data(user_email)
+        if user_data is None:
+            return jsonify({"status": "error", "message": "사용자 정보를 찾을 수 없습니다."}), 404
+        user_level = user_data.get('user_level', 'beginner')
 
-            processed_cycles.append(processed_cycle)
+        payload = scenario_cache.get_cycle_payload(week_num, user_level, cycle_index)
+        if payload is None:
+            return jsonify({"status": "error", "message": "해당 사이클을 찾을 수 없습니다."}), 404
+        return send_scenario_payload(payload)
+    except Exception as e:
+        print(f"Error in get_scenario_cycle (week {week_num}, cycle {cycle_index}, user {user_email}): {e}")
+        return jsonify({"status": "error", "message": f"서버 오류 발생: {e}"}), 500
 
-        scenario_data['cycles'] = processed_cycles
-        return jsonify(scenario_data)
+# --- 관리용 API 인증 ---
+# 관리용 API는 ADMIN_TOKEN을 아는 호출자만 쓸 수 있다 (Authorization: Bearer <토큰>).
+# ADMIN_TOKEN이 설정되지 않은 서버에서는 관리용 API가 모두 막힌다.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+def admin_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        auth = request.headers.get('Authorization', '')
+        token = auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+        if not ADMIN_TOKEN or not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+            return jsonify({"status": "error", "message": "관리자 인증이 필요합니다."}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+# 프로세스 내 캐시 상태 조회 (관리용)
+@app.route('/api/admin/cache/stats', methods=['GET'])
+@admin_required
+def get_cache_stats():
+    return jsonify({
+        "status": "success", "users": user_cache.stats(),
+        "gradeCache": grade_cache.stats(), "scenarios": scenario_cache.snapshot(),
+        "writeBehind": write_buffer.snapshot()
+    })
 
+# 시나리오 캐시 강제 갱신 (관리용)
+@app.route('/api/admin/scenarios/reload', methods=['POST'])
+@admin_required
+def reload_scenarios():
+    try:
+        scenario_cache.reload()
+        return jsonify({"status": "success", "message": "시나리오 캐시를 다시 불러왔습니다.", "scenarios": scenario_cache.snapshot()})
     except Exception as e:
-        print(f"Error in get_scenario (week {week_num}, user {user_email}): {e}")
-        return jsonify({"status": "error", "message": f"서버 오류 발생: {e}"}), 500
+        print(f"Error in reload_scenarios: {e}")
+        return jsonify({"status": "error", "message": f"시나리오 캐시 갱신 중 오류 발생: {e}"}), 500
 
 # 회원가입 (수정 없음)
 @app.route('/api/signup', methods=['POST'])
@@ -122,7 +968,7 @@ def signup():
         if user_doc.exists:
             return jsonify({"status": "error", "message": "이미 가입된 이메일입니다."}), 409
         else:
-            password_hash = generate_password_hash(password)
+            password_hash = run_blocking(generate_password_hash, password)
             users_ref.document(email).set({
                 'name': name,
                 'email': email,
@@ -133,6 +979,7 @@ def signup():
                 'lastSeenIntroWeek': 0,
                 'seenCodingIntros': []
             })
+            invalidate_user(email)
             return jsonify({"status": "success", "message": "회원가입이 완료되었습니다."}), 201
     except Exception as e:
         print(f"Error in signup: {e}")
@@ -150,13 +997,11 @@ def login():
              return jsonify({"status": "error", "message": "이메일과 비밀번호를 입력해주세요."}), 400
 
         user_ref = db.collection('users').document(email)
-        user_doc = user_ref.get()
+        user_data = get_user_data(email)
 
-        if not user_doc.exists:
+        if user_data is None:
             return jsonify({"status": "error", "message": "이메일 또는 비밀번호가 올바르지 않습니다."}), 401
 
-        user_data = user_doc.to_dict()
-
         # 로그인 성공 시 사용자 정보 가공 함수
         def process_login_success(user_data, user_ref):
             show_intro = False
@@ -165,6 +1010,7 @@ def login():
             if current_week > last_seen_week:
                 show_intro = True
                 user_ref.update({'lastSeenIntroWeek': current_week})
+                invalidate_user(email)
                 user_data['lastSeenIntroWeek'] = current_week
             user_data['showWeeklyIntro'] = show_intro
 
@@ -176,13 +1022,14 @@ def login():
             user_data.pop('password', None)
             return user_data
 
-        if 'passwordHash' in user_data and check_password_hash(user_data['passwordHash'], password):
+        if 'passwordHash' in user_data and run_blocking(check_password_hash, user_data['passwordHash'], password):
             processed_user_data = process_login_success(user_data, user_ref)
             return jsonify({"status": "success", "message": "로그인 성공!", "user": processed_user_data})
         elif 'password' in user_data and user_data['password'] == password:
             try:
-                password_hash = generate_password_hash(password)
+                password_hash = run_blocking(generate_password_hash, password)
                 user_ref.update({'passwordHash': password_hash, 'password': firestore.DELETE_FIELD})
+                invalidate_user(email)
                 print(f"Updated legacy password to hash for user: {email}")
             except Exception as update_err:
                 print(f"Failed to update legacy password hash for {email}: {update_err}")
@@ -208,13 +1055,11 @@ def update_user_level():
         if user_level not in ['beginner', 'advanced']:
             return jsonify({"status": "error", "message": "유효하지 않은 레벨 값입니다 ('beginner' 또는 'advanced')."}), 400
 
-        user_ref = db.collection('users').document(email)
-        user_doc = user_ref.get()
-
-        if not user_doc.exists:
+        if get_user_data(email) is None:
             return jsonify({"status": "error", "message": "사용자 정보를 찾을 수 없습니다."}), 404
 
-        user_ref.update({'user_level': user_level})
+        db.collection('users').document(email).update({'user_level': user_level})
+        invalidate_user(email)
 
         return jsonify({"status": "success", "message": "학습 레벨이 업데이트되었습니다."})
 
@@ -224,6 +1069,204 @@ def update_user_level():
 
 # --- ★★★★★ 여기부터 코드 제출 API 추가 ★★★★★ ---
 
+# --- 채점용 워커 풀 ---
+# 제출마다 새 파이썬 인터프리터를 띄우면 인터프리터 기동 비용이 요청 경로에 그대로 실린다.
+# 미리 띄워 둔 워커가 표준입력으로 코드를 받아 한 번 실행하고 종료하므로,
+# 제출 간 격리는 그대로 유지하면서 기동 비용만 요청 경로 밖으로 빼낸다.
+GRADER_POOL_SIZE = int(os.environ.get('GRADER_POOL_SIZE', '4')) # 0이면 매 제출마다 새로 띄움
+GRADER_PYTHON = os.environ.get('GRADER_PYTHON', sys.executable or 'python')
+GRADER_SOURCE_NAME = 'student_code.py' # 트레이스백에 표시될 파일 이름
+GRADER_OUTPUT_LIMIT = int(os.environ.get('GRADER_OUTPUT_LIMIT', str(64 * 1024))) # stdout/stderr 각각의 최대 바이트 수
+GRADER_MEMORY_LIMIT_MB = int(os.environ.get('GRADER_MEMORY_LIMIT_MB', '256')) # 워커 주소 공간 상한 (0이면 제한 없음)
+GRADER_CPU_LIMIT_SEC = int(os.environ.get('GRADER_CPU_LIMIT_SEC', '10')) # 워커 CPU 시간 상한 (0이면 제한 없음)
+
+# 워커 인터프리터가 실행하는 부트스트랩 코드.
+# 표준입력 전체를 소스로 읽은 뒤, 메모리/CPU 상한을 걸고 새 __main__ 모듈에서 실행한다.
+_GRADER_BOOTSTRAP = r"""
+import sys, os, types, linecache, traceback
+_name, _mem_mb, _cpu_sec = %r, %d, %d
+_src = sys.stdin.buffer.read().decode('utf-8')
+sys.stdin = open(os.devnull, encoding='utf-8')
+try:
+    import resource
+    if _mem_mb > 0:
+        resource.setrlimit(resource.RLIMIT_AS, (_mem_mb * 1024 * 1024,) * 2)
+    if _cpu_sec > 0:
+        _used = int(resource.getrusage(resource.RUSAGE_SELF).ru_utime) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (_used + _cpu_sec, _used + _cpu_sec + 1))
+except ImportError:
+    pass
+linecache.cache[_name] = (len(_src), None, _src.splitlines(True), _name)
+_mod = types.ModuleType('__main__')
+_mod.__file__ = _name
+sys.modules['__main__'] = _mod
+sys.argv = [_name]
+try:
+    exec(compile(_src, _name, 'exec'), _mod.__dict__)
+except SystemExit:
+    raise
+except BaseException as _e:
+    traceback.print_exception(type(_e), _e, _e.__traceback__.tb_next)
+    sys.exit(1)
+""" % (GRADER_SOURCE_NAME, GRADER_MEMORY_LIMIT_MB, GRADER_CPU_LIMIT_SEC)
+
+def _spawn_grader_worker():
+    """채점용 워커 인터프리터를 하나 띄운다. 코드는 아직 전달하지 않는다."""
+    return subprocess.Popen(
+        [GRADER_PYTHON, '-I', '-c', _GRADER_BOOTSTRAP],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=tempfile.gettempdir() # 학생 코드가 앱 디렉터리를 기준으로 실행되지 않도록
+    )
+
+def _collect_worker_output(process, timeout, limit):
+    """
+    워커의 stdout/stderr를 조금씩 읽어 스트림별로 limit 바이트까지만 보관한다.
+    상한을 넘거나 시간이 초과되면 즉시 프로세스를 종료한다.
+    Returns:
+        tuple: (stdout bytes, stderr bytes, 시간 초과 여부, 출력 잘림 여부)
+    """
+    deadline = time.monotonic() + timeout
+    buffers = {'stdout': bytearray(), 'stderr': bytearray()}
+    timed_out = truncated = False
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ, 'stdout')
+        selector.register(process.stderr, selectors.EVENT_READ, 'stderr')
+        while selector.get_map() and not truncated:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fd, 65536)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                buffer = buffers[key.data]
+                room = limit - len(buffer)
+                buffer += chunk[:room]
+                if len(chunk) > room:
+                    truncated = True
+    if not (timed_out or truncated):
+        # 출력 파이프가 닫혀도 프로세스는 계속 실행 중일 수 있으므로 남은 시간만큼 기다린다
+        try:
+            process.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            timed_out = True
+    if timed_out or truncated:
+        process.kill()
+        process.wait()
+    process.stdout.close()
+    process.stderr.close()
+    return bytes(buffers['stdout']), bytes(buffers['stderr']), timed_out, truncated
+
+class GraderPool:
+    """
+    미리 기동해 둔 채점 워커들을 보관하는 풀.
+    워커는 한 번 쓰고 버리며(재사용 없음), 꺼낼 때마다 백그라운드 스레드가 빈자리를 다시 채운다.
+    풀이 비어 있으면 그 자리에서 새 워커를 띄우므로 동작은 기존과 같고 느려질 뿐이다.
+    """
+    def __init__(self, size):
+        self.size = size
+        self._ready = queue.Queue()
+        self._refill_needed = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self.stats = {'runs': 0, 'warmHits': 0, 'coldSpawns': 0, 'totalQueueWaitMs': 0.0, 'totalExecMs': 0.0}
+
+    def _ensure_started(self):
+        # gunicorn 워커가 fork된 뒤 첫 사용 시점에 스레드를 시작한다 (import 시점에는 띄우지 않음)
+        if self._started or self.size <= 0:
+            return
+        with self._lock:
+            if self._started:
+                return
+            threading.Thread(target=self._refill_loop, name='grader-pool-refill', daemon=True).start()
+            self._started = True
+            self._refill_needed.set()
+
+    def _refill_loop(self):
+        while not self._closed:
+            self._refill_needed.wait()
+            self._refill_needed.clear()
+            while not self._closed and self._ready.qsize() < self.size:
+                try:
+                    self._ready.put(_spawn_grader_worker())
+                except Exception as e:
+                    print(f"Failed to spawn grader worker: {e}")
+                    time.sleep(1)
+                    break
+
+    def warm(self, timeout):
+        """
+        풀을 시작하고 워커가 모두 뜰 때까지(최대 timeout초) 기다린다 (워밍업용).
+        Returns:
+            int: 준비된 워커 수
+        """
+        self._ensure_started()
+        deadline = time.monotonic() + timeout
+        while self._ready.qsize() < self.size and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self._ready.qsize()
+
+    def acquire(self):
+        """
+        실행 대기 중인 워커 하나를 꺼낸다.
+        Returns:
+            tuple: (subprocess.Popen, 대기 시간(ms))
+        """
+        self._ensure_started()
+        started = time.monotonic()
+        process = None
+        while process is None:
+            try:
+                candidate = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            if candidate.poll() is None: # 대기 중 죽은 워커는 버린다
+                process = candidate
+        if process is None:
+            process = _spawn_grader_worker()
+            warm = False
+        else:
+            warm = True
+        self._refill_needed.set()
+        queue_wait_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self.stats['warmHits' if warm else 'coldSpawns'] += 1
+        return process, queue_wait_ms
+
+    def record_run(self, queue_wait_ms, exec_ms):
+        with self._lock:
+            self.stats['runs'] += 1
+            self.stats['totalQueueWaitMs'] += queue_wait_ms
+            self.stats['totalExecMs'] += exec_ms
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        runs = stats['runs']
+        stats['idleWorkers'] = self._ready.qsize()
+        stats['poolSize'] = self.size
+        stats['avgQueueWaitMs'] = round(stats['totalQueueWaitMs'] / runs, 2) if runs else 0
+        stats['avgExecMs'] = round(stats['totalExecMs'] / runs, 2) if runs else 0
+        return stats
+
+    def shutdown(self):
+        self._closed = True
+        self._refill_needed.set()
+        while True:
+            try:
+                process = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            process.kill()
+
+grader_pool = GraderPool(GRADER_POOL_SIZE)
+atexit.register(grader_pool.shutdown)
+
 def run_code_safely(student_code, test_code, timeout=5):
     """
     학생 코드와 테스트 코드를 결합하여 안전하게 실행하고 결과를 반환합니다.
@@ -232,49 +1275,277 @@ def run_code_safely(student_code, test_code, timeout=5):
         test_code (str): 검증에 사용할 테스트 코드
         timeout (int): 최대 실행 시간 (초)
     Returns:
-        dict: {'success': bool, 'output': str, 'error': str}
+        dict: {'success': bool, 'output': str, 'error': str, 'timing': dict}
               success: True면 성공, False면 실패
-              output: 표준 출력 내용
+              output: 표준 출력 내용 (최대 GRADER_OUTPUT_LIMIT 바이트)
               error: 표준 에러 내용 (AssertionError 포함)
+              timing: {'queueWaitMs': 워커 확보까지 걸린 시간, 'execMs': 실행 시간}
+              completed: 프로세스가 스스로 종료했는지 여부 (시간 초과/출력 초과/내부 오류면 False)
+              truncated: 출력 크기 제한을 넘어 실행이 중단되었는지 여부
     """
     full_code = student_code + "\n\n# --- Test Code ---\n" + test_code
 
-    # 임시 파일 생성 (utf-8 인코딩 명시)
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as tmp_file:
-        tmp_file.write(full_code)
-        tmp_file_path = tmp_file.name
-
     process = None
+    queue_wait_ms = 0.0
+    exec_started = time.monotonic()
     try:
-        # subprocess를 사용하여 별도의 프로세스에서 코드 실행
-        process = subprocess.Popen(
-            ['python', tmp_file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True, # 출력을 문자열로 받음
-            encoding='utf-8' # 인코딩 명시
-        )
-        stdout, stderr = process.communicate(timeout=timeout) # 시간 제한 설정
-
-        if process.returncode == 0 and not stderr:
+        # 미리 띄워 둔 워커에 코드를 넘겨 별도의 프로세스에서 실행
+        process, queue_wait_ms = grader_pool.acquire()
+        exec_started = time.monotonic()
+        try:
+            process.stdin.write(full_code.encode('utf-8'))
+            process.stdin.close()
+        except BrokenPipeError:
+            pass # 워커가 이미 종료됨 - 종료 코드로 실패 처리된다
+        stdout_bytes, stderr_bytes, timed_out, truncated = _collect_worker_output(process, timeout, GRADER_OUTPUT_LIMIT) # 시간/출력 제한 설정
+        stdout = stdout_bytes.decode('utf-8', errors='replace')
+        stderr = stderr_bytes.decode('utf-8', errors='replace')
+
+        if timed_out:
+            # 시간 초과 시 프로세스는 이미 강제 종료됨
+            result = {'success': False, 'output': '', 'error': f'실행 시간 초과 ({timeout}초)', 'completed': False, 'truncated': False}
+        elif truncated:
+            result = {
+                'success': False, 'output': stdout,
+                'error': f"출력 크기 제한 초과 ({GRADER_OUTPUT_LIMIT // 1024}KB) - 무한 반복 출력이 없는지 확인하세요.\n{stderr}".rstrip(),
+                'completed': False, 'truncated': True
+            }
+        elif process.returncode == 0 and not stderr:
             # 성공 (에러 없이 종료)
-            return {'success': True, 'output': stdout, 'error': ''}
+            result = {'success': True, 'output': stdout, 'error': '', 'completed': True, 'truncated': False}
         else:
             # 실패 (오류 발생 또는 비정상 종료)
             # AssertionError가 stderr로 나올 수 있음
             error_message = stderr if stderr else f"비정상 종료 (종료 코드: {process.returncode})"
-            return {'success': False, 'output': stdout, 'error': error_message}
+            result = {'success': False, 'output': stdout, 'error': error_message, 'completed': True, 'truncated': False}
 
-    except subprocess.TimeoutExpired:
-        if process:
-            process.kill() # 시간 초과 시 프로세스 강제 종료
-        return {'success': False, 'output': '', 'error': f'실행 시간 초과 ({timeout}초)'}
     except Exception as e:
-        return {'success': False, 'output': '', 'error': f'코드 실행 중 예상치 못한 오류: {e}'}
-    finally:
-        # 임시 파일 삭제
-        if os.path.exists(tmp_file_path):
-            os.remove(tmp_file_path)
+        if process and process.poll() is None:
+            process.kill()
+        result = {'success': False, 'output': '', 'error': f'코드 실행 중 예상치 못한 오류: {e}', 'completed': False, 'truncated': False}
+
+    exec_ms = (time.monotonic() - exec_started) * 1000
+    grader_pool.record_run(queue_wait_ms, exec_ms)
+    record_grader_timing(queue_wait_ms, exec_ms)
+    result['timing'] = {'queueWaitMs': round(queue_wait_ms, 2), 'execMs': round(exec_ms, 2)}
+    return result
+
+# --- 채점 결과 캐시 ---
+# 같은 코드/같은 테스트/같은 런타임이면 결과가 같으므로, 프로세스를 띄우지 않고 저장된 결과를 돌려준다.
+GRADE_CACHE_SIZE = int(os.environ.get('GRADE_CACHE_SIZE', '2048'))
+GRADE_CACHE_TTL = float(os.environ.get('GRADE_CACHE_TTL', '0')) or None # 0이면 만료 없음
+grade_cache = TTLCache(GRADE_CACHE_SIZE, GRADE_CACHE_TTL)
+_grader_runtime_version = None
+
+def get_grader_runtime_version():
+    """채점 워커 인터프리터의 버전 문자열 (캐시 키에 포함). 처음 한 번만 조회한다."""
+    global _grader_runtime_version
+    if _grader_runtime_version is None:
+        try:
+            _grader_runtime_version = subprocess.run(
+                [GRADER_PYTHON, '-I', '-c', 'import sys; print(sys.version)'],
+                capture_output=True, text=True, timeout=10
+            ).stdout.strip() or GRADER_PYTHON
+        except Exception:
+            _grader_runtime_version = GRADER_PYTHON
+    return _grader_runtime_version
+
+def normalize_student_code(code):
+    """줄바꿈 문자와 파일 끝 공백만 정리한다 (실행 결과가 달라질 수 있는 변형은 하지 않음)."""
+    return code.replace('\r\n', '\n').replace('\r', '\n').rstrip()
+
+def make_grade_cache_key(student_code, test_code, timeout):
+    hasher = hashlib.sha256()
+    for part in (get_grader_runtime_version(), str(timeout), normalize_student_code(student_code), test_code):
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+def grade_with_cache(student_code, test_code, timeout=5):
+    """
+    채점 결과 캐시를 먼저 조회하고, 없으면 run_code_safely로 실행한 뒤 저장한다.
+    시간 초과 등 프로세스가 정상 종료하지 않은 결과는 일시적일 수 있으므로 저장하지 않는다.
+    """
+    cache_key = make_grade_cache_key(student_code, test_code, timeout)
+    cached = grade_cache.get(cache_key)
+    if cached is not None:
+        result = dict(cached)
+        result['timing'] = {'queueWaitMs': 0, 'execMs': 0}
+        result['cached'] = True
+        return result
+
+    result = run_code_safely(student_code, test_code, timeout)
+    if result.get('completed'):
+        grade_cache.set(cache_key, result)
+    result = dict(result)
+    result['cached'] = False
+    return result
+
+# --- 비동기 작업 큐 ---
+# 요청 스레드가 오래 걸리는 작업(채점, 수업 재채점, 수업 삭제)이 끝날 때까지 묶여 있지 않도록, 작업을 큐에 넣고 작업 ID만 즉시 돌려준다.
+# 작업은 큐마다 동시 실행 수가 제한된 실행기에서 처리된다. 채점 결과는 /api/code/job/<job_id>로 조회한다.
+GRADING_CONCURRENCY = int(os.environ.get('GRADING_CONCURRENCY', '4'))
+GRADING_QUEUE_MAX = int(os.environ.get('GRADING_QUEUE_MAX', '200')) # 대기 작업 상한 (초과 시 503)
+GRADING_JOB_TTL = int(os.environ.get('GRADING_JOB_TTL', '600')) # 완료된 작업 결과 보관 시간 (초)
+GRADING_JOB_MAX_WAIT = 10 # 작업 조회 시 롱폴링 최대 대기 시간 (초)
+
+class JobQueue:
+    """동시 실행 수가 제한된 작업 큐 (채점, 재채점, 수업 삭제 등). 작업 상태와 대기/실행 시간 통계를 관리한다."""
+    def __init__(self, concurrency, max_pending, name='job'):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.name = name
+        self._executor = None
+        self._jobs = {} # job_id -> 작업 정보 dict
+        self._events = {} # job_id -> 완료 이벤트
+        self._lock = threading.Lock()
+        self.stats = {'submitted': 0, 'completed': 0, 'rejected': 0, 'totalWaitMs': 0.0, 'maxWaitMs': 0.0}
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=self.name)
+        return self._executor
+
+    def _prune(self):
+        # 보관 시간이 지난 완료 작업 정리 (lock 보유 상태에서 호출)
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finishedAt'] is not None and now - job['finishedAt'] > GRADING_JOB_TTL]
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
+            self._events.pop(job_id, None)
+
+    def depth(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['state'] == 'queued')
+
+    def submit(self, fn, *args, meta=None, with_progress=False):
+        """
+        작업을 큐에 넣는다. with_progress이면 fn에 report(progress) 콜백을 키워드 인자로 넘겨 진행 상황을 기록하게 한다.
+        Returns:
+            dict | None: 작업 정보. 대기 작업이 상한에 도달했으면 None
+        """
+        with self._lock:
+            self._prune()
+            pending = sum(1 for job in self._jobs.values() if job['state'] == 'queued')
+            if pending >= self.max_pending:
+                self.stats['rejected'] += 1
+                return None
+            job_id = uuid.uuid4().hex
+            job = {
+                'jobId': job_id, 'state': 'queued', 'meta': meta or {},
+                'enqueuedAt': time.time(), 'startedAt': None, 'finishedAt': None,
+                'waitMs': None, 'result': None, 'error': None, 'progress': None
+            }
+            self._jobs[job_id] = job
+            self._events[job_id] = threading.Event()
+            self.stats['submitted'] += 1
+        self._get_executor().submit(self._run, job_id, fn, args, with_progress)
+        return dict(job)
+
+    def _report_progress(self, job_id, progress):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job['progress'] = progress
+
+    def _run(self, job_id, fn, args, with_progress=False):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['state'] = 'running'
+            job['startedAt'] = time.time()
+            job['waitMs'] = round((job['startedAt'] - job['enqueuedAt']) * 1000, 2)
+            self.stats['totalWaitMs'] += job['waitMs']
+            self.stats['maxWaitMs'] = max(self.stats['maxWaitMs'], job['waitMs'])
+        metrics.observe('eduverse_job_queue_wait_seconds', job['waitMs'] / 1000, [('queue', self.name)], help_text='Time jobs spend queued')
+        kwargs = {'report': lambda progress: self._report_progress(job_id, progress)} if with_progress else {}
+        try:
+            result, error = fn(*args, **kwargs), None
+        except Exception as e:
+            print(f"Error in {self.name} {job_id}: {e}")
+            result, error = None, str(e)
+        with self._lock:
+            job['state'] = 'done' if error is None else 'error'
+            job['result'] = result
+            job['error'] = error
+            job['finishedAt'] = time.time()
+            self.stats['completed'] += 1
+            event = self._events.get(job_id)
+        if event:
+            event.set()
+
+    def get(self, job_id, wait=0):
+        """작업 정보를 조회한다. wait(초)가 주어지면 완료될 때까지 최대 그만큼 기다린다."""
+        with self._lock:
+            event = self._events.get(job_id)
+        if event is None:
+            return None
+        if wait > 0:
+            event.wait(wait)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def snapshot(self):
+        with self._lock:
+            states = Counter(job['state'] for job in self._jobs.values())
+            stats = dict(self.stats)
+        started = stats['submitted'] - states.get('queued', 0)
+        stats.update({
+            'concurrency': self.concurrency, 'maxPending': self.max_pending,
+            'queueDepth': states.get('queued', 0), 'running': states.get('running', 0),
+            'avgWaitMs': round(stats['totalWaitMs'] / started, 2) if started else 0
+        })
+        return stats
+
+grading_jobs = JobQueue(GRADING_CONCURRENCY, GRADING_QUEUE_MAX, name='grading-job')
+
+def build_submit_result(execution_result):
+    """채점 결과를 /api/code/submit 응답의 result 형식으로 변환한다."""
+    return {
+        "success": execution_result['success'],
+        "message": execution_result['error'], # 실패 시 에러 메시지 포함
+        "timing": execution_result['timing'], # 워커 대기/실행 시간 (ms)
+        "cached": execution_result['cached'], # 캐시된 채점 결과 여부
+        "truncated": execution_result.get('truncated', False) # 출력 크기 제한 초과 여부
+    }
+
+# 채점 워커 풀 상태 조회 (배포 규모 산정용)
+@app.route('/api/grader/stats', methods=['GET'])
+@admin_required
+def get_grader_stats():
+    return jsonify({
+        "status": "success", "grader": grader_pool.snapshot(),
+        "gradeCache": grade_cache.stats(), "jobs": grading_jobs.snapshot(), "regradeJobs": regrade_jobs.snapshot()
+    })
+
+# Prometheus 수집용 지표 (수집 설정의 authorization에 ADMIN_TOKEN을 넣는다)
+@app.route('/metrics', methods=['GET'])
+@admin_required
+def get_metrics():
+    grader = grader_pool.snapshot()
+    gauges = [
+        ('eduverse_grader_idle_workers', 'Pre-spawned grader workers ready to run', [((), grader['idleWorkers'])]),
+        ('eduverse_job_queue_depth', 'Queued jobs waiting for a worker thread',
+         [((('queue', jobs.name),), jobs.depth()) for jobs in (grading_jobs, regrade_jobs, class_deletion_jobs, stats_rebuild_jobs)]),
+        ('eduverse_write_behind_pending_docs', 'Documents with buffered, uncommitted writes', [((), write_buffer.depth())]),
+        ('eduverse_monitor_feeds', 'Open per-class monitor feeds', [((), len(_monitor_feeds))]),
+        ('eduverse_cache_entries', 'Entries in in-process caches',
+         [((('cache', name),), cache.stats()['size']) for name, cache in
+          (('users', user_cache), ('grades', grade_cache), ('inviteCodes', invite_code_cache))]),
+        ('eduverse_cache_hit_rate', 'Hit rate of in-process caches',
+         [((('cache', name),), cache.stats()['hitRate']) for name, cache in
+          (('users', user_cache), ('grades', grade_cache), ('inviteCodes', invite_code_cache))]),
+        ('eduverse_startup_phase_seconds', 'Time spent in each module load and warmup phase',
+         [((('phase', name),), ms / 1000) for name, ms in startup_phases.items()] +
+         [((('phase', f'warmup_{name}'),), ms / 1000) for name, ms in warmup.steps.items()]),
+        ('eduverse_warmup_ready', 'Whether the warmup finished successfully', [((), 1 if warmup.state == 'ready' else 0)]),
+    ]
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/code/submit', methods=['POST'])
 def submit_code():
@@ -289,19 +1560,15 @@ def submit_code():
             return jsonify({"status": "error", "message": "필수 정보(email, week, cycleIndex, studentCode)가 누락되었습니다."}), 400
 
         # 1. 사용자 레벨 조회
-        user_doc_ref = db.collection('users').document(email)
-        user_doc = user_doc_ref.get()
-        if not user_doc.exists:
+        user_data = get_user_data(email)
+        if user_data is None:
             return jsonify({"status": "error", "message": "사용자 정보를 찾을 수 없습니다."}), 404
-        user_data = user_doc.to_dict()
         user_level = user_data.get('user_level', 'beginner')
 
-        # 2. 시나리오 데이터 가져오기
-        doc_id = f'week_{week}'
-        scenario_doc = db.collection('scenarios').document(doc_id).get()
-        if not scenario_doc.exists:
+        # 2. 시나리오 데이터 가져오기 (프로세스 캐시)
+        scenario_data = scenario_cache.get_week(week)
+        if scenario_data is None:
             return jsonify({"status": "error", "message": f"{week}주차 시나리오를 찾을 수 없습니다."}), 404
-        scenario_data = scenario_doc.to_dict()
         cycles = scenario_data.get('cycles', [])
         if cycle_index < 0 or cycle_index >= len(cycles):
             return jsonify({"status": "error", "message": "유효하지 않은 사이클 인덱스입니다."}), 400
@@ -320,14 +1587,24 @@ def submit_code():
              # log_submission_to_firestore(email, class_id, week, cycle_index, True)
              return jsonify({"status": "success", "result": {"success": True, "message": ""}})
 
-        # 4. 코드 안전하게 실행
-        execution_result = run_code_safely(student_code, selected_test_code)
+        # 4-1. 비동기 모드: 채점 작업을 큐에 넣고 작업 ID를 즉시 반환
+        if data.get('mode') == 'async':
+            job = grading_jobs.submit(
+                lambda: build_submit_result(grade_with_cache(student_code, selected_test_code)),
+                meta={'email': email, 'week': week, 'cycleIndex': cycle_index}
+            )
+            if job is None:
+                return jsonify({"status": "error", "message": "채점 대기열이 가득 찼습니다. 잠시 후 다시 제출해주세요."}), 503
+            return jsonify({
+                "status": "success", "jobId": job['jobId'], "jobStatus": job['state'],
+                "queueDepth": grading_jobs.depth()
+            }), 202
+
+        # 4. 코드 안전하게 실행 (동일 코드/테스트의 이전 결과가 있으면 재사용)
+        execution_result = grade_with_cache(student_code, selected_test_code)
 
         # 5. 결과 반환
-        response_data = {
-            "success": execution_result['success'],
-            "message": execution_result['error'] # 실패 시 에러 메시지 포함
-        }
+        response_data = build_submit_result(execution_result)
 
         # (선택) 여기서 제출 로그 기록
         # class_id = user_data.get('classId') # classId 필요
@@ -341,6 +1618,25 @@ def submit_code():
         # 실제 운영 환경에서는 더 구체적인 오류 로깅 필요
         return jsonify({"status": "error", "message": f"코드 제출 처리 중 서버 오류 발생: {e}"}), 500
 
+# 비동기 채점 작업 조회 (wait 파라미터로 최대 GRADING_JOB_MAX_WAIT초까지 완료를 기다릴 수 있음)
+@app.route('/api/code/job/<job_id>', methods=['GET'])
+def get_grading_job(job_id):
+    wait = min(request.args.get('wait', 0, type=float), GRADING_JOB_MAX_WAIT)
+    job = grading_jobs.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({"status": "error", "message": "채점 작업을 찾을 수 없습니다."}), 404
+
+    response = {"status": "success", "jobId": job_id, "jobStatus": job['state'], "waitMs": job['waitMs']}
+    if job['state'] == 'queued':
+        response['queueDepth'] = grading_jobs.depth()
+    elif job['state'] == 'done':
+        response['result'] = job['result']
+    elif job['state'] == 'error':
+        response['status'] = 'error'
+        response['message'] = f"코드 제출 처리 중 서버 오류 발생: {job['error']}"
+        return jsonify(response), 500
+    return jsonify(response)
+
 # (선택) 제출 로그 기록 함수 (Firestore 사용 예시)
 # def log_submission_to_firestore(email, class_id, week, cycle_index, is_success, error_details=""):
 #     try:
@@ -361,6 +1657,148 @@ def submit_code():
 
 # --- ★★★★★ 코드 제출 API 추가 완료 ★★★★★ ---
 
+# --- 수업 소유권 확인 ---
+def check_class_owner(class_doc, instructor_email, action):
+    """
+    class_doc이 instructor_email의 수업인지 확인한다 (수업 재채점/삭제/로그 내보내기 공용).
+    Returns:
+        tuple | None: 거부할 때의 (응답, 상태 코드), 확인되면 None
+    """
+    if not class_doc.exists:
+        return jsonify({"status": "error", "message": "존재하지 않는 수업입니다."}), 404
+    if class_doc.to_dict().get('instructorEmail') != instructor_email:
+        return jsonify({"status": "error", "message": f"수업을 {action} 권한이 없습니다."}), 403
+    return None
+
+# --- 수업 단위 일괄 재채점 ---
+# 시나리오의 testCode가 수정되었을 때, 수업 전체 학생의 최근 코드(live_code)를 같은 채점 경로로 다시 채점한다.
+# 채점 한 건이 각각 별도 워커 프로세스에서 실행되므로, 스레드로 동시에 띄우면 여러 코어를 함께 사용한다.
+# 수업 전체 채점은 수 분이 걸릴 수 있으므로 요청 스레드에서 실행하지 않고 작업 큐에 넣어 jobId(202)를 돌려주며,
+# 진행 상황과 결과는 /api/classes/regrade/job/<jobId>로 조회한다.
+REGRADE_PARALLELISM = int(os.environ.get('REGRADE_PARALLELISM', str(os.cpu_count() or 2)))
+regrade_jobs = JobQueue(1, 20, name='class-regrade') # 작업 하나가 REGRADE_PARALLELISM개의 채점을 동시에 돌리므로 작업은 하나씩
+
+def regrade_class_data(class_data, week, cycle_index, cycle_data, report=None):
+    """
+    수업 학생 전체의 최근 코드를 다시 채점하고 결과를 사용자 문서(regradeResults)에 기록한다.
+    Returns:
+        dict: {'total', 'passed', 'failed', 'skipped', 'wallTimeMs'}
+    """
+    started = time.monotonic()
+    progress = {'phase': 'loading', 'graded': 0, 'total': 0}
+    progress_lock = threading.Lock()
+
+    def update_progress(**changes):
+        with progress_lock:
+            progress.update(changes)
+            if report:
+                report(dict(progress))
+
+    # 1. 학생들의 최근 코드와 레벨 조회
+    student_emails = class_data.get('students', [])
+    students = []
+    fetched = fetch_users(student_emails, field_paths=['liveCode', 'user_level'])
+    live_codes = live_code_store.get_many([student_data['email'] for student_data in fetched])
+    skipped = len(student_emails) - len(fetched) # 문서가 없는 학생
+    for student_data in fetched:
+        # live_code 문서가 없으면 예전 방식으로 users 문서에 저장된 liveCode 사용
+        live_code = live_codes.get(student_data['email']) or student_data.get('liveCode')
+        if not live_code:
+            skipped += 1
+            continue
+        test_code = cycle_data.get('testCode', '')
+        if student_data.get('user_level') == 'advanced' and 'testCode_adv' in cycle_data:
+            test_code = cycle_data['testCode_adv']
+        students.append((student_data['email'], live_code, test_code))
+
+    # 2. 동시 채점 (결과는 grade_with_cache를 거치므로 같은 코드는 한 번만 실행됨)
+    update_progress(phase='grading', total=len(students))
+
+    def grade_student(entry):
+        email, live_code, test_code = entry
+        result = {'success': True, 'error': ''} if not test_code else grade_with_cache(live_code, test_code)
+        with progress_lock:
+            progress['graded'] += 1
+        update_progress()
+        return email, result
+
+    with ThreadPoolExecutor(max_workers=max(1, REGRADE_PARALLELISM), thread_name_prefix='regrade') as executor:
+        results = list(executor.map(with_request_stats(grade_student), students))
+
+    # 3. 결과를 배치 단위로 사용자 문서에 기록
+    update_progress(phase='saving')
+    result_key = f'week_{week}_cycle_{cycle_index}'
+    passed = 0
+    for offset in range(0, len(results), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for email, result in results[offset:offset + FIRESTORE_BATCH_LIMIT]:
+            passed += 1 if result['success'] else 0
+            batch.set(db.collection('users').document(email), {'regradeResults': {result_key: {
+                'isSuccess': result['success'], 'error': str(result['error'])[:500],
+                'regradedAt': firestore.SERVER_TIMESTAMP
+            }}}, merge=True)
+        batch.commit()
+    for email, _ in results:
+        invalidate_user(email)
+    update_progress(phase='done')
+
+    return {
+        "total": len(results), "passed": passed, "failed": len(results) - passed, "skipped": skipped,
+        "wallTimeMs": round((time.monotonic() - started) * 1000, 2)
+    }
+
+@app.route('/api/classes/regrade', methods=['POST'])
+def regrade_class():
+    try:
+        data = request.get_json()
+        class_id = data.get('classId')
+        instructor_email = data.get('instructorEmail')
+        week = data.get('week')
+        cycle_index = data.get('cycleIndex')
+
+        if not all([class_id, instructor_email, isinstance(week, int), isinstance(cycle_index, int)]):
+            return jsonify({"status": "error", "message": "필수 정보(classId, instructorEmail, week, cycleIndex)가 누락되었습니다."}), 400
+
+        class_doc = db.collection('classes').document(class_id).get()
+        denied = check_class_owner(class_doc, instructor_email, '재채점할')
+        if denied:
+            return denied
+        class_data = class_doc.to_dict()
+
+        scenario_data = scenario_cache.get_week(week)
+        if scenario_data is None:
+            return jsonify({"status": "error", "message": f"{week}주차 시나리오를 찾을 수 없습니다."}), 404
+        cycles = scenario_data.get('cycles', [])
+        if cycle_index < 0 or cycle_index >= len(cycles):
+            return jsonify({"status": "error", "message": "유효하지 않은 사이클 인덱스입니다."}), 400
+
+        job = regrade_jobs.submit(regrade_class_data, class_data, week, cycle_index, cycles[cycle_index],
+                                  meta={'classId': class_id, 'week': week, 'cycleIndex': cycle_index}, with_progress=True)
+        if job is None:
+            return jsonify({"status": "error", "message": "진행 중인 재채점 작업이 많습니다. 잠시 후 다시 시도해주세요."}), 503
+        return jsonify({"status": "success", "message": "재채점을 시작했습니다.", "jobId": job['jobId'], "jobStatus": job['state']}), 202
+    except Exception as e:
+        print(f"Error in regrade_class: {e}")
+        return jsonify({"status": "error", "message": f"재채점 중 오류 발생: {e}"}), 500
+
+# 재채점 작업 진행 상황/결과 조회 (wait 파라미터로 최대 GRADING_JOB_MAX_WAIT초까지 완료를 기다릴 수 있음)
+@app.route('/api/classes/regrade/job/<job_id>', methods=['GET'])
+def get_regrade_job(job_id):
+    wait = min(request.args.get('wait', 0, type=float), GRADING_JOB_MAX_WAIT)
+    job = regrade_jobs.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({"status": "error", "message": "재채점 작업을 찾을 수 없습니다."}), 404
+
+    response = {"status": "success", "jobId": job_id, "jobStatus": job['state'], "progress": job['progress']}
+    if job['state'] == 'done':
+        response['message'] = "재채점이 완료되었습니다."
+        response.update(job['result'])
+    elif job['state'] == 'error':
+        response['status'] = 'error'
+        response['message'] = f"재채점 중 오류 발생: {job['error']}"
+        return jsonify(response), 500
+    return jsonify(response)
+
 # --- 나머지 기존 API들 (수정 없음) ---
 
 # 진행 상황 업데이트
@@ -375,28 +1813,178 @@ def update_progress():
         if not isinstance(progress, dict) or 'week' not in progress or 'cycle' not in progress:
              return jsonify({"status": "error", "message": "올바른 progress 형식이 아닙니다 (예: {'week': 1, 'cycle': 0})."}), 400
 
-        db.collection('users').document(email).update({'progress': progress})
+        if get_user_data(email) is None:
+            return jsonify({"status": "error", "message": "사용자 정보를 찾을 수 없습니다."}), 404
+        write_buffer.update(db.collection('users').document(email), {'progress': progress})
         return jsonify({"status": "success", "message": "진행 상황이 저장되었습니다."})
     except Exception as e:
         print(f"Error in update_progress: {e}")
         return jsonify({"status": "error", "message": f"서버 오류: {e}"}), 500
 
+# --- 실시간 코드 동기화 ---
+# 에디터 내용 전체를 users 문서에 매번 덮어쓰는 대신, 클라이언트는 서버가 가진 기준본에 대한 버전별 패치만 보낸다.
+#   live_code/{email} = {snapshot, snapshotVersion, patches: [{v, from, to, text}], version, updatedAt}
+# 패치는 문서에 덧붙이기만 하고, 일정 개수/크기가 쌓이면 현재 코드를 새 스냅샷으로 압축(compaction)한다.
+# 위치(from, to)는 유니코드 코드 포인트 기준이다.
+LIVE_CODE_COLLECTION = 'live_code'
+LIVE_CODE_MAX_CHARS = int(os.environ.get('LIVE_CODE_MAX_CHARS', '20000')) # 저장 가능한 코드 최대 길이
+LIVE_CODE_CACHE_SIZE = int(os.environ.get('LIVE_CODE_CACHE_SIZE', '2048')) # 메모리에 들고 있는 학생 수 (넘으면 오래 안 쓴 학생부터 방출)
+LIVE_CODE_CACHE_TTL = float(os.environ.get('LIVE_CODE_CACHE_TTL', '1800')) # 이 시간이 지나면 문서에서 다시 복원 (초)
+LIVE_CODE_COMPACT_EVERY = 20 # 스냅샷 이후 패치가 이 개수에 이르면 압축
+LIVE_CODE_COMPACT_CHARS = 4000 # 또는 패치 텍스트 합이 이 길이에 이르면 압축
+
+class LiveCodeConflict(Exception):
+    """클라이언트의 기준 버전이 서버와 다를 때 (순서가 뒤바뀐 패치 또는 서버 재시작)"""
+    def __init__(self, version):
+        super().__init__(f"live code version conflict (server: {version})")
+        self.version = version
+
+def apply_code_patch(code, patch):
+    start, end, text = int(patch['from']), int(patch['to']), str(patch.get('text', ''))
+    if not 0 <= start <= end <= len(code):
+        raise ValueError(f"패치 범위가 올바르지 않습니다: {start}-{end} (길이 {len(code)})")
+    return code[:start] + text + code[end:]
+
+def materialize_live_code(data):
+    """
+    live_code 문서(스냅샷 + 패치 목록)에서 현재 코드를 만든다.
+    여러 인스턴스의 쓰기 지연 반영 순서가 엇갈려 패치 범위가 맞지 않는 문서는 예외 대신 스냅샷을 돌려준다
+    (다음 전체 코드 재동기화 때 바로잡힘).
+    """
+    snapshot = data.get('snapshot', '')
+    code = snapshot
+    try:
+        for patch in sorted(data.get('patches', []), key=lambda p: p['v']):
+            code = apply_code_patch(code, patch)
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Inconsistent live code document, falling back to snapshot: {e}")
+        return snapshot
+    return code
+
+class LiveCodeStore:
+    """
+    학생별 현재 코드와 버전을 메모리에 들고 패치를 검증/적용한 뒤 live_code 문서에 기록한다.
+    메모리에 없으면(서버 재시작, 캐시 방출/만료) 문서에서 한 번 복원한다.
+    """
+    def __init__(self):
+        self._entries = TTLCache(LIVE_CODE_CACHE_SIZE, LIVE_CODE_CACHE_TTL) # email -> {'code', 'version', 'patches', 'patchChars', 'lock'}
+        self._lock = threading.Lock()
+
+    def _ref(self, email):
+        return db.collection(LIVE_CODE_COLLECTION).document(email)
+
+    def _entry(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                entry = {'code': None, 'lock': threading.Lock()}
+                self._entries.set(email, entry)
+            return entry
+
+    def _load(self, email, entry, include_code=True):
+        # entry['lock'] 보유 상태에서 호출. 전체 코드 재동기화에는 버전만 필요하므로 include_code=False로 version만 읽는다
+        ref = self._ref(email)
+        if not include_code:
+            doc = ref.get(field_paths=['version'])
+            data = write_buffer.overlay(ref.path, doc.to_dict() if doc.exists else {}, ['version'])
+            entry.update({'version': data.get('version', 0), 'patches': 0, 'patchChars': 0})
+            return
+        doc = ref.get()
+        data = write_buffer.overlay(ref.path, doc.to_dict() if doc.exists else {})
+        patches = data.get('patches', [])
+        entry.update({
+            'code': materialize_live_code(data), 'version': data.get('version', 0),
+            'patches': len(patches), 'patchChars': sum(len(p.get('text', '')) for p in patches)
+        })
+
+    def apply(self, email, base_version=None, patch=None, full_code=None):
+        """
+        full_code가 있으면 전체 코드로 다시 맞추고(스냅샷 기록), 없으면 base_version 위에 patch를 적용한다.
+        Returns:
+            int: 새 버전
+        Raises:
+            LiveCodeConflict: base_version이 서버의 현재 버전과 다를 때 (쓰기 없음)
+            ValueError: 패치가 잘못되었거나 코드가 최대 길이를 넘을 때
+        """
+        entry = self._entry(email)
+        with entry['lock']:
+            if entry['code'] is None and (full_code is None or 'version' not in entry):
+                self._load(email, entry, include_code=full_code is None)
+            if full_code is None and base_version != entry['version']:
+                raise LiveCodeConflict(entry['version'])
+
+            code = full_code if full_code is not None else apply_code_patch(entry['code'], patch)
+            if len(code) > LIVE_CODE_MAX_CHARS:
+                raise ValueError(f"코드가 너무 깁니다 (최대 {LIVE_CODE_MAX_CHARS}자).")
+            version = entry['version'] + 1
+
+            compact = full_code is not None or entry['patches'] + 1 >= LIVE_CODE_COMPACT_EVERY \
+                or entry['patchChars'] + len(patch.get('text', '')) >= LIVE_CODE_COMPACT_CHARS
+            if compact:
+                write_buffer.update(self._ref(email), {
+                    'snapshot': code, 'snapshotVersion': version, 'patches': [],
+                    'version': version, 'updatedAt': firestore.SERVER_TIMESTAMP
+                }, create=True)
+                entry.update({'patches': 0, 'patchChars': 0})
+            else:
+                stored_patch = {'v': version, 'from': int(patch['from']), 'to': int(patch['to']), 'text': str(patch.get('text', ''))}
+                write_buffer.update(self._ref(email), {
+                    'patches': firestore.ArrayUnion([stored_patch]),
+                    'version': version, 'updatedAt': firestore.SERVER_TIMESTAMP
+                }, create=True)
+                entry['patches'] += 1
+                entry['patchChars'] += len(stored_patch['text'])
+            entry.update({'code': code, 'version': version})
+            return version
+
+    def get_many(self, emails):
+        """
+        학생들의 현재 코드를 한 번에 조회한다 (메모리에 있으면 그대로, 없으면 live_code 문서 일괄 조회).
+        Returns:
+            dict: {email: code} - 코드가 없는 학생은 제외
+        """
+        codes, missing = {}, []
+        for email in emails:
+            entry = self._entries.get(email)
+            if entry is not None and entry['code'] is not None:
+                codes[email] = entry['code']
+            else:
+                missing.append(email)
+        for offset in range(0, len(missing), USER_FETCH_CHUNK):
+            refs = [self._ref(email) for email in missing[offset:offset + USER_FETCH_CHUNK]]
+            for doc in db.get_all(refs): # 방출된 학생의 코드가 아직 쓰기 버퍼에만 있을 수 있으므로 없는 문서에도 덧씌운다
+                codes[doc.id] = materialize_live_code(write_buffer.overlay(doc.reference.path, doc.to_dict() if doc.exists else {}))
+        return {email: code for email, code in codes.items() if code}
+
+live_code_store = LiveCodeStore()
+
 # 실시간 코드 업데이트
+# 요청 본문: {email, baseVersion, patch: {from, to, text}} 또는 처음/재동기화 시 {email, liveCode}
+# 기준 버전이 맞지 않으면 쓰기 없이 409와 서버 버전을 돌려주고, 클라이언트는 전체 코드로 다시 맞춘다.
+# 코드 편집은 접속 상태(presence)의 활동으로도 기록된다.
 @app.route('/api/livecode/update', methods=['POST'])
 def update_live_code():
     try:
         data = request.get_json()
         email = data.get('email')
-        live_code = data.get('liveCode', '')
         if not email:
             return jsonify({"status": "error", "message": "사용자 이메일 정보가 없습니다."}), 400
+        if 'liveCode' not in data and not isinstance(data.get('patch'), dict):
+            return jsonify({"status": "error", "message": "liveCode 또는 patch 정보가 필요합니다."}), 400
+
+        try:
+            if 'liveCode' in data:
+                version = live_code_store.apply(email, full_code=str(data.get('liveCode') or ''))
+            else:
+                version = live_code_store.apply(email, base_version=data.get('baseVersion'), patch=data['patch'])
+        except LiveCodeConflict as e:
+            return jsonify({"status": "error", "code": "version_conflict", "message": "코드 버전이 맞지 않습니다. 전체 코드를 다시 보내주세요.", "version": e.version}), 409
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({"status": "error", "message": f"잘못된 코드 패치입니다: {e}"}), 400
 
-        db.collection('users').document(email).set({
-            'liveCode': live_code,
-            'lastActive': firestore.SERVER_TIMESTAMP
-        }, merge=True)
+        presence.touch(email)
 
-        return jsonify({"status": "success"})
+        return jsonify({"status": "success", "version": version})
     except Exception as e:
         # print(f"Error in update_live_code: {e}")
         return jsonify({"status": "error", "message": f"코드 업데이트 중 오류 발생: {e}"}), 500
@@ -413,7 +2001,9 @@ def set_pause_state():
         if not isinstance(pause_state, dict) or 'view' not in pause_state or 'code' not in pause_state:
              return jsonify({"status": "error", "message": "올바른 pauseState 형식이 아닙니다 (예: {'view': 'dashboard', 'code': '...'})."}), 400
 
-        db.collection('users').document(email).update({'pauseState': pause_state})
+        if get_user_data(email) is None:
+            return jsonify({"status": "error", "message": "사용자 정보를 찾을 수 없습니다."}), 404
+        write_buffer.update(db.collection('users').document(email), {'pauseState': pause_state})
         return jsonify({"status": "success", "message": "일시정지 상태가 저장되었습니다."})
     except Exception as e:
         print(f"Error in set_pause_state: {e}")
@@ -428,7 +2018,9 @@ def clear_pause_state():
         if not email:
             return jsonify({"status": "error", "message": "이메일 정보가 없습니다."}), 400
 
-        db.collection('users').document(email).update({'pauseState': firestore.DELETE_FIELD})
+        if get_user_data(email) is None:
+            return jsonify({"status": "error", "message": "사용자 정보를 찾을 수 없습니다."}), 404
+        write_buffer.update(db.collection('users').document(email), {'pauseState': firestore.DELETE_FIELD})
         return jsonify({"status": "success", "message": "일시정지 상태가 해제되었습니다."})
     except Exception as e:
         print(f"Error in clear_pause_state: {e}")
@@ -438,6 +2030,106 @@ def clear_pause_state():
 def generate_invite_code(length=6):
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
+# --- 초대 코드 색인 ---
+# invite_codes/{code} = {classId, createdAt}. 수업 생성 시 수업 문서와 같은 배치에서 create()로 예약하므로
+# 이미 쓰인 코드면 배치 전체가 실패하고 새 코드로 다시 시도한다. 참여 시에는 쿼리 대신 문서 하나만 읽는다.
+# 색인 도입 전에 만든 수업은 backfill_invite_codes()로 한 번에 채울 수 있고 (/api/admin/invite-codes/backfill 또는 backfill_invite_codes.py),
+# 채우기 전이라도 색인에 없는 코드는 기존 쿼리로 한 번 찾아 그 수업의 색인을 만들어 둔다 (참여 시 지연 보충).
+INVITE_CODE_COLLECTION = 'invite_codes'
+INVITE_CODE_MAX_ATTEMPTS = 10
+INVITE_CODE_CACHE_SIZE = 1024
+INVITE_CODE_CACHE_TTL = 300 # 초대 코드 -> 수업 ID 매핑 캐시 유지 시간 (초). 삭제된 수업은 수업 문서 조회에서 걸러진다
+invite_code_cache = TTLCache(INVITE_CODE_CACHE_SIZE, INVITE_CODE_CACHE_TTL)
+
+def _invite_code_ref(code):
+    return db.collection(INVITE_CODE_COLLECTION).document(code)
+
+def normalize_invite_code(code):
+    return str(code).strip().upper()
+
+def resolve_invite_code(code):
+    """
+    초대 코드에 해당하는 수업 ID를 찾는다 (캐시 -> 색인 문서 -> 색인이 없으면 기존 쿼리로 찾고 색인 보충).
+    Returns:
+        str | None: 수업 ID
+    """
+    class_id = invite_code_cache.get(code)
+    if class_id is not None:
+        return class_id
+    index_doc = _invite_code_ref(code).get()
+    class_id = index_doc.to_dict().get('classId') if index_doc.exists else _backfill_invite_code(code)
+    if class_id is None:
+        return None
+    invite_code_cache.set(code, class_id)
+    return class_id
+
+def _backfill_invite_code(code):
+    """
+    색인에 없는 코드를 색인 도입 전 방식(classes의 inviteCode 쿼리)으로 찾고, 찾으면 그 수업의 색인을 만든다.
+    Returns:
+        str | None: 수업 ID
+    """
+    legacy_doc = next(db.collection('classes').where('inviteCode', '==', code).select(['inviteCode']).limit(1).stream(), None)
+    if legacy_doc is None:
+        return None
+    try:
+        _invite_code_ref(code).create({'classId': legacy_doc.id, 'createdAt': firestore.SERVER_TIMESTAMP})
+    except AlreadyExists: # 다른 요청이 먼저 채움
+        return (_invite_code_ref(code).get().to_dict() or {}).get('classId')
+    print(f"Invite code index: backfilled {code} -> {legacy_doc.id}")
+    return legacy_doc.id
+
+def backfill_invite_codes():
+    """
+    색인이 없는 기존 수업의 초대 코드를 invite_codes에 채운다 (여러 번 실행해도 안전).
+    서로 다른 수업이 같은 코드를 쓰고 있으면 먼저 색인된 수업을 유지하고 충돌 목록으로 돌려준다.
+    Returns:
+        dict: {'classes': 확인한 수업 수, 'created': 새로 만든 색인 수, 'conflicts': [{'inviteCode', 'classId', 'indexedClassId'}, ...]}
+    """
+    codes = {} # 초대 코드 -> 수업 ID
+    conflicts = []
+    class_count = 0
+    for doc in db.collection('classes').select(['inviteCode']).stream():
+        class_count += 1
+        code = (doc.to_dict() or {}).get('inviteCode')
+        if not code:
+            continue
+        if code in codes:
+            conflicts.append({'inviteCode': code, 'classId': doc.id, 'indexedClassId': codes[code]})
+            continue
+        codes[code] = doc.id
+
+    created = 0
+    items = list(codes.items())
+    for offset in range(0, len(items), FIRESTORE_BATCH_LIMIT):
+        chunk = items[offset:offset + FIRESTORE_BATCH_LIMIT]
+        existing = {doc.id: (doc.to_dict() or {}).get('classId')
+                    for doc in db.get_all([_invite_code_ref(code) for code, _ in chunk]) if doc.exists}
+        batch = db.batch()
+        writes = 0
+        for code, class_id in chunk:
+            if code in existing:
+                if existing[code] != class_id:
+                    conflicts.append({'inviteCode': code, 'classId': class_id, 'indexedClassId': existing[code]})
+                continue
+            batch.set(_invite_code_ref(code), {'classId': class_id, 'createdAt': firestore.SERVER_TIMESTAMP})
+            writes += 1
+        if writes:
+            batch.commit()
+            created += writes
+    return {'classes': class_count, 'created': created, 'conflicts': conflicts}
+
+# 초대 코드 색인 보충 (관리용) - 색인 도입 전에 만든 수업이 있으면 배포 후 한 번 실행
+@app.route('/api/admin/invite-codes/backfill', methods=['POST'])
+@admin_required
+def backfill_invite_code_index():
+    try:
+        result = backfill_invite_codes()
+        return jsonify({"status": "success", "message": f"{result['created']}개의 초대 코드 색인을 만들었습니다.", **result})
+    except Exception as e:
+        print(f"Error in backfill_invite_code_index: {e}")
+        return jsonify({"status": "error", "message": f"초대 코드 색인 보충 중 오류 발생: {e}"}), 500
+
 # 수업 목록 가져오기
 @app.route('/api/classes', methods=['GET'])
 def get_classes():
@@ -475,16 +2167,30 @@ def create_class():
         section = class_details.get('section', '--')
         class_name = f"[{year} {semester}] {subject} ({department} {section}분반)"
 
-        invite_code = generate_invite_code()
         new_class_ref = db.collection('classes').document()
         class_id = new_class_ref.id
 
-        new_class_data = {
-            'classId': class_id, 'className': class_name, 'details': class_details,
-            'instructorEmail': instructor_email, 'inviteCode': invite_code,
-            'students': [], 'createdAt': firestore.SERVER_TIMESTAMP
-        }
-        new_class_ref.set(new_class_data)
+        for _ in range(INVITE_CODE_MAX_ATTEMPTS):
+            invite_code = generate_invite_code()
+            if resolve_invite_code(invite_code) is not None: # 아직 색인되지 않은 기존 수업의 코드인 경우
+                continue
+            new_class_data = {
+                'classId': class_id, 'className': class_name, 'details': class_details,
+                'instructorEmail': instructor_email, 'inviteCode': invite_code,
+                'students': [], 'createdAt': firestore.SERVER_TIMESTAMP
+            }
+            batch = db.batch()
+            batch.set(new_class_ref, new_class_data)
+            batch.create(_invite_code_ref(invite_code), {'classId': class_id, 'createdAt': firestore.SERVER_TIMESTAMP})
+            # 새 수업은 집계할 로그가 없으므로 빈 집계 문서로 시작한다
+            batch.set(_class_stats_ref(class_id), {'classId': class_id, 'totalSubmissions': 0, 'successSubmissions': 0, 'totalReflections': 0, 'initialized': True})
+            try:
+                batch.commit()
+                break
+            except AlreadyExists: # 다른 요청이 같은 코드를 먼저 예약함
+                continue
+        else:
+            return jsonify({"status": "error", "message": "초대 코드를 만들지 못했습니다. 잠시 후 다시 시도해주세요."}), 503
 
         response_data = new_class_data.copy()
         response_data.pop('createdAt', None)
@@ -494,7 +2200,112 @@ def create_class():
         print(f"Error in create_class: {e}")
         return jsonify({"status": "error", "message": f"수업 개설 중 오류 발생: {e}"}), 500
 
+# --- 수업 삭제 ---
+# 학생 문서 정리는 FIRESTORE_BATCH_LIMIT 단위 배치로 나눠 동시에 커밋하고, cascade이면 수업의 질문/제출 로그/회고와
+# 분석 집계도 페이지 단위로 지운다. 수업 문서와 초대 코드는 마지막에 지우므로 중간에 실패해도 같은 요청으로 다시 시도할 수 있다.
+CLASS_DELETE_PARALLELISM = int(os.environ.get('CLASS_DELETE_PARALLELISM', '4'))
+CLASS_CASCADE_COLLECTIONS = ['questions', 'submission_logs', 'reflections']
+class_deletion_jobs = JobQueue(2, 20, name='class-delete')
+
+def _commit_in_batches(writes, on_commit=None):
+    """
+    (op, ref, data) 목록을 FIRESTORE_BATCH_LIMIT 단위 배치로 나눠 동시에 커밋한다.
+    Returns:
+        int: 커밋된 쓰기 수
+    """
+    chunks = [writes[i:i + FIRESTORE_BATCH_LIMIT] for i in range(0, len(writes), FIRESTORE_BATCH_LIMIT)]
+
+    def commit_chunk(chunk):
+        batch = db.batch()
+        for op, ref, data in chunk:
+            if op == 'delete':
+                batch.delete(ref)
+            else:
+                batch.update(ref, data)
+        batch.commit()
+        if on_commit:
+            on_commit(len(chunk))
+        return len(chunk)
+
+    if len(chunks) <= 1:
+        return sum(commit_chunk(chunk) for chunk in chunks)
+    with ThreadPoolExecutor(max_workers=min(len(chunks), CLASS_DELETE_PARALLELISM), thread_name_prefix='class-delete') as executor:
+        return sum(executor.map(with_request_stats(commit_chunk), chunks))
+
+def _delete_query_in_pages(query, on_commit=None):
+    """쿼리 결과가 빌 때까지 FIRESTORE_BATCH_LIMIT개씩 읽어 지운다."""
+    deleted = 0
+    while True:
+        refs = [doc.reference for doc in query.select(['__name__']).limit(FIRESTORE_BATCH_LIMIT).stream()]
+        if not refs:
+            return deleted
+        deleted += _commit_in_batches([('delete', ref, None) for ref in refs], on_commit)
+
+def delete_class_data(class_id, class_data, cascade=False, report=None):
+    """
+    수업과 관련 데이터를 지운다.
+    Returns:
+        dict: {'students': 수업 명단의 학생 수, 'unlinked': 연결을 해제한 학생 수, 'deleted': {컬렉션: 삭제 문서 수}}
+    """
+    progress = {'phase': 'students', 'committedWrites': 0}
+    progress_lock = threading.Lock()
+
+    def on_commit(count):
+        with progress_lock:
+            progress['committedWrites'] += count
+            if report:
+                report(dict(progress))
+
+    def set_phase(phase):
+        with progress_lock:
+            progress['phase'] = phase
+            if report:
+                report(dict(progress))
+
+    # 1. 학생 문서에서 수업 연결 해제 (배치로 나눠 동시 커밋)
+    # 문서가 없는 학생에게 update를 보내면 NotFound로 배치 전체가 실패하고 재시도해도 같은 곳에서 멈추므로,
+    # 먼저 문서를 읽어 아직 이 수업에 연결된 학생만 고른다 (다른 수업으로 옮긴 학생의 classId도 건드리지 않음)
+    student_emails = class_data.get('students', [])
+    set_phase('students')
+    linked_refs = []
+    for offset in range(0, len(student_emails), FIRESTORE_BATCH_LIMIT):
+        refs = [db.collection('users').document(email) for email in student_emails[offset:offset + FIRESTORE_BATCH_LIMIT]]
+        linked_refs += [doc.reference for doc in db.get_all(refs, field_paths=['classId'])
+                        if doc.exists and (doc.to_dict() or {}).get('classId') == class_id]
+    _commit_in_batches([('update', ref, {'classId': firestore.DELETE_FIELD}) for ref in linked_refs], on_commit)
+    for email in student_emails:
+        invalidate_user(email)
+
+    # 2. (선택) 질문/제출 로그/회고와 분석 집계 삭제 - 컬렉션별로 동시에 페이지 단위 삭제
+    deleted = {}
+    if cascade:
+        set_phase('cascade')
+        with ThreadPoolExecutor(max_workers=len(CLASS_CASCADE_COLLECTIONS), thread_name_prefix='class-cascade') as executor:
+            delete_collection = with_request_stats(
+                lambda name: _delete_query_in_pages(db.collection(name).where('classId', '==', class_id), on_commit))
+            counts = executor.map(delete_collection, CLASS_CASCADE_COLLECTIONS)
+            deleted = dict(zip(CLASS_CASCADE_COLLECTIONS, counts))
+        deleted[CLASS_STATS_COLLECTION] = _delete_query_in_pages(_class_stats_ref(class_id).collection('weeks'), on_commit)
+        _class_stats_ref(class_id).delete()
+
+    # 3. 수업 문서와 초대 코드 색인 삭제
+    set_phase('class')
+    batch = db.batch()
+    batch.delete(db.collection('classes').document(class_id))
+    invite_code = class_data.get('inviteCode')
+    if invite_code:
+        invite_doc = _invite_code_ref(invite_code).get()
+        if invite_doc.exists and invite_doc.to_dict().get('classId') == class_id:
+            batch.delete(invite_doc.reference)
+    batch.commit()
+    if invite_code:
+        invite_code_cache.pop(invite_code)
+    set_phase('done')
+    return {'students': len(student_emails), 'unlinked': len(linked_refs), 'deleted': deleted}
+
 # 수업 삭제
+# cascade=true이면 수업의 질문/제출 로그/회고와 분석 집계까지 지운다.
+# mode=async이면 202와 jobId를 바로 돌려주고, 진행 상황은 /api/classes/delete/job/<jobId>로 조회한다.
 @app.route('/api/classes/delete', methods=['POST'])
 def delete_class():
     try:
@@ -507,26 +2318,42 @@ def delete_class():
 
         class_ref = db.collection('classes').document(class_id)
         class_doc = class_ref.get()
-
-        if not class_doc.exists:
-            return jsonify({"status": "error", "message": "존재하지 않는 수업입니다."}), 404
+        denied = check_class_owner(class_doc, instructor_email, '삭제할')
+        if denied:
+            return denied
         class_data = class_doc.to_dict()
-        if class_data.get('instructorEmail') != instructor_email:
-            return jsonify({"status": "error", "message": "수업을 삭제할 권한이 없습니다."}), 403
 
-        batch = db.batch()
-        student_emails = class_data.get('students', [])
-        for email in student_emails:
-            student_ref = db.collection('users').document(email)
-            batch.update(student_ref, {'classId': firestore.DELETE_FIELD})
-        batch.delete(class_ref)
-        batch.commit()
+        cascade = bool(data.get('cascade', False))
+        if data.get('mode') == 'async':
+            job = class_deletion_jobs.submit(delete_class_data, class_id, class_data, cascade,
+                                             meta={'classId': class_id}, with_progress=True)
+            if job is None:
+                return jsonify({"status": "error", "message": "진행 중인 수업 삭제 작업이 많습니다. 잠시 후 다시 시도해주세요."}), 503
+            return jsonify({"status": "success", "message": "수업 삭제를 시작했습니다.", "jobId": job['jobId'], "jobStatus": job['state']}), 202
 
-        return jsonify({"status": "success", "message": "수업이 성공적으로 삭제되었습니다."})
+        result = delete_class_data(class_id, class_data, cascade)
+        return jsonify({"status": "success", "message": "수업이 성공적으로 삭제되었습니다.", **result})
     except Exception as e:
         print(f"Error in delete_class: {e}")
         return jsonify({"status": "error", "message": f"수업 삭제 중 오류 발생: {e}"}), 500
 
+# 수업 삭제 작업 진행 상황 조회
+@app.route('/api/classes/delete/job/<job_id>', methods=['GET'])
+def get_class_deletion_job(job_id):
+    wait = min(request.args.get('wait', 0, type=float), GRADING_JOB_MAX_WAIT)
+    job = class_deletion_jobs.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({"status": "error", "message": "수업 삭제 작업을 찾을 수 없습니다."}), 404
+
+    response = {"status": "success", "jobId": job_id, "jobStatus": job['state'], "progress": job['progress']}
+    if job['state'] == 'done':
+        response['result'] = job['result']
+    elif job['state'] == 'error':
+        response['status'] = 'error'
+        response['message'] = f"수업 삭제 중 오류 발생: {job['error']}"
+        return jsonify(response), 500
+    return jsonify(response)
+
 # 수업 참여
 @app.route('/api/classes/join', methods=['POST'])
 def join_class():
@@ -537,30 +2364,35 @@ def join_class():
         if not invite_code or not student_email:
             return jsonify({"status": "error", "message": "초대 코드와 학생 정보가 필요합니다."}), 400
 
-        classes_ref = db.collection('classes').where('inviteCode', '==', invite_code).limit(1).stream()
-        target_class_doc = next(classes_ref, None)
-        if not target_class_doc:
+        invite_code = normalize_invite_code(invite_code)
+        class_id = resolve_invite_code(invite_code)
+        target_class_doc = db.collection('classes').document(class_id).get() if class_id else None
+        if not target_class_doc or not target_class_doc.exists:
+            invite_code_cache.pop(invite_code)
             return jsonify({"status": "error", "message": "유효하지 않은 초대 코드입니다."}), 404
 
-        class_id = target_class_doc.id
         class_data = target_class_doc.to_dict()
 
         student_doc_ref = db.collection('users').document(student_email)
-        student_doc = student_doc_ref.get()
-        if student_doc.exists and student_doc.to_dict().get('classId'):
+        student_data = get_user_data(student_email)
+        if student_data is not None and student_data.get('classId'):
              return jsonify({"status": "error", "message": "이미 다른 수업에 참여중입니다. 참여중인 수업을 탈퇴 후 시도해주세요."}), 400
-        elif not student_doc.exists:
+        elif student_data is None:
              return jsonify({"status": "error", "message": "가입되지 않은 사용자입니다. 회원가입을 먼저 진행해주세요."}), 404
 
 
         db.collection('classes').document(class_id).update({'students': firestore.ArrayUnion([student_email])})
         student_doc_ref.set({'classId': class_id}, merge=True)
+        invalidate_user(student_email)
 
         return jsonify({"status": "success", "message": f"'{class_data['className']}' 수업에 참여했습니다!", "classId": class_id, "className": class_data['className']})
     except Exception as e:
         print(f"Error in join_class: {e}")
         return jsonify({"status": "error", "message": f"수업 참여 중 오류 발생: {e}"}), 500
 
+# 수업 상세 정보에 포함할 학생 필드 (liveCode, pauseState.code 같은 큰 값과 비밀번호는 읽지 않음)
+CLASS_DETAIL_STUDENT_FIELDS = ['name', 'email', 'role', 'user_level', 'progress', 'lastActive', 'classId', 'pauseState.view']
+
 # 수업 상세 정보 가져오기
 @app.route('/api/class/<class_id>', methods=['GET'])
 def get_class_details(class_id):
@@ -572,17 +2404,12 @@ def get_class_details(class_id):
 
         student_emails = class_info.get('students', [])
         student_details = []
-        if student_emails:
-            users_ref = db.collection('users')
-            for email in student_emails:
-                student_doc = users_ref.document(email).get()
-                if student_doc.exists:
-                    student_data = student_doc.to_dict()
-                    student_data.pop('passwordHash', None)
-                    student_data.pop('password', None)
-                    if 'lastActive' in student_data and hasattr(student_data['lastActive'], 'isoformat'):
-                        student_data['lastActive'] = student_data['lastActive'].isoformat()
-                    student_details.append(student_data)
+        # students=false 이면 학생 목록은 읽지 않는다 (수업 이름만 필요한 학생 화면용)
+        if student_emails and request.args.get('students', 'true') != 'false':
+            for student_data in fetch_users(student_emails, field_paths=CLASS_DETAIL_STUDENT_FIELDS):
+                if 'lastActive' in student_data and hasattr(student_data['lastActive'], 'isoformat'):
+                    student_data['lastActive'] = student_data['lastActive'].isoformat()
+                student_details.append(student_data)
 
         if 'createdAt' in class_info and hasattr(class_info['createdAt'], 'isoformat'):
              class_info['createdAt'] = class_info['createdAt'].isoformat()
@@ -592,6 +2419,351 @@ def get_class_details(class_id):
         print(f"Error in get_class_details: {e}")
         return jsonify({"status": "error", "message": f"수업 상세 정보를 불러오는 중 오류 발생: {e}"}), 500
 
+# --- 접속 상태 (presence) ---
+# 학생의 활동 여부를 lastActive 쓰기로 판단하는 대신, 하트비트/코드 편집 시각을 메모리 표에 기록하고 상태를 계산한다.
+# Firestore에는 다시 활동을 시작했을 때와 활동 중 PRESENCE_PERSIST_INTERVAL마다 한 번씩만 lastActive를 남긴다.
+# 표는 이 프로세스 안에만 있으므로 워커를 여러 개 띄우면 같은 학생의 요청이 한 워커로 가야 한다 (기본 워커 1개).
+PRESENCE_ACTIVE_SEC = 60 # 마지막 활동 후 이 시간 안이면 active (학습 중)
+PRESENCE_IDLE_SEC = 300 # 이 시간 안이면 idle (활동 중), 넘으면 offline
+PRESENCE_PERSIST_INTERVAL = 300 # 활동 중인 학생의 lastActive를 Firestore에 남기는 최소 간격 (초)
+PRESENCE_STATUSES = ('active', 'idle', 'offline')
+
+class PresenceTracker:
+    def __init__(self):
+        self._classes = {} # class_id -> {email: 마지막 활동 시각}
+        self._class_of = {} # email -> class_id
+        self._last_seen = {} # email -> 마지막 활동 시각 (수업을 모르는 학생 포함)
+        self._persisted = {} # email -> 마지막으로 lastActive를 기록한 시각
+        self._lock = threading.Lock()
+
+    def touch(self, email, class_id=None):
+        """
+        학생의 활동을 기록한다. class_id를 모르면 이전 하트비트에서 알게 된 수업을 사용한다.
+        Returns:
+            bool: 이번 활동으로 lastActive를 Firestore에 기록했는지 여부
+        """
+        now = time.time()
+        with self._lock:
+            previous_class = self._class_of.get(email)
+            class_id = class_id or previous_class
+            if previous_class:
+                self._classes.get(previous_class, {}).pop(email, None)
+            # 재활성 판단은 수업과 무관하게 이메일 기준으로 한다 (수업 미참여 학생, 재시작 직후에도 매번 기록하지 않도록)
+            last_seen = self._last_seen.get(email)
+            self._last_seen[email] = now
+            if class_id:
+                self._class_of[email] = class_id
+                self._classes.setdefault(class_id, {})[email] = now
+            persisted_at = self._persisted.get(email)
+            persist = last_seen is None or now - last_seen > PRESENCE_ACTIVE_SEC \
+                or persisted_at is None or now - persisted_at >= PRESENCE_PERSIST_INTERVAL
+            if persist:
+                self._persisted[email] = now
+        if persist:
+            write_buffer.update(db.collection('users').document(email), {'lastActive': firestore.SERVER_TIMESTAMP})
+        return persist
+
+    @staticmethod
+    def status_for(last_seen, now):
+        if last_seen is None:
+            return 'offline'
+        elapsed = now - last_seen
+        if elapsed < PRESENCE_ACTIVE_SEC:
+            return 'active'
+        return 'idle' if elapsed < PRESENCE_IDLE_SEC else 'offline'
+
+    def class_statuses(self, class_id, roster=()):
+        """
+        Returns:
+            dict: {email: 'active' | 'idle' | 'offline'} - 기록이 있는 학생과 roster의 학생 모두 포함
+        """
+        now = time.time()
+        with self._lock:
+            seen = dict(self._classes.get(class_id, {}))
+        statuses = {email: self.status_for(seen.get(email), now) for email in roster}
+        for email, last_seen in seen.items():
+            statuses[email] = self.status_for(last_seen, now)
+        return statuses
+
+presence = PresenceTracker()
+
+# 학생 하트비트 (화면에서 입력이 있었을 때 주기적으로 호출)
+@app.route('/api/presence/heartbeat', methods=['POST'])
+def presence_heartbeat():
+    try:
+        data = request.get_json()
+        email = data.get('email')
+        if not email:
+            return jsonify({"status": "error", "message": "이메일 정보가 없습니다."}), 400
+        presence.touch(email, data.get('classId'))
+        return jsonify({"status": "success"})
+    except Exception as e:
+        print(f"Error in presence_heartbeat: {e}")
+        return jsonify({"status": "error", "message": f"접속 상태 기록 중 오류 발생: {e}"}), 500
+
+# 수업의 접속 상태 조회 (active / idle / offline)
+@app.route('/api/presence/class/<class_id>', methods=['GET'])
+def get_class_presence(class_id):
+    try:
+        class_doc = db.collection('classes').document(class_id).get()
+        if not class_doc.exists:
+            return jsonify({"status": "error", "message": "존재하지 않는 수업입니다."}), 404
+        statuses = presence.class_statuses(class_id, class_doc.to_dict().get('students', []))
+        grouped = {status: sorted(email for email, value in statuses.items() if value == status) for status in PRESENCE_STATUSES}
+        return jsonify({
+            "status": "success", "classId": class_id, **grouped,
+            "counts": {status: len(emails) for status, emails in grouped.items()}
+        })
+    except Exception as e:
+        print(f"Error in get_class_presence: {e}")
+        return jsonify({"status": "error", "message": f"접속 상태 조회 중 오류 발생: {e}"}), 500
+
+# --- 교수자 모니터 실시간 피드 ---
+# 모니터 탭마다 학생 수만큼 Firestore 리스너를 여는 대신, 서버가 수업당 하나의 구독(학생 문서 + 미해결 질문)을 유지하고
+# 바뀐 내용만 간단한 이벤트로 만들어 변경 버퍼에 쌓는다. 같은 수업을 보는 모든 탭은 이 버퍼를 SSE로 함께 받는다.
+MONITOR_FEED_BUFFER = 1000 # 수업별로 보관하는 최근 이벤트 수
+MONITOR_FEED_IDLE_CLOSE = 60 # 마지막 구독자가 떠난 뒤 upstream 구독을 닫기까지 기다리는 시간 (초)
+MONITOR_HEARTBEAT = 15 # SSE 연결 유지용 주석 전송 간격 (초)
+MONITOR_PRESENCE_CHECK = 5 # 접속 상태 변화를 확인해 보내는 간격 (초)
+MONITOR_POLL_MAX_WAIT = 25 # 롱폴링 최대 대기 시간 (초, gevent 모드)
+MONITOR_POLL_MAX_WAIT_THREADS = 2 # 스레드 모드의 롱폴링 최대 대기 시간 (초). 모니터 탭이 스레드 8개를 오래 붙잡지 않도록 짧게 둔다
+
+def monitor_live_transport():
+    """
+    모니터 화면이 쓸 실시간 전송 방식.
+    SSE는 연결이 열려 있는 동안 요청 처리 단위 하나를 계속 차지하므로, 협력형(gevent) 모드에서만 쓰고
+    스레드 모드에서는 짧은 롱폴링을 쓴다.
+    """
+    return 'sse' if COOPERATIVE_MODE else 'poll'
+
+def _iso(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def compact_student(email, data):
+    """모니터 카드에 필요한 값만 추린다 (liveCode 등 큰 값 제외)."""
+    return {
+        'email': data.get('email', email), 'name': data.get('name', '이름없음'),
+        'progress': data.get('progress', {'week': 1, 'cycle': 0}),
+        'lastActive': _iso(data.get('lastActive')), 'paused': bool(data.get('pauseState'))
+    }
+
+def compact_question(question_id, data):
+    return {
+        'id': question_id, 'studentEmail': data.get('studentEmail'), 'question': data.get('question'),
+        'progress': data.get('progress', {}), 'createdAt': _iso(data.get('createdAt'))
+    }
+
+class ClassFeed:
+    """수업 하나의 실시간 상태와 최근 변경 이벤트 버퍼."""
+    def __init__(self, class_id, class_name):
+        self.class_id = class_id
+        self.class_name = class_name
+        self.students = {} # email -> compact_student
+        self.questions = [] # compact_question 목록 (작성 순)
+        self.events = deque(maxlen=MONITOR_FEED_BUFFER)
+        self.seq = 0
+        self.subscribers = 0
+        self.idle_since = None
+        self._cond = threading.Condition()
+        self._ready = threading.Event()
+        self._watches = []
+
+    def start(self):
+        self._watches.append(db.collection('users').where('classId', '==', self.class_id).on_snapshot(self._on_users))
+        self._watches.append(db.collection('questions').where('classId', '==', self.class_id)
+                             .where('isResolved', '==', False).on_snapshot(self._on_questions))
+
+    def close(self):
+        for watch in self._watches:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                print(f"Failed to close monitor watch for {self.class_id}: {e}")
+        self._watches = []
+
+    def _publish(self, event):
+        # _cond 보유 상태에서 호출
+        self.seq += 1
+        event['seq'] = self.seq
+        self.events.append(event)
+        self._cond.notify_all()
+
+    def _on_users(self, docs, changes, read_time):
+        with self._cond:
+            for change in changes:
+                email = change.document.id
+                if change.type.name == 'REMOVED':
+                    if self.students.pop(email, None) is not None:
+                        self._publish({'type': 'studentRemoved', 'email': email})
+                    continue
+                student = compact_student(email, change.document.to_dict())
+                if self.students.get(email) != student:
+                    self.students[email] = student
+                    self._publish({'type': 'student', 'student': student})
+        self._ready.set()
+
+    def _on_questions(self, docs, changes, read_time):
+        questions = sorted((compact_question(doc.id, doc.to_dict()) for doc in docs), key=lambda q: q['createdAt'] or '')
+        with self._cond:
+            if questions != self.questions:
+                self.questions = questions
+                self._publish({'type': 'questions', 'questions': questions})
+
+    def snapshot(self, wait=10):
+        """현재 전체 상태. 첫 구독 직후라면 upstream 초기 데이터가 도착할 때까지 최대 wait초 기다린다."""
+        self._ready.wait(wait)
+        with self._cond:
+            return {
+                'type': 'snapshot', 'seq': self.seq, 'className': self.class_name,
+                'students': list(self.students.values()), 'questions': list(self.questions),
+                'presence': presence.class_statuses(self.class_id, list(self.students))
+            }
+
+    def presence_statuses(self):
+        with self._cond:
+            roster = list(self.students)
+        return presence.class_statuses(self.class_id, roster)
+
+    def wait_events(self, since, timeout):
+        """
+        since 이후의 이벤트를 기다려 반환한다.
+        Returns:
+            list | None: 이벤트 목록 (시간 초과 시 빈 목록). since가 버퍼보다 오래되었거나 현재 seq보다 커서 전체 상태를 다시 받아야 하면 None
+        """
+        with self._cond:
+            # since가 현재 seq보다 크면 피드가 다시 만들어졌거나(유휴 종료 후, 서버 재시작) 다른 피드의 번호이므로 전체 상태를 다시 보낸다
+            if since > self.seq or (self.events and since < self.events[0]['seq'] - 1):
+                return None
+            self._cond.wait_for(lambda: self.seq > since, timeout)
+            return [event for event in self.events if event['seq'] > since]
+
+_monitor_feeds = {}
+_monitor_feeds_lock = threading.Lock()
+
+def acquire_class_feed(class_id, class_name):
+    with _monitor_feeds_lock:
+        # 구독자가 없는 채로 오래된 피드는 정리한다
+        now = time.monotonic()
+        for idle_id, idle_feed in list(_monitor_feeds.items()):
+            if idle_feed.subscribers == 0 and idle_feed.idle_since and now - idle_feed.idle_since > MONITOR_FEED_IDLE_CLOSE:
+                idle_feed.close()
+                del _monitor_feeds[idle_id]
+        feed = _monitor_feeds.get(class_id)
+        if feed is None:
+            feed = ClassFeed(class_id, class_name)
+            feed.start()
+            _monitor_feeds[class_id] = feed
+        feed.subscribers += 1
+        feed.idle_since = None
+        return feed
+
+def release_class_feed(feed):
+    with _monitor_feeds_lock:
+        feed.subscribers -= 1
+        if feed.subscribers <= 0:
+            feed.idle_since = time.monotonic()
+
+def _sse(event_type, data, event_id=None):
+    lines = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{lines}event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+# 수업 실시간 현황 스트림 (Server-Sent Events)
+# 연결 직후 'snapshot' 이벤트로 전체 상태를 보내고, 이후에는 'student' / 'studentRemoved' / 'questions' 변경분만 보낸다.
+@app.route('/api/monitor/class/<class_id>/stream', methods=['GET'])
+def stream_class_monitor(class_id):
+    if monitor_live_transport() != 'sse':
+        return jsonify({"status": "error", "message": "현재 서버 모드에서는 실시간 스트림을 지원하지 않습니다. 롱폴링(/events)을 사용하세요."}), 503
+    try:
+        class_doc = db.collection('classes').document(class_id).get()
+        if not class_doc.exists:
+            return jsonify({"status": "error", "message": "존재하지 않는 수업입니다."}), 404
+        feed = acquire_class_feed(class_id, class_doc.to_dict().get('className'))
+    except Exception as e:
+        print(f"Error in stream_class_monitor: {e}")
+        return jsonify({"status": "error", "message": f"실시간 현황 연결 중 오류 발생: {e}"}), 500
+
+    def generate():
+        try:
+            snapshot = feed.snapshot()
+            since, sent_presence = snapshot['seq'], snapshot['presence']
+            last_sent = time.monotonic()
+            yield _sse('snapshot', snapshot, since)
+            while True:
+                events = feed.wait_events(since, MONITOR_PRESENCE_CHECK)
+                if events is None: # 너무 뒤처진 경우 전체 상태를 다시 보낸다
+                    snapshot = feed.snapshot()
+                    since, sent_presence = snapshot['seq'], snapshot['presence']
+                    last_sent = time.monotonic()
+                    yield _sse('snapshot', snapshot, since)
+                    continue
+                for event in events:
+                    since = event['seq']
+                    last_sent = time.monotonic()
+                    yield _sse(event['type'], event, since)
+
+                # 접속 상태는 시간이 지나며 바뀌므로 주기적으로 다시 계산해 바뀐 학생만 보낸다
+                current_presence = feed.presence_statuses()
+                changed = {email: status for email, status in current_presence.items() if sent_presence.get(email) != status}
+                sent_presence = current_presence
+                if changed:
+                    last_sent = time.monotonic()
+                    yield _sse('presence', {'type': 'presence', 'presence': changed})
+                elif time.monotonic() - last_sent >= MONITOR_HEARTBEAT:
+                    last_sent = time.monotonic()
+                    yield ": keep-alive\n\n"
+        finally:
+            release_class_feed(feed)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'
+    })
+
+# 수업 실시간 현황 롱폴링 (스레드 모드의 기본 방식, SSE를 쓸 수 없는 환경용)
+# since가 없거나 현재 피드와 맞지 않으면 전체 상태를, 아니면 그 이후 변경분을 최대 wait초까지 기다려 반환한다.
+@app.route('/api/monitor/class/<class_id>/events', methods=['GET'])
+def poll_class_monitor(class_id):
+    try:
+        since = request.args.get('since', type=int)
+        max_wait = MONITOR_POLL_MAX_WAIT if COOPERATIVE_MODE else MONITOR_POLL_MAX_WAIT_THREADS
+        wait = min(request.args.get('wait', max_wait, type=float), max_wait)
+        class_doc = db.collection('classes').document(class_id).get()
+        if not class_doc.exists:
+            return jsonify({"status": "error", "message": "존재하지 않는 수업입니다."}), 404
+        feed = acquire_class_feed(class_id, class_doc.to_dict().get('className'))
+        try:
+            events = feed.wait_events(since, wait) if since is not None else None
+            if events is None:
+                return jsonify({"status": "success", "snapshot": feed.snapshot(), "events": []})
+            return jsonify({
+                "status": "success", "events": events, "seq": events[-1]['seq'] if events else since,
+                "presence": feed.presence_statuses()
+            })
+        finally:
+            release_class_feed(feed)
+    except Exception as e:
+        print(f"Error in poll_class_monitor: {e}")
+        return jsonify({"status": "error", "message": f"실시간 현황 조회 중 오류 발생: {e}"}), 500
+
+# 학생 실시간 코드 조회 (모니터 화면의 코드 보기) - 수업 담당 교수자만, 그 수업 학생의 코드만 볼 수 있다
+@app.route('/api/monitor/class/<class_id>/live-code', methods=['GET'])
+def get_student_live_code(class_id):
+    student_email = request.args.get('email')
+    instructor_email = request.args.get('instructorEmail')
+    if not student_email or not instructor_email:
+        return jsonify({"status": "error", "message": "학생과 교수자 정보가 필요합니다."}), 400
+    try:
+        class_doc = db.collection('classes').document(class_id).get()
+        denied = check_class_owner(class_doc, instructor_email, '조회할')
+        if denied:
+            return denied
+        if student_email not in class_doc.to_dict().get('students', []):
+            return jsonify({"status": "error", "message": "이 수업에 참여한 학생이 아닙니다."}), 404
+        code = live_code_store.get_many([student_email]).get(student_email, '')
+        return jsonify({"status": "success", "email": student_email, "code": code})
+    except Exception as e:
+        print(f"Error in get_student_live_code: {e}")
+        return jsonify({"status": "error", "message": f"학생 코드 조회 중 오류 발생: {e}"}), 500
+
 # 질문 등록
 @app.route('/api/question/ask', methods=['POST'])
 def ask_question():
@@ -673,13 +2845,18 @@ def log_submission():
             return jsonify({"status": "error", "message": "필수 로그 정보가 누락되었습니다."}), 400
 
         log_ref = db.collection('submission_logs').document()
-        log_ref.set({
+        log_data = {
             'logId': log_ref.id,
             'studentEmail': data.get('email'), 'classId': data.get('classId'),
             'week': data.get('week'), 'cycle': data.get('cycle'),
             'isSuccess': data.get('isSuccess'), 'error': data.get('error', ''),
             'submittedAt': firestore.SERVER_TIMESTAMP
-        })
+        }
+        # 로그와 수업 집계 문서를 한 배치로 기록 (둘 다 반영되거나 둘 다 실패)
+        batch = db.batch()
+        batch.set(log_ref, log_data)
+        add_submission_to_class_stats(batch, log_data)
+        batch.commit()
         return jsonify({"status": "success", "message": "제출 기록이 저장되었습니다."}), 201
     except Exception as e:
         print(f"Error in log_submission: {e}")
@@ -695,13 +2872,17 @@ def log_reflection():
             return jsonify({"status": "error", "message": "필수 회고 정보가 누락되었습니다."}), 400
 
         log_ref = db.collection('reflections').document()
-        log_ref.set({
+        reflection_data = {
             'reflectionId': log_ref.id,
             'studentEmail': data.get('email'), 'classId': data.get('classId'),
             'week': data.get('week'), 'ratings': data.get('ratings'),
             'feedback': data.get('feedback'),
             'submittedAt': firestore.SERVER_TIMESTAMP
-        })
+        }
+        batch = db.batch()
+        batch.set(log_ref, reflection_data)
+        add_reflection_to_class_stats(batch, reflection_data)
+        batch.commit()
         return jsonify({"status": "success", "message": "업무일지가 저장되었습니다."}), 201
     except Exception as e:
         print(f"Error in log_reflection: {e}")
@@ -709,7 +2890,211 @@ def log_reflection():
 
 # --- 분석 API ---
 
-# 클래스 분석 데이터 가져오기 (f-string 오류 수정됨)
+# --- 수업별 분석 집계 ---
+# 분석 화면이 매번 전체 제출/회고 로그를 읽지 않도록, 로그를 쓸 때 같은 배치로 집계 문서를 갱신한다.
+#   class_stats/{classId}                : 전체 제출 수/성공 수/회고 수
+#   class_stats/{classId}/weeks/week_{n} : 주차별 제출 수, 사이클별 실패 수, 회고 평점 합계/참여자/피드백
+# 집계 도입 전에 만든 수업은 처음 조회할 때 원본 로그에서 한 번 계산한다 (ensure_class_stats).
+# 집계가 어긋난 경우 관리자가 rebuild_class_stats()로 다시 계산한다 (/api/admin/analytics/rebuild 또는 rebuild_class_stats.py).
+# 주차 문서가 Firestore 문서 크기 제한(1 MiB)에 닿지 않도록 피드백은 항목별 FEEDBACK_MAX_PER_WEEK개, FEEDBACK_MAX_CHARS자까지만 담는다.
+CLASS_STATS_COLLECTION = 'class_stats'
+FEEDBACK_KEYS = ('meaningful', 'difficult', 'curious')
+FEEDBACK_MAX_PER_WEEK = int(os.environ.get('FEEDBACK_MAX_PER_WEEK', '100'))
+FEEDBACK_MAX_CHARS = int(os.environ.get('FEEDBACK_MAX_CHARS', '300'))
+CLASS_STATS_REBUILD_ATTEMPTS = 3
+
+def _class_stats_ref(class_id):
+    return db.collection(CLASS_STATS_COLLECTION).document(class_id)
+
+def _week_stats_ref(class_id, week):
+    return _class_stats_ref(class_id).collection('weeks').document(f'week_{week}')
+
+def add_submission_to_class_stats(batch, log_data):
+    """제출 로그 1건을 수업 집계에 더하는 쓰기를 batch에 추가한다."""
+    class_id = log_data.get('classId')
+    if not class_id:
+        return
+    is_success = bool(log_data.get('isSuccess'))
+    batch.set(_class_stats_ref(class_id), {
+        'classId': class_id,
+        'totalSubmissions': firestore.Increment(1),
+        'successSubmissions': firestore.Increment(1 if is_success else 0),
+        'updatedAt': firestore.SERVER_TIMESTAMP
+    }, merge=True)
+
+    week, cycle = log_data.get('week'), log_data.get('cycle')
+    if week is None:
+        return
+    week_update = {'week': week, 'submissions': {
+        'total': firestore.Increment(1), 'success': firestore.Increment(1 if is_success else 0)
+    }}
+    if not is_success and cycle is not None:
+        week_update['failedCycles'] = {str(cycle): firestore.Increment(1)}
+    batch.set(_week_stats_ref(class_id, week), week_update, merge=True)
+
+def add_reflection_to_class_stats(batch, reflection_data):
+    """회고 1건을 수업의 주차 집계에 더하는 쓰기를 batch에 추가한다 (피드백이 있으면 주차 문서의 항목별 개수를 먼저 읽는다)."""
+    class_id, week = reflection_data.get('classId'), reflection_data.get('week')
+    if not class_id or week is None:
+        return
+    # 재계산 중에 들어온 회고를 알아챌 수 있도록 수업 문서에도 회고 수를 센다 (rebuild_class_stats 참고)
+    batch.set(_class_stats_ref(class_id), {
+        'classId': class_id, 'totalReflections': firestore.Increment(1), 'updatedAt': firestore.SERVER_TIMESTAMP
+    }, merge=True)
+    topics = {}
+    for rating in reflection_data.get('ratings') or []:
+        topic = rating.get('topic')
+        if not topic: continue
+        for field in ('comprehension', 'application'):
+            value = rating.get(field)
+            if isinstance(value, (int, float)):
+                topic_update = topics.setdefault(topic, {})
+                topic_update[f'{field}Sum'] = firestore.Increment(value)
+                topic_update[f'{field}Count'] = firestore.Increment(1)
+    feedback = reflection_data.get('feedback') or {}
+    feedback_keys = [key for key in FEEDBACK_KEYS if feedback.get(key)]
+    if feedback_keys:
+        week_doc = _week_stats_ref(class_id, week).get(field_paths=['reflections.feedbackCount'])
+        stored = ((week_doc.to_dict() or {}).get('reflections') or {}).get('feedbackCount') or {} if week_doc.exists else {}
+        feedback_keys = [key for key in feedback_keys if stored.get(key, 0) < FEEDBACK_MAX_PER_WEEK]
+    feedback_update = {
+        key: firestore.ArrayUnion([{'id': reflection_data['reflectionId'], 'text': str(feedback[key])[:FEEDBACK_MAX_CHARS]}])
+        for key in feedback_keys
+    }
+    # merge=True에서 빈 맵은 "변경 없음"이 아니라 "빈 맵으로 교체"이므로, 비어 있는 키는 아예 넣지 않는다
+    # (평점/피드백이 없는 회고 하나가 주차의 누적 합계와 피드백을 지우지 않도록)
+    reflections_update = {'participants': firestore.ArrayUnion([reflection_data.get('studentEmail')])}
+    if topics:
+        reflections_update['topics'] = topics
+    if feedback_update:
+        reflections_update['feedback'] = feedback_update
+        reflections_update['feedbackCount'] = {key: firestore.Increment(1) for key in feedback_update}
+    batch.set(_week_stats_ref(class_id, week), {'week': week, 'reflections': reflections_update}, merge=True)
+
+def _class_stats_counters(class_id):
+    stats_doc = _class_stats_ref(class_id).get(field_paths=['totalSubmissions', 'totalReflections'])
+    stats = stats_doc.to_dict() if stats_doc.exists else {}
+    return stats.get('totalSubmissions', 0), stats.get('totalReflections', 0)
+
+def rebuild_class_stats(class_id):
+    """
+    submission_logs/reflections 원본에서 수업 집계를 처음부터 다시 계산해 덮어쓴다.
+    제출/회고는 로그와 수업 집계 문서의 카운터를 한 배치로 올리므로, 로그를 읽기 전후에 카운터를 비교해
+    그 사이 새 기록이 들어왔으면 덮어쓰지 않고 다시 계산한다 (수업 진행 중에 실행해도 증가분을 잃지 않도록).
+    Returns:
+        dict: {'submissions': 읽은 제출 로그 수, 'reflections': 읽은 회고 수, 'weeks': 집계된 주차 수}
+    """
+    for _ in range(CLASS_STATS_REBUILD_ATTEMPTS):
+        before = _class_stats_counters(class_id)
+        computed = _compute_class_stats(class_id)
+        if _class_stats_counters(class_id) == before:
+            return _write_class_stats(class_id, *computed)
+    raise RuntimeError(f"재계산하는 동안 새 로그가 계속 기록되어 {CLASS_STATS_REBUILD_ATTEMPTS}회 모두 중단했습니다. 잠시 후 다시 시도해주세요.")
+
+def _compute_class_stats(class_id):
+    total = success = 0
+    weeks = {}
+    def week_entry(week):
+        return weeks.setdefault(week, {
+            'week': week, 'submissions': {'total': 0, 'success': 0}, 'failedCycles': {},
+            'reflections': {'participants': [], 'topics': {}, 'feedback': {key: [] for key in FEEDBACK_KEYS}}
+        })
+
+    for log_doc in db.collection('submission_logs').where('classId', '==', class_id).stream():
+        log = log_doc.to_dict()
+        is_success = bool(log.get('isSuccess'))
+        total += 1
+        success += 1 if is_success else 0
+        if log.get('week') is None: continue
+        entry = week_entry(log['week'])
+        entry['submissions']['total'] += 1
+        entry['submissions']['success'] += 1 if is_success else 0
+        if not is_success and log.get('cycle') is not None:
+            cycle_key = str(log['cycle'])
+            entry['failedCycles'][cycle_key] = entry['failedCycles'].get(cycle_key, 0) + 1
+
+    reflection_count = 0
+    for reflection_doc in db.collection('reflections').where('classId', '==', class_id).stream():
+        reflection = reflection_doc.to_dict()
+        reflection_count += 1
+        if reflection.get('week') is None: continue
+        summary = week_entry(reflection['week'])['reflections']
+        if reflection.get('studentEmail') not in summary['participants']:
+            summary['participants'].append(reflection.get('studentEmail'))
+        for rating in reflection.get('ratings') or []:
+            topic = rating.get('topic')
+            if not topic: continue
+            topic_stats = summary['topics'].setdefault(topic, {})
+            for field in ('comprehension', 'application'):
+                value = rating.get(field)
+                if isinstance(value, (int, float)):
+                    topic_stats[f'{field}Sum'] = topic_stats.get(f'{field}Sum', 0) + value
+                    topic_stats[f'{field}Count'] = topic_stats.get(f'{field}Count', 0) + 1
+        feedback = reflection.get('feedback') or {}
+        for key in FEEDBACK_KEYS:
+            if feedback.get(key) and len(summary['feedback'][key]) < FEEDBACK_MAX_PER_WEEK:
+                summary['feedback'][key].append({'id': reflection_doc.id, 'text': str(feedback[key])[:FEEDBACK_MAX_CHARS]})
+    for entry in weeks.values():
+        entry['reflections']['feedbackCount'] = {key: len(items) for key, items in entry['reflections']['feedback'].items()}
+    return total, success, reflection_count, weeks
+
+def _write_class_stats(class_id, total, success, reflection_count, weeks):
+    # 기존 주차 집계를 지우고 새로 계산한 값으로 교체
+    stats_ref = _class_stats_ref(class_id)
+    writes = [('delete', doc.reference, None) for doc in stats_ref.collection('weeks').stream()]
+    writes += [('set', _week_stats_ref(class_id, week), data) for week, data in weeks.items()]
+    writes.append(('set', stats_ref, {
+        'classId': class_id, 'totalSubmissions': total, 'successSubmissions': success, 'totalReflections': reflection_count,
+        'initialized': True, 'rebuiltAt': firestore.SERVER_TIMESTAMP, 'updatedAt': firestore.SERVER_TIMESTAMP
+    }))
+    for offset in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for op, ref, data in writes[offset:offset + FIRESTORE_BATCH_LIMIT]:
+            if op == 'delete':
+                batch.delete(ref)
+            else:
+                batch.set(ref, data)
+        batch.commit()
+    return {'submissions': total, 'reflections': reflection_count, 'weeks': len(weeks)}
+
+_class_stats_rebuild_lock = threading.Lock() # 같은 수업을 동시에 여러 요청이 재계산하지 않도록 (재계산은 수업마다 한 번뿐이므로 하나로 충분)
+
+def ensure_class_stats(class_id):
+    """
+    집계가 아직 계산되지 않은 수업이면 원본 로그에서 한 번 계산한다.
+    Returns:
+        bool: 집계가 준비되었는지 여부 (재계산에 실패하면 False)
+    """
+    with _class_stats_rebuild_lock:
+        stats_doc = _class_stats_ref(class_id).get(field_paths=['initialized'])
+        if stats_doc.exists and stats_doc.to_dict().get('initialized'):
+            return True
+        try:
+            result = rebuild_class_stats(class_id)
+        except Exception as e:
+            print(f"Class stats for '{class_id}' could not be initialized: {e}")
+            return False
+        print(f"Class stats for '{class_id}' initialized from {result['submissions']} submissions, {result['reflections']} reflections")
+        return True
+
+def load_class_stats(class_id):
+    """
+    수업 집계 문서와 주차별 집계 목록을 읽는다. 아직 계산되지 않은 수업(집계 도입 전에 만든 수업)이면 먼저 계산한다.
+    Returns:
+        tuple: (집계 dict, [주차별 집계 dict, ...], 초기화 여부)
+    """
+    stats_ref = _class_stats_ref(class_id)
+    stats_doc = stats_ref.get()
+    class_stats = stats_doc.to_dict() if stats_doc.exists else {}
+    initialized = bool(class_stats.get('initialized'))
+    if not initialized and ensure_class_stats(class_id):
+        stats_doc = stats_ref.get()
+        class_stats = stats_doc.to_dict() if stats_doc.exists else {}
+        initialized = bool(class_stats.get('initialized'))
+    week_stats = [doc.to_dict() for doc in stats_ref.collection('weeks').stream()]
+    return class_stats, week_stats, initialized
+
+# 클래스 분석 데이터 가져오기 (미리 집계된 문서를 읽으므로 로그 양과 무관하게 일정한 비용)
 @app.route('/api/analytics/class/<class_id>', methods=['GET'])
 def get_class_analytics(class_id):
     try:
@@ -718,101 +3103,231 @@ def get_class_analytics(class_id):
             return jsonify({"status": "error", "message": "클래스를 찾을 수 없습니다."}), 404
         class_info = class_doc.to_dict()
 
-        logs_ref = db.collection('submission_logs').where('classId', '==', class_id).stream()
-        logs = [log.to_dict() for log in logs_ref]
-        total_submissions = len(logs)
-        success_submissions = sum(1 for log in logs if log['isSuccess'])
+        class_stats, week_stats, stats_initialized = load_class_stats(class_id)
+        total_submissions = class_stats.get('totalSubmissions', 0)
+        success_submissions = class_stats.get('successSubmissions', 0)
         success_rate = round((success_submissions / total_submissions * 100), 2) if total_submissions > 0 else 0
 
-        weekly_stats = {}
-        for log in logs:
-            week = log.get('week')
-            if week is None: continue
-            if week not in weekly_stats: weekly_stats[week] = {'success': 0, 'total': 0}
-            weekly_stats[week]['total'] += 1
-            if log['isSuccess']: weekly_stats[week]['success'] += 1
-        weekly_success_rate = {f"{w}주차": round((d['success']/d['total']*100), 2) for w, d in weekly_stats.items() if d['total'] > 0}
-
-        failed_logs = [log for log in logs if not log['isSuccess'] and log.get('week') is not None and log.get('cycle') is not None]
-        scenario_titles = {}
-        for w in set(log['week'] for log in failed_logs):
-             scenario_doc = db.collection('scenarios').document(f'week_{w}').get()
-             if scenario_doc.exists:
-                 cycles = scenario_doc.to_dict().get('cycles', [])
-                 scenario_titles[w] = {idx: cyc.get('title', f'사이클 {idx+1}') for idx, cyc in enumerate(cycles)}
-
-        failed_cycle_titles = []
-        for log in failed_logs:
-            week_num = log.get('week')
-            cycle_num = log.get('cycle')
-            if week_num is not None and cycle_num is not None:
-                cycle_title_or_default = scenario_titles.get(week_num, {}).get(cycle_num, f'사이클 {cycle_num + 1}')
-                failed_cycle_titles.append(f"{week_num}주차: {cycle_title_or_default}")
-
-        failure_counter = Counter(failed_cycle_titles)
+        weekly_success_rate = {}
+        failure_counter = Counter()
+        reflection_analysis = {}
+        for week_data in sorted(week_stats, key=lambda d: d.get('week', 0)):
+            week = week_data.get('week')
+            submissions = week_data.get('submissions', {})
+            if submissions.get('total', 0) > 0:
+                weekly_success_rate[f"{week}주차"] = round((submissions.get('success', 0) / submissions['total'] * 100), 2)
+
+            week_scenario = scenario_cache.get_week(week)
+            cycles = week_scenario.get('cycles', []) if week_scenario is not None else []
+            for cycle_key, count in week_data.get('failedCycles', {}).items():
+                cycle_num = int(cycle_key)
+                cycle_title_or_default = cycles[cycle_num].get('title', f'사이클 {cycle_num + 1}') if 0 <= cycle_num < len(cycles) else f'사이클 {cycle_num + 1}'
+                failure_counter[f"{week}주차: {cycle_title_or_default}"] += count
+
+            reflections = week_data.get('reflections', {})
+            if reflections.get('participants'):
+                topics = {}
+                for topic, sums in reflections.get('topics', {}).items():
+                    comp_avg = sums.get('comprehensionSum', 0) / sums['comprehensionCount'] if sums.get('comprehensionCount') else 0
+                    app_avg = sums.get('applicationSum', 0) / sums['applicationCount'] if sums.get('applicationCount') else 0
+                    topics[topic] = {'comprehension_avg': round(comp_avg, 2), 'application_avg': round(app_avg, 2)}
+                feedback = reflections.get('feedback', {})
+                reflection_analysis[week] = {
+                    'topics': topics,
+                    'feedback_summary': {key: [item['text'] for item in feedback.get(key, [])] for key in FEEDBACK_KEYS},
+                    'participant_count': len(reflections['participants'])
+                }
+
         most_failed_cycles = failure_counter.most_common(5)
 
         student_emails = class_info.get('students', [])
         student_progress = []
-        if student_emails:
-            users_ref = db.collection('users')
-            for email in student_emails:
-                student_doc = users_ref.document(email).get()
-                if student_doc.exists:
-                    s_data = student_doc.to_dict()
-                    progress = s_data.get('progress', {'week': 1, 'cycle': 0})
-                    student_progress.append({
-                        'name': s_data.get('name', '이름없음'), 'email': s_data.get('email'),
-                        'week': progress.get('week', 1), 'cycle': progress.get('cycle', 0) + 1
-                    })
-
-        reflections_ref = db.collection('reflections').where('classId', '==', class_id).stream()
-        reflections = [r.to_dict() for r in reflections_ref]
-        reflection_analysis = {}
-        for reflection in reflections:
-            week = reflection.get('week')
-            if week is None: continue
-            if week not in reflection_analysis:
-                reflection_analysis[week] = {
-                    'topics': {}, 'feedback_summary': {'meaningful': [], 'difficult': [], 'curious': []},
-                    'participant_count': set()
-                }
-            reflection_analysis[week]['participant_count'].add(reflection['studentEmail'])
-
-            for rating in reflection.get('ratings', []):
-                topic = rating.get('topic')
-                comp = rating.get('comprehension')
-                app = rating.get('application')
-                if not topic: continue
-                if topic not in reflection_analysis[week]['topics']:
-                    reflection_analysis[week]['topics'][topic] = {'comprehension': [], 'application': []}
-                if isinstance(comp, (int, float)): reflection_analysis[week]['topics'][topic]['comprehension'].append(comp)
-                if isinstance(app, (int, float)): reflection_analysis[week]['topics'][topic]['application'].append(app)
-
-            feedback = reflection.get('feedback', {})
-            if feedback.get('meaningful'): reflection_analysis[week]['feedback_summary']['meaningful'].append(feedback['meaningful'])
-            if feedback.get('difficult'): reflection_analysis[week]['feedback_summary']['difficult'].append(feedback['difficult'])
-            if feedback.get('curious'): reflection_analysis[week]['feedback_summary']['curious'].append(feedback['curious'])
-
-        for week, data in reflection_analysis.items():
-            for topic, ratings in data['topics'].items():
-                comp_avg = sum(ratings['comprehension']) / len(ratings['comprehension']) if ratings['comprehension'] else 0
-                app_avg = sum(ratings['application']) / len(ratings['application']) if ratings['application'] else 0
-                reflection_analysis[week]['topics'][topic] = {'comprehension_avg': round(comp_avg, 2), 'application_avg': round(app_avg, 2)}
-            reflection_analysis[week]['participant_count'] = len(data['participant_count'])
+        for s_data in fetch_users(student_emails, field_paths=['name', 'email', 'progress']):
+            progress = s_data.get('progress', {'week': 1, 'cycle': 0})
+            student_progress.append({
+                'name': s_data.get('name', '이름없음'), 'email': s_data.get('email'),
+                'week': progress.get('week', 1), 'cycle': progress.get('cycle', 0) + 1
+            })
 
         return jsonify({
             "status": "success", "className": class_info.get('className'),
             "totalSubmissions": total_submissions, "successRate": success_rate,
             "weeklySuccessRate": weekly_success_rate, "mostFailedCycles": most_failed_cycles,
             "studentProgress": sorted(student_progress, key=lambda x: (-x['week'], -x['cycle'])),
-            "reflectionAnalysis": reflection_analysis
+            "reflectionAnalysis": reflection_analysis,
+            "statsInitialized": stats_initialized # False면 과거 로그 재계산에 실패해 일부 기록이 빠져 있을 수 있음
         })
 
     except Exception as e:
         print(f"Error in get_class_analytics: {e}")
         return jsonify({"status": "error", "message": f"분석 데이터 로드 중 오류 발생: {e}"}), 500
 
+# 수업 분석 집계 재계산 (관리용)
+# classId를 주면 그 수업만 바로 다시 계산하고, all=true이면 전체 수업 재계산을 작업 큐에 넣고 jobId(202)를 돌려준다.
+stats_rebuild_jobs = JobQueue(1, 1, name='stats-rebuild')
+
+def rebuild_all_class_stats(report=None):
+    class_ids = [doc.id for doc in db.collection('classes').select(['__name__']).stream()]
+    results, failed = {}, {}
+    for index, class_id in enumerate(class_ids):
+        if report:
+            report({'done': index, 'total': len(class_ids)})
+        try:
+            results[class_id] = rebuild_class_stats(class_id)
+        except Exception as e:
+            print(f"Error rebuilding class stats for '{class_id}': {e}")
+            failed[class_id] = str(e)
+    if report:
+        report({'done': len(class_ids), 'total': len(class_ids)})
+    return {'results': results, 'failed': failed}
+
+@app.route('/api/admin/analytics/rebuild', methods=['POST'])
+@admin_required
+def rebuild_class_analytics():
+    try:
+        data = request.get_json(silent=True) or {}
+        class_id = data.get('classId')
+        if class_id:
+            result = rebuild_class_stats(class_id)
+            return jsonify({"status": "success", "message": "수업의 분석 집계를 다시 계산했습니다.", "results": {class_id: result}})
+        if data.get('all') is not True:
+            return jsonify({"status": "error", "message": "classId가 필요합니다 (전체 수업은 all=true)."}), 400
+        job = stats_rebuild_jobs.submit(rebuild_all_class_stats, with_progress=True)
+        if job is None:
+            return jsonify({"status": "error", "message": "이미 전체 재계산 작업이 대기 중입니다."}), 503
+        return jsonify({"status": "success", "message": "전체 수업의 분석 집계 재계산을 시작했습니다.", "jobId": job['jobId'], "jobStatus": job['state']}), 202
+    except Exception as e:
+        print(f"Error in rebuild_class_analytics: {e}")
+        return jsonify({"status": "error", "message": f"분석 집계 재계산 중 오류 발생: {e}"}), 500
+
+# 전체 재계산 작업 진행 상황/결과 조회
+@app.route('/api/admin/analytics/rebuild/job/<job_id>', methods=['GET'])
+@admin_required
+def get_stats_rebuild_job(job_id):
+    wait = min(request.args.get('wait', 0, type=float), GRADING_JOB_MAX_WAIT)
+    job = stats_rebuild_jobs.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({"status": "error", "message": "재계산 작업을 찾을 수 없습니다."}), 404
+
+    response = {"status": "success", "jobId": job_id, "jobStatus": job['state'], "progress": job['progress']}
+    if job['state'] == 'done':
+        response['message'] = f"{len(job['result']['results'])}개 수업의 분석 집계를 다시 계산했습니다."
+        response.update(job['result'])
+    elif job['state'] == 'error':
+        response['status'] = 'error'
+        response['message'] = f"분석 집계 재계산 중 오류 발생: {job['error']}"
+        return jsonify(response), 500
+    return jsonify(response)
+
+# --- 로그 내보내기 ---
+# 연구용으로 submission_logs/reflections 원본을 CSV 또는 JSONL로 스트리밍한다.
+# Firestore를 문서 ID 순으로 페이지 단위로 읽어 바로 내보내므로 수업 규모와 무관하게 메모리 사용량이 일정하다.
+# 각 행에는 cursor 값("수업ID:문서ID")이 포함되며, 다운로드가 끊기면 마지막으로 받은 행의 cursor로 이어받을 수 있다.
+EXPORT_PAGE_SIZE = 500
+EXPORT_KINDS = {
+    'submissions': ('submission_logs', ['logId', 'classId', 'studentEmail', 'week', 'cycle', 'isSuccess', 'error', 'submittedAt']),
+    'reflections': ('reflections', ['reflectionId', 'classId', 'studentEmail', 'week', 'ratings', 'feedback', 'submittedAt'])
+}
+
+def _export_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def iter_export_docs(collection_name, class_ids, cursor=None):
+    """수업 ID 순, 문서 ID 순으로 로그 문서를 페이지 단위로 읽는다. cursor 이후부터 시작한다."""
+    resume_class, resume_doc = cursor.split(':', 1) if cursor else (None, None)
+    for class_id in class_ids:
+        if resume_class is not None and class_id < resume_class:
+            continue
+        last_doc_id = resume_doc if class_id == resume_class else None
+        while True:
+            # '__name__'은 문서 ID 순 정렬을 뜻한다
+            query = db.collection(collection_name).where('classId', '==', class_id) \
+                .order_by('__name__').limit(EXPORT_PAGE_SIZE)
+            if last_doc_id:
+                query = query.start_after({'__name__': last_doc_id})
+            page = list(query.stream())
+            for doc in page:
+                yield class_id, doc
+            if len(page) < EXPORT_PAGE_SIZE:
+                break
+            last_doc_id = page[-1].id
+
+def generate_export(kind, export_format, class_ids, cursor=None):
+    collection_name, columns = EXPORT_KINDS[kind]
+    if export_format == 'csv' and not cursor:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(['cursor'] + columns)
+        yield ('\ufeff' + buffer.getvalue()).encode('utf-8') # 엑셀에서 한글이 깨지지 않도록 BOM 포함
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows_in_buffer = 0
+    for class_id, doc in iter_export_docs(collection_name, class_ids, cursor):
+        row = doc.to_dict()
+        row_cursor = f"{class_id}:{doc.id}"
+        if export_format == 'csv':
+            writer.writerow([row_cursor] + [
+                json.dumps(row.get(column), ensure_ascii=False) if isinstance(row.get(column), (dict, list)) else _export_value(row.get(column))
+                for column in columns
+            ])
+        else:
+            record = {column: _export_value(row.get(column)) for column in columns}
+            record['cursor'] = row_cursor
+            buffer.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        rows_in_buffer += 1
+        if rows_in_buffer >= EXPORT_PAGE_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            rows_in_buffer = 0
+    if rows_in_buffer:
+        yield buffer.getvalue().encode('utf-8')
+
+# 로그 내보내기 (classId를 여러 개 주거나 department로 학과 전체 수업을 지정)
+# instructorEmail은 필수이며, 그 교수자의 수업만 내보낸다. 다른 교수자의 classId가 섞여 있으면 403.
+@app.route('/api/export/logs', methods=['GET'])
+def export_logs():
+    kind = request.args.get('kind', 'submissions')
+    export_format = request.args.get('format', 'csv')
+    cursor = request.args.get('cursor')
+    if kind not in EXPORT_KINDS:
+        return jsonify({"status": "error", "message": "kind는 'submissions' 또는 'reflections'이어야 합니다."}), 400
+    if export_format not in ('csv', 'jsonl'):
+        return jsonify({"status": "error", "message": "format은 'csv' 또는 'jsonl'이어야 합니다."}), 400
+    if cursor and ':' not in cursor:
+        return jsonify({"status": "error", "message": "유효하지 않은 cursor 값입니다."}), 400
+    try:
+        instructor_email = request.args.get('instructorEmail')
+        if not instructor_email:
+            return jsonify({"status": "error", "message": "교수자 정보(instructorEmail)가 필요합니다."}), 400
+        class_ids = sorted({cid for value in request.args.getlist('classId') for cid in value.split(',') if cid})
+        if class_ids:
+            class_refs = [db.collection('classes').document(cid) for cid in class_ids]
+            for class_doc in db.get_all(class_refs, field_paths=['instructorEmail']):
+                denied = check_class_owner(class_doc, instructor_email, '내보낼')
+                if denied:
+                    return denied
+        department = request.args.get('department')
+        if department:
+            classes_query = db.collection('classes').where('details.department', '==', department) \
+                .where('instructorEmail', '==', instructor_email)
+            class_ids += [doc.id for doc in classes_query.stream()]
+        if not class_ids:
+            return jsonify({"status": "error", "message": "classId 또는 department 정보가 필요합니다."}), 400
+        class_ids = sorted(set(class_ids))
+    except Exception as e:
+        print(f"Error in export_logs: {e}")
+        return jsonify({"status": "error", "message": f"내보내기 준비 중 오류 발생: {e}"}), 500
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    filename = f"{kind}.{export_format}"
+    return Response(generate_export(kind, export_format, class_ids, cursor), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'
+    })
+
 # 나의 성장 기록 데이터 가져오기
 @app.route('/api/analytics/my-growth', methods=['GET'])
 def get_my_growth_data():
@@ -822,7 +3337,7 @@ def get_my_growth_data():
     try:
         reflections_ref = db.collection('reflections').where('studentEmail', '==', student_email).order_by('week').stream()
         growth_data = []
-        scenario_docs = {doc.id: doc.to_dict() for doc in db.collection('scenarios').stream()}
+        scenario_docs = {f"week_{w}": week_data for w, week_data in scenario_cache.all_weeks().items()}
 
         for doc in reflections_ref:
             reflection = doc.to_dict()
@@ -855,14 +3370,112 @@ def mark_coding_intro_seen():
         if not email or not intro_key:
             return jsonify({"status": "error", "message": "필수 정보(email, introKey)가 누락되었습니다."}), 400
 
-        user_ref = db.collection('users').document(email)
-        user_ref.update({'seenCodingIntros': firestore.ArrayUnion([intro_key])})
+        if get_user_data(email) is None:
+            return jsonify({"status": "error", "message": "사용자 정보를 찾을 수 없습니다."}), 404
+        write_buffer.update(db.collection('users').document(email), {'seenCodingIntros': firestore.ArrayUnion([intro_key])})
 
         return jsonify({"status": "success", "message": "확인되었습니다."})
     except Exception as e:
         print(f"Error in mark_coding_intro_seen: {e}")
         return jsonify({"status": "error", "message": f"오류 발생: {e}"}), 500
 
+# --- 워밍업 (콜드 스타트 대응) ---
+# 스케일 아웃 직후 첫 요청이 치르던 비용(클라이언트/gRPC 채널 생성, 시나리오 전체 로드, 채점 인터프리터 기동)을
+# 기동 직후 백그라운드에서 미리 치른다. 워밍업 중에 들어온 요청은 같은 초기화를 중복하지 않고 끝나기를 기다린다.
+# gunicorn --preload로 띄우면 마스터에서 시작한 스레드가 워커로 넘어가지 않으므로, 그때는 /api/warmup 호출로 시작된다.
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', '1') == '1'
+WARMUP_MAX_WAIT = 30 # /api/warmup 요청이 워밍업 완료를 기다리는 최대 시간 (초)
+GRADER_WARMUP_TIMEOUT = 5 # 채점 워커 풀이 채워지기를 기다리는 최대 시간 (초)
+
+def _warm_storage():
+    # 클라이언트 생성 + 첫 RPC (자격 증명 토큰 발급, gRPC 채널 연결)
+    db.collection('scenario_meta').document('version').get()
+
+def _warm_grader():
+    get_grader_runtime_version()
+    grader_pool.warm(GRADER_WARMUP_TIMEOUT)
+
+class Warmup:
+    """
+    워밍업 단계들을 한 번만 실행하고 단계별 소요 시간을 기록한다.
+    실패하면 다음 start() 호출 때 다시 시도한다.
+    """
+    STEPS = (('storage', _warm_storage), ('scenarios', scenario_cache.all_weeks), ('grader', _warm_grader))
+
+    def __init__(self):
+        self.state = 'idle' # idle | running | ready | failed
+        self.steps = OrderedDict() # 단계 이름 -> ms
+        self.error = None
+        self.total_ms = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """백그라운드에서 워밍업을 시작한다 (이미 진행 중이거나 끝났으면 무시)."""
+        with self._lock:
+            if self.state in ('running', 'ready'):
+                return
+            self.state = 'running'
+            self.error = None
+            self._done.clear()
+        threading.Thread(target=self._run, name='warmup', daemon=True).start()
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            for name, step in self.STEPS:
+                step_started = time.perf_counter()
+                step()
+                self.steps[name] = round((time.perf_counter() - step_started) * 1000, 1)
+            self.state = 'ready'
+        except Exception as e:
+            print(f"Warmup failed: {e}")
+            self.error = str(e)
+            self.state = 'failed'
+        finally:
+            self.total_ms = round((time.perf_counter() - started) * 1000, 1)
+            self._done.set()
+        print(f"Warmup {self.state} in {self.total_ms}ms ({', '.join(f'{k} {v}ms' for k, v in self.steps.items())})")
+
+    def wait(self, timeout):
+        """워밍업이 끝날 때까지 최대 timeout초 기다린다. Returns: 준비 완료 여부"""
+        self._done.wait(timeout)
+        return self.state == 'ready'
+
+    def snapshot(self):
+        return {'state': self.state, 'steps': dict(self.steps), 'totalMs': self.total_ms, 'error': self.error}
+
+warmup = Warmup()
+
+def startup_report():
+    return {
+        'moduleLoadMs': module_load_ms, 'importBudgetMs': STARTUP_IMPORT_BUDGET_MS, 'phases': dict(startup_phases),
+        'storageClientInitMs': db.init_ms if isinstance(db, LazyClient) else None,
+        'warmup': warmup.snapshot(), 'serverMode': 'gevent' if COOPERATIVE_MODE else 'threads', 'storage': STORAGE_BACKEND
+    }
+
+# 워밍업 실행 및 준비 상태 확인 (Cloud Run 시작 프로브용). 준비가 끝나면 200, 아직이거나 실패하면 503
+@app.route('/api/warmup', methods=['GET'])
+def warmup_endpoint():
+    try:
+        wait = min(request.args.get('wait', WARMUP_MAX_WAIT, type=float), WARMUP_MAX_WAIT)
+        warmup.start()
+        if not warmup.wait(wait):
+            message = "서버 워밍업에 실패했습니다." if warmup.state == 'failed' else "서버 워밍업이 아직 끝나지 않았습니다."
+            return jsonify({"status": "error", "message": message, "ready": False, "startup": startup_report()}), 503
+        return jsonify({"status": "success", "ready": True, "startup": startup_report()})
+    except Exception as e:
+        print(f"Error in warmup_endpoint: {e}")
+        return jsonify({"status": "error", "message": f"서버 오류 발생: {e}"}), 500
+
+mark_startup_phase('app')
+module_load_ms = round((time.perf_counter() - _MODULE_LOAD_STARTED) * 1000, 1)
+print(f"Startup: module loaded in {module_load_ms}ms ({', '.join(f'{k} {v}ms' for k, v in startup_phases.items())})")
+if module_load_ms > STARTUP_IMPORT_BUDGET_MS:
+    print(f"Warning: module load took {module_load_ms}ms, over STARTUP_IMPORT_BUDGET_MS ({STARTUP_IMPORT_BUDGET_MS:.0f}ms)")
+if WARMUP_ON_START:
+    warmup.start()
+
 # --- 앱 실행 ---
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,38 @@
+import os
+import argparse
+import firebase_admin
+from firebase_admin import credentials
+
+SERVICE_ACCOUNT_KEY_FILE = "serviceAccountKey.json"
+
+def rebuild(class_ids):
+    # 1. Firestore 연결 (main.py는 이미 초기화된 앱이 있으면 그대로 사용함)
+    try:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(SERVICE_ACCOUNT_KEY_FILE)
+            firebase_admin.initialize_app(cred)
+        os.environ.setdefault('WARMUP_ON_START', '0') # 일회성 스크립트이므로 채점 워커/시나리오 워밍업은 하지 않음
+        import main
+        print("✅ Firestore 데이터베이스에 성공적으로 연결되었습니다.")
+    except Exception as e:
+        print(f"❌ Firestore 연결 실패: {e}")
+        return
+
+    # 2. 대상 수업 목록 (지정하지 않으면 전체 수업)
+    if not class_ids:
+        class_ids = [doc.id for doc in main.db.collection('classes').stream()]
+    print(f"\n{len(class_ids)}개 수업의 분석 집계를 다시 계산합니다...")
+
+    # 3. 수업별로 원본 로그에서 집계 재계산
+    for class_id in class_ids:
+        try:
+            result = main.rebuild_class_stats(class_id)
+            print(f"  -> '{class_id}' 완료 (제출 {result['submissions']}건, 회고 {result['reflections']}건, {result['weeks']}개 주차)")
+        except Exception as e:
+            print(f"  ❌ '{class_id}' 재계산 실패: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="submission_logs/reflections 원본에서 수업별 분석 집계(class_stats)를 다시 계산합니다.")
+    parser.add_argument('class_ids', nargs='*', help="재계산할 수업 ID (생략하면 전체 수업)")
+    args = parser.parse_args()
+    rebuild(args.class_ids)
@@ -162,6 +162,29 @@ function showLectureModal(event) {
   }
 }
 
+// 채점 작업 조회 시 서버가 완료를 기다려 주는 최대 시간 (초, 서버의 GRADING_JOB_MAX_WAIT와 같게)
+const GRADING_JOB_MAX_WAIT = 10;
+
+/**
+ * (내부 헬퍼) 비동기 채점 작업이 끝날 때까지 결과를 조회합니다.
+ * 서버가 완료될 때까지 응답을 붙잡고 있으므로(롱폴링), 대기 시간이 끝나도 미완료일 때만 다시 요청합니다.
+ * @param {string} jobId - /api/code/submit 이 돌려준 작업 ID
+ * @returns {Promise<object>} 완료된 작업의 응답 (result 포함)
+ */
+async function pollGradingJob(jobId) {
+  const startedAt = Date.now();
+  while (Date.now() - startedAt < 60000) {
+    const response = await fetch(
+      `/api/code/job/${jobId}?wait=${GRADING_JOB_MAX_WAIT}`
+    );
+    const result = await response.json();
+    if (!response.ok)
+      throw new Error(result.message || `서버 응답 오류 (${response.status})`);
+    if (result.jobStatus === "done") return result;
+  }
+  throw new Error("채점 결과를 기다리는 시간이 초과되었습니다.");
+}
+
 /**
  * (내부 헬퍼) '코드 제출' 버튼 클릭 시 호출됩니다.
  * 백엔드 API를 호출하여 코드 검증을 요청하고 결과를 처리합니다.
@@ -202,11 +225,13 @@ async function submitCode(event) {
         week: state.currentWeek,
         cycleIndex: state.currentCycleIndex,
         studentCode: studentCode,
+        mode: "async", // 채점 작업을 큐에 넣고 결과는 폴링으로 받음
       }),
     });
-    const result = await response.json();
+    let result = await response.json();
     if (!response.ok)
       throw new Error(result.message || `서버 응답 오류 (${response.status})`);
+    if (result.jobId) result = await pollGradingJob(result.jobId);
 
     apiCallSuccessful = true; // API 호출 자체는 성공
 
@@ -12,7 +12,7 @@ import {
   updateDoc,
   setDoc, // Needed for logSubmissionToFirestore if used
   deleteField, // Needed for clearPauseState
-  serverTimestamp, // Needed for sendLiveCode and logSubmissionToFirestore
+  serverTimestamp, // Needed for logSubmissionToFirestore
   arrayUnion, // Needed for markCodingIntroAsSeen alternative (API used instead)
 } from "https://www.gstatic.com/firebasejs/9.6.10/firebase-firestore.js";
 
@@ -44,25 +44,96 @@ function debounce(func, delay) {
   };
 }
 
+// 서버와 마지막으로 맞춘 코드와 버전 (version이 null이면 다음 전송 때 전체 코드를 보냄)
+const liveCodeSync = {
+  email: null,
+  version: null,
+  base: "",
+  pending: Promise.resolve(),
+};
+
 /**
- * 사용자의 실시간 코드 입력을 Firestore에 업데이트합니다. (Debounced)
+ * 기준 코드에서 새 코드로 바뀐 구간 하나를 계산합니다. 위치는 서버와 같은 코드 포인트 기준입니다.
+ * @returns {{from: number, to: number, text: string}}
+ */
+function diffLiveCode(base, code) {
+  const oldChars = Array.from(base);
+  const newChars = Array.from(code);
+  let start = 0;
+  while (
+    start < oldChars.length &&
+    start < newChars.length &&
+    oldChars[start] === newChars[start]
+  ) {
+    start++;
+  }
+  let oldEnd = oldChars.length;
+  let newEnd = newChars.length;
+  while (
+    oldEnd > start &&
+    newEnd > start &&
+    oldChars[oldEnd - 1] === newChars[newEnd - 1]
+  ) {
+    oldEnd--;
+    newEnd--;
+  }
+  return { from: start, to: oldEnd, text: newChars.slice(start, newEnd).join("") };
+}
+
+async function postLiveCode(body) {
+  const response = await fetch("/api/livecode/update", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+  });
+  return { status: response.status, result: await response.json() };
+}
+
+async function syncLiveCode(email, code) {
+  if (liveCodeSync.email !== email) {
+    liveCodeSync.email = email;
+    liveCodeSync.version = null;
+  }
+  if (liveCodeSync.version !== null && code === liveCodeSync.base) return;
+
+  let reply;
+  if (liveCodeSync.version !== null) {
+    reply = await postLiveCode({
+      email,
+      baseVersion: liveCodeSync.version,
+      patch: diffLiveCode(liveCodeSync.base, code),
+    });
+  }
+  // 처음 보내거나 서버 버전과 어긋났으면 전체 코드로 다시 맞춤
+  if (!reply || reply.status === 409) {
+    reply = await postLiveCode({ email, liveCode: code });
+  }
+
+  if (reply.result.status === "success") {
+    liveCodeSync.version = reply.result.version;
+    liveCodeSync.base = code;
+  } else {
+    liveCodeSync.version = null;
+    console.error("Live code update failed:", reply.result.message);
+  }
+}
+
+/**
+ * 사용자의 실시간 코드 입력을 서버에 변경분(패치)으로 보냅니다. (Debounced)
+ * 이전 전송이 끝난 뒤에 다음 전송을 시작하므로 패치 순서가 뒤바뀌지 않습니다.
  * @param {string} code - 사용자가 에디터에 입력한 코드
  */
-export const sendLiveCode = debounce(async (code) => {
-  if (!state.currentUser || state.currentUser.role !== "student" || !db) {
-    // console.warn("Cannot send live code: User not logged in, not student, or DB not ready.");
+export const sendLiveCode = debounce((code) => {
+  if (!state.currentUser || state.currentUser.role !== "student") {
     return;
   }
-  try {
-    const userRef = doc(db, "users", state.currentUser.email);
-    await updateDoc(userRef, {
-      liveCode: code,
-      lastActive: serverTimestamp(), // Firestore 서버 시간 사용
+  const email = state.currentUser.email;
+  liveCodeSync.pending = liveCodeSync.pending
+    .then(() => syncLiveCode(email, code))
+    .catch((err) => {
+      liveCodeSync.version = null;
+      console.error("Live code update failed:", err);
     });
-    // console.log("Live code updated."); // Optional: Log success
-  } catch (err) {
-    console.error("Live code update failed:", err);
-  }
 }, 1000); // 1초 debounce
 
 /**
@@ -220,6 +291,56 @@ export function unsubscribeFromAnswers() {
   }
 }
 
+// 접속 상태(presence) 하트비트: 마지막 전송 이후 화면에서 입력이 있었을 때만 서버에 알립니다.
+const PRESENCE_HEARTBEAT_MS = 20000;
+let presenceTimer = null;
+let presenceInteracted = true;
+
+function markPresenceInteraction() {
+  presenceInteracted = true;
+}
+
+/**
+ * 학생의 접속 상태 하트비트를 시작합니다.
+ */
+export function startPresenceHeartbeat() {
+  if (presenceTimer) return;
+  ["keydown", "pointerdown", "scroll"].forEach((type) =>
+    document.addEventListener(type, markPresenceInteraction, { passive: true })
+  );
+  const beat = () => {
+    if (!state.currentUser || state.currentUser.role !== "student") {
+      stopPresenceHeartbeat();
+      return;
+    }
+    if (!presenceInteracted || document.hidden) return;
+    presenceInteracted = false;
+    fetch("/api/presence/heartbeat", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        email: state.currentUser.email,
+        classId: state.currentUser.classId,
+      }),
+    }).catch((err) => console.error("Presence heartbeat failed:", err));
+  };
+  beat();
+  presenceTimer = setInterval(beat, PRESENCE_HEARTBEAT_MS);
+}
+
+/**
+ * 접속 상태 하트비트를 멈춥니다.
+ */
+export function stopPresenceHeartbeat() {
+  if (presenceTimer) {
+    clearInterval(presenceTimer);
+    presenceTimer = null;
+  }
+  ["keydown", "pointerdown", "scroll"].forEach((type) =>
+    document.removeEventListener(type, markPresenceInteraction)
+  );
+}
+
 /**
  * Firestore에 학습 진행 상황을 저장합니다.
  * @param {number} week - 현재 주차
@@ -12,6 +12,8 @@ import {
   setupAnswerListener,
   unsubscribeFromAnswers,
   clearPauseState,
+  startPresenceHeartbeat,
+  stopPresenceHeartbeat,
 } from "./firebase.js";
 import { initializePyodide, setupDashboardFromTemplate } from "./codeEditor.js";
 // --- 👇👇👇 ui.js에서 새 함수들 import ---
@@ -199,7 +201,7 @@ document.addEventListener("DOMContentLoaded", () => {
             console.log("Fetching class name for", state.currentUser.classId);
             try {
               const classRes = await fetch(
-                `/api/class/${state.currentUser.classId}`
+                `/api/class/${state.currentUser.classId}?students=false`
               );
               if (!classRes.ok) throw new Error("Failed to fetch class name");
               const classResult = await classRes.json();
@@ -217,6 +219,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
           if (state.currentUser.role === "student") {
             setupAnswerListener(answerNotification);
+            startPresenceHeartbeat();
           }
 
           if (state.currentUser.showWeeklyIntro) {
@@ -269,7 +272,7 @@ document.addEventListener("DOMContentLoaded", () => {
             console.log("Fetching class name after login...");
             try {
               const classRes = await fetch(
-                `/api/class/${state.currentUser.classId}`
+                `/api/class/${state.currentUser.classId}?students=false`
               );
               if (!classRes.ok) throw new Error("Failed to fetch class name");
               const classResult = await classRes.json();
@@ -287,6 +290,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
           if (state.currentUser.role === "student") {
             setupAnswerListener(answerNotification);
+            startPresenceHeartbeat();
           }
 
           if (state.currentUser.showWeeklyIntro) {
@@ -313,6 +317,7 @@ document.addEventListener("DOMContentLoaded", () => {
     const logoutHandler = () => {
       console.log("Logout requested.");
       unsubscribeFromAnswers();
+      stopPresenceHeartbeat();
       logout();
     };
     document
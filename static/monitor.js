@@ -1,15 +1,6 @@
 // [수정] Firebase v9 모듈러 SDK에서 필요한 함수들을 직접 임포트합니다.
 import { initializeApp } from "firebase/app";
-import {
-  getFirestore,
-  doc,
-  onSnapshot,
-  collection,
-  query,
-  where,
-  orderBy,
-  updateDoc,
-} from "firebase/firestore";
+import { getFirestore, doc, updateDoc } from "firebase/firestore";
 import { firebaseConfig } from "./firebase-config.js";
 
 // DOMContentLoaded 이벤트 리스너로 전체 코드를 감쌉니다.
@@ -40,118 +31,127 @@ document.addEventListener("DOMContentLoaded", () => {
   const urlParams = new URLSearchParams(window.location.search);
   const classId = urlParams.get("classId");
 
-  let unsubscribers = {};
-  let questionUnsubscribe = null;
+  let liveFeed = null;
+  // 서버가 계산한 학생별 접속 상태 (active / idle / offline)
+  const presenceByEmail = {};
 
   if (!classId) {
     classTitle.textContent = "오류: 수업 ID가 없습니다.";
     return;
   }
 
-  // [수정] v9 방식으로 Firestore 리스너를 설정합니다.
-  async function setupStudentMonitoring() {
-    const classRef = doc(db, "classes", classId);
-
-    unsubscribers.classInfo = onSnapshot(
-      classRef,
-      async (docSnap) => {
-        if (!docSnap.exists()) {
-          classTitle.textContent = "오류: 해당 수업을 찾을 수 없습니다.";
-          studentListContainer.innerHTML = "";
-          if (unsubscribers.students) {
-            Object.values(unsubscribers.students).forEach((unsub) => unsub());
-          }
-          unsubscribers.students = {};
-          return;
-        }
+  function cardIdFor(email) {
+    return `student-card-${email.replace(/[@.]/g, "")}`;
+  }
 
-        const classData = docSnap.data();
-        classTitle.textContent = `${classData.className} - 실시간 현황`;
-        const studentEmails = classData.students || [];
-
-        const currentStudentEmails = Object.keys(unsubscribers.students || {});
-
-        const removedEmails = currentStudentEmails.filter(
-          (email) => !studentEmails.includes(email)
-        );
-        removedEmails.forEach((email) => {
-          if (unsubscribers.students[email]) {
-            unsubscribers.students[email]();
-            delete unsubscribers.students[email];
-          }
-          const card = document.getElementById(
-            `student-card-${email.replace(/[@.]/g, "")}`
-          );
-          if (card) card.remove();
-        });
+  // 학생별 Firestore 리스너 대신 서버의 수업 단위 실시간 피드 하나로 학생 현황과 질문 목록을 함께 받습니다.
+  // 처음에 snapshot으로 전체 상태를 받고, 이후에는 바뀐 학생/질문만 전달됩니다.
+  // 서버가 gevent 모드일 때만 SSE를 쓰고, 스레드 모드에서는 짧은 롱폴링을 씁니다 (SSE 연결이 서버 스레드를 계속 차지하므로).
+  const POLL_WAIT_SEC = 2;
+  const POLL_INTERVAL_MS = 3000;
+  let pollTimer = null;
+
+  function applySnapshot(data) {
+    classTitle.textContent = `${data.className} - 실시간 현황`;
+    Object.assign(presenceByEmail, data.presence);
+    studentListContainer.innerHTML = "";
+    if (data.students.length === 0) {
+      studentListContainer.innerHTML =
+        '<p class="text-gray-500 col-span-full">아직 이 수업에 참여한 학생이 없습니다.</p>';
+    }
+    data.students.forEach(renderOrUpdateStudentCard);
+    renderQuestions(data.questions);
+  }
 
-        if (studentEmails.length === 0) {
-          studentListContainer.innerHTML =
-            '<p class="text-gray-500 col-span-full">아직 이 수업에 참여한 학생이 없습니다.</p>';
-          return;
-        }
+  function applyEvent(event) {
+    if (event.type === "student") {
+      renderOrUpdateStudentCard(event.student);
+    } else if (event.type === "studentRemoved") {
+      const card = document.getElementById(cardIdFor(event.email));
+      if (card) card.remove();
+    } else if (event.type === "questions") {
+      renderQuestions(event.questions);
+    }
+  }
 
-        studentEmails.forEach((email) => {
-          if (unsubscribers.students && unsubscribers.students[email]) return;
-
-          if (!unsubscribers.students) unsubscribers.students = {};
-
-          const studentRef = doc(db, "users", email);
-          unsubscribers.students[email] = onSnapshot(
-            studentRef,
-            (studentDoc) => {
-              if (studentDoc.exists()) {
-                renderOrUpdateStudentCard(studentDoc.data());
-              }
-            },
-            (error) => {
-              console.error(`학생(${email}) 정보 수신 실패:`, error);
-            }
-          );
-        });
-      },
-      (error) => {
-        console.error("수업 정보 실시간 수신 실패:", error);
-        classTitle.textContent = "오류: 수업 정보를 가져오지 못했습니다.";
-      }
-    );
+  function applyPresence(changed) {
+    Object.assign(presenceByEmail, changed);
+    Object.entries(changed).forEach(([email, presence]) => {
+      const statusEl = document.getElementById(
+        `status-${email.replace(/[@.]/g, "")}`
+      );
+      if (statusEl) statusEl.dataset.presence = presence;
+    });
   }
 
-  // [수정] v9 방식으로 Firestore 리스너를 설정합니다.
-  function setupQAMonitoring() {
-    const q = query(
-      collection(db, "questions"),
-      where("classId", "==", classId),
-      where("isResolved", "==", false),
-      orderBy("createdAt", "asc")
+  function setupLiveFeed() {
+    if (document.body.dataset.liveTransport === "sse") {
+      setupEventStream();
+    } else {
+      pollLiveFeed(null);
+    }
+  }
+
+  function setupEventStream() {
+    liveFeed = new EventSource(
+      `/api/monitor/class/${encodeURIComponent(classId)}/stream`
     );
 
-    questionUnsubscribe = onSnapshot(
-      q,
-      (snapshot) => {
-        const questions = [];
-        snapshot.forEach((doc) => {
-          questions.push({ id: doc.id, ...doc.data() });
-        });
-        renderQuestions(questions);
-      },
-      (error) => {
-        console.error("실시간 질문 데이터 수신 실패:", error);
-        qaDashboard.innerHTML = `<p class="text-red-400">질문 목록을 가져오는 데 실패했습니다: ${error.message}</p>`;
+    liveFeed.addEventListener("snapshot", (e) => applySnapshot(JSON.parse(e.data)));
+    ["student", "studentRemoved", "questions"].forEach((type) => {
+      liveFeed.addEventListener(type, (e) => applyEvent(JSON.parse(e.data)));
+    });
+    liveFeed.addEventListener("presence", (e) => {
+      applyPresence(JSON.parse(e.data).presence);
+    });
+
+    // 연결이 끊기면 EventSource가 자동으로 재연결하고, 재연결 시 snapshot을 다시 받습니다.
+    liveFeed.onerror = () => {
+      if (liveFeed.readyState === EventSource.CLOSED) {
+        classTitle.textContent = "오류: 수업 정보를 가져오지 못했습니다.";
+      } else {
+        console.error("실시간 현황 연결이 끊겼습니다. 재연결을 시도합니다.");
       }
-    );
+    };
+  }
+
+  // since가 null이면 서버가 snapshot을 보내고, 이후에는 받은 seq 이후의 변경분만 요청합니다.
+  async function pollLiveFeed(since) {
+    let nextSince = since;
+    try {
+      const params = new URLSearchParams({ wait: POLL_WAIT_SEC });
+      if (since !== null) params.set("since", since);
+      const response = await fetch(
+        `/api/monitor/class/${encodeURIComponent(classId)}/events?${params}`
+      );
+      const data = await response.json();
+      if (response.status === 404) {
+        classTitle.textContent = "오류: 수업 정보를 가져오지 못했습니다.";
+        return;
+      }
+      if (!response.ok) throw new Error(data.message);
+      if (data.snapshot) {
+        applySnapshot(data.snapshot);
+        nextSince = data.snapshot.seq;
+      } else {
+        data.events.forEach(applyEvent);
+        applyPresence(data.presence);
+        nextSince = data.seq;
+      }
+    } catch (e) {
+      console.error("실시간 현황을 가져오지 못했습니다. 잠시 후 다시 시도합니다.", e);
+    }
+    pollTimer = setTimeout(() => pollLiveFeed(nextSince), POLL_INTERVAL_MS);
   }
 
   function renderOrUpdateStudentCard(student) {
     // ... (이 함수 내부는 변경 없음) ...
-    const cardId = `student-card-${student.email.replace(/[@.]/g, "")}`;
+    const cardId = cardIdFor(student.email);
     let card = document.getElementById(cardId);
 
     const progress = student.progress || { week: 1, cycle: 0 };
-    const lastActiveTimestamp = student.lastActive
-      ? student.lastActive.toDate().toISOString()
-      : "";
-    const pauseState = student.pauseState ? "paused" : "";
+    const presence = presenceByEmail[student.email] || "offline";
+    const pauseState = student.paused ? "paused" : "";
     const statusId = `status-${student.email.replace(/[@.]/g, "")}`;
 
     const cardHTML = `
@@ -163,7 +163,7 @@ document.addEventListener("DOMContentLoaded", () => {
                       progress.week
                     }주차 ${progress.cycle + 1}사이클</p>
                     <p class="mt-1"><span class="font-bold">학습 상태:</span> 
-                        <span id="${statusId}" data-last-active="${lastActiveTimestamp}" data-pause-state="${pauseState}">정보 없음</span>
+                        <span id="${statusId}" data-presence="${presence}" data-pause-state="${pauseState}">정보 없음</span>
                     </p>
                 </div>
             </div>
@@ -213,8 +213,8 @@ document.addEventListener("DOMContentLoaded", () => {
       .join("");
   }
 
+  // 접속 상태는 서버의 presence 이벤트로 갱신되고, 여기서는 화면 표시만 맞춥니다.
   function startStatusUpdater() {
-    // ... (이 함수 내부는 변경 없음) ...
     setInterval(() => {
       const statusElements = document.querySelectorAll('[id^="status-"]');
       statusElements.forEach((el) => {
@@ -225,22 +225,12 @@ document.addEventListener("DOMContentLoaded", () => {
           return;
         }
 
-        const lastActiveString = el.dataset.lastActive;
-        if (!lastActiveString) {
-          el.textContent = "정보 없음";
-          el.className = "text-gray-400";
-          return;
-        }
-        const lastActiveDate = new Date(lastActiveString);
-        const now = new Date();
-        const diffMinutes =
-          (now.getTime() - lastActiveDate.getTime()) / (1000 * 60);
         let statusText = "";
         let statusColor = "";
-        if (diffMinutes < 1) {
+        if (el.dataset.presence === "active") {
           statusText = "🟢 학습 중";
           statusColor = "text-green-400 font-semibold";
-        } else if (diffMinutes < 5) {
+        } else if (el.dataset.presence === "idle") {
           statusText = "🟡 활동 중";
           statusColor = "text-yellow-400";
         } else {
@@ -290,51 +280,69 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   });
 
-  let liveCodeUnsubscribe = null;
+  // 학생 코드는 live_code 문서를 직접 읽지 않고, 수업 담당 교수자인지 확인하는 서버 API로 가져옵니다.
+  // 모달이 열려 있는 동안 LIVE_CODE_POLL_MS마다 다시 가져옵니다.
+  const LIVE_CODE_POLL_MS = 2000;
+  const currentUser = JSON.parse(sessionStorage.getItem("currentUser") || "null");
+  let liveCodeEmail = null;
+  let liveCodeTimer = null;
+
+  function stopLiveCode() {
+    liveCodeEmail = null;
+    if (liveCodeTimer) {
+      clearTimeout(liveCodeTimer);
+      liveCodeTimer = null;
+    }
+  }
+
+  async function refreshLiveCode(email) {
+    try {
+      const params = new URLSearchParams({
+        email,
+        instructorEmail: currentUser?.email || "",
+      });
+      const response = await fetch(
+        `/api/monitor/class/${encodeURIComponent(classId)}/live-code?${params}`
+      );
+      const data = await response.json();
+      if (liveCodeEmail !== email) return; // 그 사이 모달을 닫았거나 다른 학생을 열었음
+      if (!response.ok) {
+        // 권한이 없거나 수업 학생이 아니면 다시 시도하지 않습니다.
+        liveCodeDisplay.textContent = `// ${data.message || "코드를 불러오지 못했습니다."}`;
+        return;
+      }
+      liveCodeDisplay.textContent = data.code || "// 아직 작성된 코드가 없습니다.";
+    } catch (e) {
+      console.error("학생 코드를 가져오지 못했습니다. 잠시 후 다시 시도합니다.", e);
+      if (liveCodeEmail !== email) return;
+    }
+    liveCodeTimer = setTimeout(() => refreshLiveCode(email), LIVE_CODE_POLL_MS);
+  }
 
-  // [수정] v9 방식으로 Firestore 리스너 설정
   function openCodeModal(email, name) {
     modalTitle.textContent = `${name}(${email})님의 실시간 코드`;
     liveCodeDisplay.textContent = "코드를 불러오는 중입니다...";
     codeModal.classList.remove("hidden");
     lucide.createIcons();
 
-    if (liveCodeUnsubscribe) liveCodeUnsubscribe();
-
-    const userRef = doc(db, "users", email);
-    liveCodeUnsubscribe = onSnapshot(userRef, (docSnap) => {
-      if (docSnap.exists()) {
-        liveCodeDisplay.textContent =
-          docSnap.data().liveCode || "// 아직 작성된 코드가 없습니다.";
-      } else {
-        liveCodeDisplay.textContent = "// 학생 정보를 찾을 수 없습니다.";
-      }
-    });
+    stopLiveCode();
+    liveCodeEmail = email;
+    refreshLiveCode(email);
   }
 
   closeModalBtn.addEventListener("click", () => {
     codeModal.classList.add("hidden");
-    if (liveCodeUnsubscribe) {
-      liveCodeUnsubscribe();
-      liveCodeUnsubscribe = null;
-    }
+    stopLiveCode();
   });
 
   // 페이지 벗어날 때 모든 리스너 정리
   window.addEventListener("beforeunload", () => {
-    Object.values(unsubscribers).forEach((unsub) => {
-      if (typeof unsub === "function") {
-        unsub();
-      } else if (typeof unsub === "object") {
-        Object.values(unsub).forEach((u) => u());
-      }
-    });
-    if (questionUnsubscribe) questionUnsubscribe();
-    if (liveCodeUnsubscribe) liveCodeUnsubscribe();
+    if (liveFeed) liveFeed.close();
+    if (pollTimer) clearTimeout(pollTimer);
+    stopLiveCode();
   });
 
   // 초기 실행
-  setupStudentMonitoring();
-  setupQAMonitoring();
+  setupLiveFeed();
   startStatusUpdater();
 });
@@ -1,12 +1,89 @@
 import json
+import hashlib
+import argparse
 import firebase_admin
 from firebase_admin import credentials, firestore
 
 SERVICE_ACCOUNT_KEY_FILE = "serviceAccountKey.json"
 SCENARIO_JSON_FILE = "scenario.json"
 COLLECTION_NAME = "scenarios"
+META_COLLECTION_NAME = "scenario_meta" # 서버의 시나리오 캐시가 감시하는 버전 문서 위치
+MANIFEST_DOC_ID = "manifest" # 마지막 업로드 시점의 주차/사이클별 해시 목록
+BATCH_LIMIT = 500 # Firestore 배치 1회당 최대 쓰기 수
 
-def upload_scenarios():
+def content_hash(data):
+    """키 순서와 무관하게 같은 내용이면 같은 값이 나오는 SHA-256 해시"""
+    canonical = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def build_local_manifest(scenarios_data_list):
+    """
+    scenario.json 목록을 검증하고 문서 ID별 데이터와 해시 목록을 만든다.
+    Returns:
+        tuple: ({doc_id: week_data}, {doc_id: {'hash': str, 'cycles': [str, ...]}})
+    """
+    documents = {}
+    manifest = {}
+    for index, week_data in enumerate(scenarios_data_list):
+        # 주차 데이터가 딕셔너리인지 확인
+        if not isinstance(week_data, dict):
+            print(f"⚠️ {index + 1}번째 주차 항목이 딕셔너리(객체)가 아니어서 건너뜁니다: {week_data}")
+            continue
+
+        # 'week' 번호 확인
+        week_number = week_data.get('week')
+        if week_number is None:
+            print(f"⚠️ {index + 1}번째 주차 항목에 'week' 번호가 없어서 건너뜁니다.")
+            continue
+
+        # Firestore 문서 ID 생성 (숫자형으로 변환 시도)
+        try:
+            doc_id = f"week_{int(week_number)}"
+        except ValueError:
+            print(f"⚠️ {index + 1}번째 주차 항목 'week' 번호({week_number})가 숫자가 아니어서 건너뜁니다.")
+            continue
+
+        documents[doc_id] = week_data
+        manifest[doc_id] = {
+            'hash': content_hash(week_data),
+            'cycles': [content_hash(cycle) for cycle in week_data.get('cycles', [])]
+        }
+    return documents, manifest
+
+def diff_manifests(local_manifest, remote_manifest):
+    """
+    로컬/원격 해시 목록을 비교한다.
+    Returns:
+        dict: {'added': [...], 'changed': {doc_id: [바뀐 사이클 인덱스]}, 'unchanged': [...], 'removed': [...]}
+    """
+    report = {'added': [], 'changed': {}, 'unchanged': [], 'removed': []}
+    for doc_id, entry in local_manifest.items():
+        remote_entry = remote_manifest.get(doc_id)
+        if remote_entry is None:
+            report['added'].append(doc_id)
+        elif remote_entry.get('hash') != entry['hash']:
+            remote_cycles = remote_entry.get('cycles', [])
+            report['changed'][doc_id] = [
+                i for i, cycle_hash in enumerate(entry['cycles'])
+                if i >= len(remote_cycles) or remote_cycles[i] != cycle_hash
+            ] + list(range(len(entry['cycles']), len(remote_cycles))) # 삭제된 사이클
+        else:
+            report['unchanged'].append(doc_id)
+    report['removed'] = [doc_id for doc_id in remote_manifest if doc_id not in local_manifest]
+    return report
+
+def print_diff_report(report):
+    print("\n📋 변경 내역")
+    for doc_id in report['added']:
+        print(f"  + {doc_id} (신규)")
+    for doc_id, cycle_indexes in report['changed'].items():
+        cycles_text = ', '.join(str(i + 1) for i in cycle_indexes) if cycle_indexes else '주차 정보'
+        print(f"  ~ {doc_id} (변경된 사이클: {cycles_text})")
+    for doc_id in report['removed']:
+        print(f"  - {doc_id} (scenario.json에 없음)")
+    print(f"  = 변경 없음: {len(report['unchanged'])}개 주차")
+
+def upload_scenarios(dry_run=False, force=False, prune=False):
     # 1. Firestore 연결
     try:
         if not firebase_admin._apps:
@@ -31,7 +108,6 @@ def upload_scenarios():
         print(f"❌ 파일 읽기 실패: {e}")
         return
 
-    print("\nFirestore에 시나리오 업로드를 시작합니다...")
     try:
         # ★★★ 수정: 최상위 데이터가 리스트인지 확인 ★★★
         if not isinstance(scenarios_data_list, list):
@@ -41,33 +117,51 @@ def upload_scenarios():
              print("⚠️ 'scenario.json' 파일이 비어 있습니다. 업로드할 데이터가 없습니다.")
              return
 
-        # ★★★ 수정: scenarios_data_list (리스트 자체)를 직접 순회 ★★★
-        success_count = 0
-        for index, week_data in enumerate(scenarios_data_list):
-            # 5-1. 주차 데이터가 딕셔너리인지 확인
-            if not isinstance(week_data, dict):
-                print(f"⚠️ {index + 1}번째 주차 항목이 딕셔너리(객체)가 아니어서 건너뜁니다: {week_data}")
-                continue
-
-            # 5-2. 'week' 번호 확인
-            week_number = week_data.get('week')
-            if week_number is None:
-                print(f"⚠️ {index + 1}번째 주차 항목에 'week' 번호가 없어서 건너뜁니다.")
-                continue
-
-            # 5-3. Firestore 문서 ID 생성 (숫자형으로 변환 시도)
-            try:
-                doc_id = f"week_{int(week_number)}"
-            except ValueError:
-                print(f"⚠️ {index + 1}번째 주차 항목 'week' 번호({week_number})가 숫자가 아니어서 건너뜁니다.")
-                continue
-
-            # 5-4. Firestore에 문서 업로드 (set 메서드는 덮어쓰기)
-            db.collection(COLLECTION_NAME).document(doc_id).set(week_data)
-            print(f"  -> '{doc_id}' 업로드 완료.")
-            success_count += 1
-
-        print(f"\n🎉 총 {success_count}개의 유효한 주차 시나리오를 Firestore에 성공적으로 업로드/업데이트했습니다!")
+        # 3. 주차/사이클별 해시 계산 후 마지막 업로드 기록과 비교
+        documents, local_manifest = build_local_manifest(scenarios_data_list)
+        meta_ref = db.collection(META_COLLECTION_NAME)
+        manifest_doc = meta_ref.document(MANIFEST_DOC_ID).get()
+        remote_manifest = manifest_doc.to_dict().get('weeks', {}) if manifest_doc.exists else {}
+        report = diff_manifests(local_manifest, remote_manifest)
+        print_diff_report(report)
+
+        to_upload = list(local_manifest) if force else report['added'] + list(report['changed'])
+        to_delete = report['removed'] if prune else []
+        if dry_run:
+            print(f"\n🔍 dry-run: {len(to_upload)}개 주차 업로드, {len(to_delete)}개 주차 삭제 예정 (실제 쓰기 없음)")
+            return
+        if not to_upload and not to_delete:
+            print("\n✅ 변경된 시나리오가 없습니다. 업로드를 건너뜁니다.")
+            return
+
+        # 4. 바뀐 문서만 배치 단위로 업로드 (set 메서드는 덮어쓰기)
+        print("\nFirestore에 시나리오 업로드를 시작합니다...")
+        writes = [('set', doc_id) for doc_id in to_upload] + [('delete', doc_id) for doc_id in to_delete]
+        for offset in range(0, len(writes), BATCH_LIMIT):
+            batch = db.batch()
+            for op, doc_id in writes[offset:offset + BATCH_LIMIT]:
+                doc_ref = db.collection(COLLECTION_NAME).document(doc_id)
+                if op == 'set':
+                    batch.set(doc_ref, documents[doc_id])
+                else:
+                    batch.delete(doc_ref)
+            batch.commit()
+        for op, doc_id in writes:
+            print(f"  -> '{doc_id}' {'업로드' if op == 'set' else '삭제'} 완료.")
+
+        # 5. 해시 목록과 버전 표시 문서 갱신 (서버들이 버전이 바뀐 것을 보고 시나리오 캐시를 다시 읽음)
+        uploaded_manifest = dict(remote_manifest)
+        uploaded_manifest.update(local_manifest)
+        for doc_id in to_delete:
+            uploaded_manifest.pop(doc_id, None)
+        version = content_hash({doc_id: entry['hash'] for doc_id, entry in uploaded_manifest.items()})
+        batch = db.batch()
+        batch.set(meta_ref.document(MANIFEST_DOC_ID), {'weeks': uploaded_manifest, 'updatedAt': firestore.SERVER_TIMESTAMP})
+        batch.set(meta_ref.document('version'), {'version': version, 'updatedAt': firestore.SERVER_TIMESTAMP})
+        batch.commit()
+        print(f"  -> 시나리오 버전 갱신: {version[:12]}")
+
+        print(f"\n🎉 총 {len(to_upload)}개의 주차 시나리오를 Firestore에 업로드/업데이트했습니다! (전체 {len(local_manifest)}개 주차 중)")
 
     except AttributeError as e:
          print(f"❌ 업로드 중 예상치 못한 AttributeError 발생: {e}")
@@ -77,4 +171,9 @@ def upload_scenarios():
         print(f"❌ 업로드 중 오류 발생: {e}")
 
 if __name__ == "__main__":
-    upload_scenarios()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="scenario.json에서 바뀐 주차만 Firestore에 업로드합니다.")
+    parser.add_argument('--dry-run', action='store_true', help="업로드하지 않고 변경 내역만 출력")
+    parser.add_argument('--force', action='store_true', help="해시 비교 없이 모든 주차를 다시 업로드")
+    parser.add_argument('--prune', action='store_true', help="scenario.json에 없는 주차 문서를 삭제")
+    args = parser.parse_args()
+    upload_scenarios(dry_run=args.dry_run, force=args.force, prune=args.prune)